@@ -0,0 +1,329 @@
+import random
+from collections import OrderedDict
+from bitboard_matcher import BitboardMatcher
+from engine import MOVE_LEFT, MOVE_RIGHT, ROTATE, SWAP_PIECE, HARD_DROP
+from occupancy_grid import FADING
+
+# ------------------------------------------------------AI PLAYER-------------------------------------------------------
+# A computer player, which plays through the same actions as a human player (see also: GameEngine.step()).
+#
+# SEARCH BOARD = The settled blocks, as one tuple of colors per column (from the bottom up). Pieces break apart when
+#                they land, so there are never any gaps in a column and those tuples are all there is to know about
+#                the board. Cloning a board copies the list of tuples (the tuples themselves are shared) along with
+#                the bitboards of a matcher, which are plain ints (see also: bitboard_matcher.py).
+# PLACEMENT = A number of clockwise turns of the piece, and the column it is dropped in
+# ZOBRIST HASH = The XOR of a random 64 bit key for every (column, row, color) on the board. Adding or removing a
+#                block XORs its key in or out, so the hash follows the board without going over every tile again.
+#                The keys of the blocks of a piece are XORed in to tell (board, piece) positions apart, and so is a
+#                key for the number of muligans left (they add to the points of every match, see also: resolve()).
+# TRANSPOSITION TABLE = Zobrist hash of a (board, piece) position -> values of the placements of that piece, the
+#                       least recently used positions are dropped once the table is full
+#
+# For every piece, the player drops every placement of the current piece on a clone of the board and lets the
+# cascades play out. The best few placements (the beam) are searched one piece deeper, with the next piece. When even
+# the best placement of the next piece is poor, the player swaps it (if there are swaps left).
+# ----------------------------------------------------------------------------------------------------------------------
+
+SPAWN_COLUMN = 6  # (new pieces appear at column 6 of the top row, see also: GameEngine.spawn_new_piece())
+
+
+class ScriptedPlayer:
+    """Plays a piece through a list of actions (see also: plan()), one per reaction time."""
+    def __init__(self, reaction_time=150):
+        self.reaction_time = reaction_time  # milliseconds per action
+        self.planned_piece = None
+        self.actions = []
+        self.time_left = 0
+
+    def plan(self, engine):
+        """The actions which take the controlled piece where it should go."""
+        return [HARD_DROP]
+
+    def act(self, engine, elapsed_time=None):
+        """Apply the actions there is time for in elapsed_time milliseconds (a board update by default)."""
+        if engine.piece is None or not len(engine.controlled_blocks):
+            self.planned_piece = None
+            self.actions = []
+            return
+        if self.planned_piece is not engine.colorized_template:
+            self.planned_piece = engine.colorized_template
+            self.actions = self.plan(engine)
+            self.time_left = 0
+
+        self.time_left += engine.update_speed if elapsed_time is None else elapsed_time
+        while self.actions and self.time_left >= self.reaction_time:
+            self.time_left -= self.reaction_time
+            action = self.actions.pop(0)
+            before = (engine.piece, engine.piece_position[0])
+            engine.step(action)
+            if action in (MOVE_LEFT, MOVE_RIGHT, ROTATE) and (engine.piece, engine.piece_position[0]) == before:
+                self.actions = [HARD_DROP]  # (something is in the way, drop the piece where it is)
+            self.planned_piece = engine.colorized_template
+
+    def get_moves(self, engine, column):
+        """The moves which take the piece from where it is to a column."""
+        left = engine.piece_position[0]
+        return [MOVE_LEFT] * (left - column) if column < left else [MOVE_RIGHT] * (column - left)
+
+
+class ZobristKeys:
+    """The random keys of every (column, row, color) on the board, of every (column, row, color) of a piece, and of
+    every number of muligans."""
+    def __init__(self, width, height, number_of_colors, piece_size, seed=0):
+        rng = random.Random(seed)
+        self.rng = rng  # (the muligan keys are made when they are first needed)
+        self.muligans = []
+        self.tiles = [[[rng.getrandbits(64) for color in range(number_of_colors)] for row in range(height)]
+                      for column in range(width)]
+        self.pieces = [[[rng.getrandbits(64) for color in range(number_of_colors)] for row in range(piece_size)]
+                       for column in range(piece_size)]
+
+    def get_piece_key(self, rotation, template):
+        key = 0
+        keys = self.pieces
+        for column, row in rotation.cells:
+            key ^= keys[column][row][template[row][column]]
+        return key
+
+    def get_muligan_key(self, muligans):
+        while len(self.muligans) <= muligans:
+            self.muligans.append(self.rng.getrandbits(64))
+        return self.muligans[muligans]
+
+
+class TranspositionTable:
+    """Remembers the values of up to max_size positions, forgetting the least recently used ones first."""
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self.values = OrderedDict()  # Zobrist hash -> value
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.values.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.values.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.values[key] = value
+        self.values.move_to_end(key)
+        while len(self.values) > self.max_size:
+            self.values.popitem(last=False)
+
+
+class SearchBoard:
+    """The settled blocks of a board, cheap to clone (see the top of this file)."""
+    __slots__ = ('width', 'height', 'keys', 'matcher', 'columns', 'hash')
+
+    def __init__(self, width, height, keys, matcher, columns=None, hash=0):
+        self.width = width
+        self.height = height
+        self.keys = keys
+        self.matcher = matcher
+        self.columns = columns if columns is not None else [()] * width  # colors per column, from the bottom up
+        self.hash = hash  # (see also: ZobristKeys)
+
+    def clone(self):
+        return SearchBoard(self.width, self.height, self.keys, self.matcher.copy(), list(self.columns), self.hash)
+
+    def get_color(self, column, row):
+        """The color at a coordinate, None for empty tiles (and tiles off the board)."""
+        if not 0 <= column < self.width:
+            return None
+        stack = self.columns[column]
+        index = self.height - 1 - row
+        return stack[index] if 0 <= index < len(stack) else None
+
+    def count_matching_neighbours(self, column, row):
+        """The number of blocks around a tile which match its color (a wildcard matches every color)."""
+        matcher = self.matcher
+        bit = matcher.get_bit(column, row)
+        around = bit | (bit << 1) | (bit >> 1)
+        around = (around | (around << matcher.stride) | (around >> matcher.stride)) & ~bit
+        color = self.get_color(column, row)
+        if color == matcher.wildcard_color:
+            matching = matcher.occupied_board
+        else:
+            matching = matcher.color_boards.get(color, 0) | matcher.wildcard_board
+        return bin(matching & around).count('1')
+
+    def add_block(self, column, color):
+        """Drop a block into a column, returning the row it lands on (None when the column is full)."""
+        stack = self.columns[column]
+        row = self.height - 1 - len(stack)
+        if row < 0:
+            return None
+        self.columns[column] = stack + (color,)
+        self.matcher.add_tile(color, column, row)
+        self.hash ^= self.keys.tiles[column][row][color]
+        return row
+
+    def drop(self, rotation, template, left):
+        """Drop a piece (a rotation and its colorized template) with its left side at a column.
+
+        Returns the cells where the blocks landed, or None when they don't fit."""
+        landed = []
+        for column, row in reversed(rotation.cells):  # (from the bottom up)
+            landing_row = self.add_block(left + column, template[row][column])
+            if landing_row is None:
+                return None
+            landed.append((left + column, landing_row))
+        return landed
+
+    def remove_tiles(self, coordinates):
+        """Clear tiles and let the blocks above them fall down, returning the cells where those blocks landed."""
+        cleared_indexes = {}  # column -> indexes into its stack
+        for column, row in coordinates:
+            cleared_indexes.setdefault(column, set()).add(self.height - 1 - row)
+
+        landed = []
+        tile_keys = self.keys.tiles
+        for column, indexes in cleared_indexes.items():
+            stack = self.columns[column]
+            lowest = min(indexes)
+            for index in range(lowest, len(stack)):
+                self.matcher.remove_tile(stack[index], column, self.height - 1 - index)
+                self.hash ^= tile_keys[column][self.height - 1 - index][stack[index]]
+
+            remaining = tuple(color for index, color in enumerate(stack[lowest:], lowest) if index not in indexes)
+            self.columns[column] = stack[:lowest] + remaining
+            for index, color in enumerate(remaining, lowest):
+                self.matcher.add_tile(color, column, self.height - 1 - index)
+                self.hash ^= tile_keys[column][self.height - 1 - index][color]
+                landed.append((column, self.height - 1 - index))
+        return landed
+
+    def resolve(self, landed, points_per_block=5, muligans=0):
+        """Clear the matches crossing the landed cells and everything they set off, returning the points scored
+        (see also: GameEngine.increase_score())."""
+        points = 0
+        while landed:
+            matches = self.matcher.find_matches(landed)
+            if not matches:
+                break
+            points += (len(matches) * points_per_block) + (muligans * 5)
+            landed = self.remove_tiles(matches)
+        return points
+
+
+def create_search_board(engine, keys):
+    """The board of an engine as it will be once everything that is falling or fading has settled."""
+    board = SearchBoard(engine.board_width, engine.board_height, keys,
+                        BitboardMatcher(engine.board_width, engine.board_height, engine.wildcard_color))
+    landed = []
+    for column, stack in enumerate(engine.column_stacks.stacks):
+        fading_below = False
+        for block in stack:
+            if block is None:
+                continue  # (the empty slot below a block which was left hanging on a shared tile)
+            if block.state == FADING:
+                fading_below = True
+            elif board.add_block(column, block.color) is not None and fading_below:
+                landed.append((column, engine.board_height - len(board.columns[column])))
+    for block in sorted(engine.falling_blocks, key=lambda x: x.row, reverse=True):
+        if board.add_block(block.column, block.color) is not None:
+            landed.append((block.column, engine.board_height - len(board.columns[block.column])))
+    board.resolve(landed)
+    return board
+
+
+class SearchPlayer(ScriptedPlayer):
+    """Searches the placements of the current and next piece (see the top of this file)."""
+    def __init__(self, reaction_time=150, beam_width=3, table_size=4096):
+        super().__init__(reaction_time)
+        self.beam_width = beam_width  # the number of placements which are searched one piece deeper
+        self.table = TranspositionTable(table_size)
+        self.keys = None
+        self.keys_shape = None  # (board width, board height, number of colors, piece size) the keys were made for
+
+        # the value of a placement: points, plus the blocks of the same color next to the landed blocks,
+        # minus the heights they land at, minus a lot for filling up the columns pieces spawn in
+        self.neighbour_weight = 1.0
+        self.height_weight = 0.3
+        self.danger_weight = 100
+        self.swap_threshold = 1.0  # swap the next piece when its best placement is worth less than this
+
+    def get_keys(self, engine):
+        number_of_colors = max(list(engine.colors) + [engine.wildcard_color, engine.empty_color]) + 1
+        shape = (engine.board_width, engine.board_height, number_of_colors, engine.template_set.max_size)
+        if self.keys_shape != shape:
+            self.keys = ZobristKeys(*shape)
+            self.keys_shape = shape
+            self.table = TranspositionTable(self.table.max_size)
+        return self.keys
+
+    def get_placements(self, engine, piece, template):
+        """Every (turns, rotation, colorized template, column) a piece can be dropped at."""
+        placements = []
+        rotation = piece
+        for turns in range(4):
+            for column in range(-rotation.left, engine.board_width - rotation.right):
+                placements.append((turns, rotation, template, column))
+            template = rotation.rotate(template)
+            rotation = rotation.next
+            if rotation is piece:
+                break  # (the piece looks the same after fewer than four turns)
+        return placements
+
+    def evaluate(self, engine, board, rotation, template, column):
+        """Drop a piece on a clone of the board, returning (value, resulting board) or (None, None)."""
+        child = board.clone()
+        landed = child.drop(rotation, template, column)
+        if landed is None:
+            return None, None
+
+        value = 0
+        for landed_column, landed_row in landed:
+            value += self.neighbour_weight * child.count_matching_neighbours(landed_column, landed_row)
+            value -= self.height_weight * (child.height - landed_row)
+
+        value += child.resolve(landed, engine.points_per_block, engine.muligans)
+
+        # the spawn area has to stay free, or the game is over
+        safe_height = child.height - (2 * engine.template_set.max_size)
+        for spawn_column in range(SPAWN_COLUMN, min(SPAWN_COLUMN + engine.template_set.max_size, child.width)):
+            value -= self.danger_weight * max(0, len(child.columns[spawn_column]) - safe_height)
+        return value, child
+
+    def get_placement_values(self, engine, board, piece, template):
+        """The (value, turns, column) of every placement of a piece on a board, best first.
+
+        The values are kept in the transposition table: the placements of the next piece are worked out while
+        searching, and the board it spawns on is usually the one we predicted, so most of them come in handy again
+        when it's that piece's turn."""
+        key = board.hash ^ self.keys.get_piece_key(piece, template) ^ self.keys.get_muligan_key(engine.muligans)
+        values = self.table.get(key)
+        if values is None:
+            values = []
+            for turns, rotation, rotated_template, column in self.get_placements(engine, piece, template):
+                value = self.evaluate(engine, board, rotation, rotated_template, column)[0]
+                if value is not None:
+                    values.append((value, turns, column))
+            values.sort(key=lambda placement: placement[0], reverse=True)  # (stable, so fewer turns win a tie)
+            self.table.put(key, values)
+        return values
+
+    def plan(self, engine):
+        self.get_keys(engine)
+        board = create_search_board(engine, self.keys)
+        candidates = self.get_placement_values(engine, board, engine.piece, engine.colorized_template)
+        if not candidates:
+            return [HARD_DROP]
+
+        placements = {(turns, column): (rotation, template) for turns, rotation, template, column in
+                      self.get_placements(engine, engine.piece, engine.colorized_template)}
+        best = None  # (total value, turns, column, value of the next piece)
+        for value, turns, column in candidates[:self.beam_width]:
+            child = self.evaluate(engine, board, *placements[(turns, column)], column)[1]
+            next_values = self.get_placement_values(engine, child, engine.next_piece, engine.next_colorized_template)
+            next_value = next_values[0][0] if next_values else -self.danger_weight * board.height
+            if best is None or value + next_value > best[0]:
+                best = (value + next_value, turns, column, next_value)
+
+        total, turns, column, next_value = best
+        actions = [SWAP_PIECE] if engine.muligans > 0 and next_value < self.swap_threshold else []
+        return actions + [ROTATE] * turns + self.get_moves(engine, column) + [HARD_DROP]
@@ -0,0 +1,305 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from array import array
+from ai_player import ScriptedPlayer, SearchPlayer
+from engine import GameEngine, MOVE_LEFT, MOVE_RIGHT, ROTATE, HARD_DROP
+
+# -------------------------------------------------BALANCE SIMULATOR----------------------------------------------------
+# Plays thousands of seeded games with a scripted player on every core, so the difficulty can be tuned without
+# playing the game by hand.
+#
+# PARAMETER = One of the difficulty attributes of the engine (see also: GameEngine.__init__()), e.g. pieces_per_level
+# SETTING = One combination of parameter values. A sweep plays every setting with the same seeds, so the differences
+#           between two settings come from the parameters and not from the luck of the draw.
+# POLICY = The scripted player (see also: ai_player.py). It only gets a few actions per board update, as many as fit
+#          in the update speed given its reaction time, so a faster game is a harder game for it too.
+# CASCADE = A match made by blocks which fell down after an earlier match was cleared, the chain is the number of
+#           matches in a row that one piece set off
+# RESULTS = A directory holding one binary file per metric (a packed array, see also: METRICS) and a columns.json
+#           describing them. Rows are appended as games finish, so a long run can be inspected while it's going.
+#           Load the results with read_columns(), or with numpy.fromfile(path, dtype) per column.
+#
+# Usage:
+#   python3 balance_simulator.py --games 2000 --output results
+#   python3 balance_simulator.py --sweep pieces_per_level=15,20,25 --sweep wildcard_chance=0.02,0.05
+# ----------------------------------------------------------------------------------------------------------------------
+
+# parameter name -> type of its values (the defaults are those of the engine)
+PARAMETERS = {
+    'base_update_speed': int,
+    'min_update_speed': int,
+    'update_speed_step': int,
+    'levels_per_speed_step': int,
+    'pieces_per_level': int,
+    'levels_per_barricade': int,
+    'levels_per_barricade_row': int,
+    'levels_per_color': int,
+    'wildcard_chance': float
+}
+
+# metric name -> array typecode, the parameter values of every game are stored right after these
+METRICS = {
+    'setting': 'l',
+    'seed': 'q',
+    'ticks': 'q',  # the length of the game in board updates
+    'play_time': 'd',  # the length of the game in seconds, at the update speed of every board update
+    'pieces': 'q',
+    'score': 'q',
+    'max_level': 'q',
+    'matches': 'q',
+    'cascades': 'q',
+    'longest_chain': 'q',
+    'game_over': 'b'  # (0 when the game was cut off at the maximum number of ticks)
+}
+
+PARAMETER_TYPECODES = {int: 'q', float: 'd'}
+
+# the simulated games find their matches on bitboards, which is faster than scanning and plays by the same rules
+# (see also: tests/test_engine_equivalence.py)
+MATCH_ENGINE = 'bitboard'
+
+
+class GreedyPolicy(ScriptedPlayer):
+    """Drops every piece where its blocks end up next to the most blocks of the same color (see also: plan())."""
+    def __init__(self, reaction_time=150, height_weight=0.3):
+        super().__init__(reaction_time)
+        self.height_weight = height_weight  # how much a block landing one row higher counts against a placement
+
+    def plan(self, engine):
+        """The actions which take the piece to its best placement: rotations, moves and a hard drop."""
+        best_value = None
+        best_actions = [HARD_DROP]
+        piece = engine.piece
+        template = engine.colorized_template
+        for turns in range(4):
+            for column in range(-piece.left, engine.board_width - piece.right):
+                value = self.evaluate(engine, piece, template, column)
+                if best_value is None or value > best_value:
+                    best_value = value
+                    best_actions = [ROTATE] * turns + self.get_moves(engine, column) + [HARD_DROP]
+            template = piece.rotate(template)
+            piece = piece.next
+            if piece is engine.piece:
+                break  # (the piece looks the same after fewer than four turns)
+        return best_actions
+
+    def evaluate(self, engine, piece, template, left):
+        """How good it is to drop a rotation at a column: blocks of the same color next to the landed blocks,
+        minus the height at which they land."""
+        stacks = engine.column_stacks
+        landed = {}  # (column, row) -> color of the blocks of the piece, where they land
+        for column, row in sorted(piece.cells, key=lambda cell: cell[1], reverse=True):
+            landing_row = stacks.get_landing_row(left + column) - \
+                sum(1 for landed_column, landed_row in landed if landed_column == left + column)
+            landed[(left + column, landing_row)] = template[row][column]
+
+        value = 0
+        wildcard = engine.wildcard_color
+        for (column, row), color in landed.items():
+            value -= self.height_weight * (engine.board_height - row)
+            for column_step, row_step in ((-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)):
+                neighbour = (column + column_step, row + row_step)
+                other = landed.get(neighbour)
+                if other is None and 0 <= neighbour[0] < engine.board_width:
+                    index = engine.board_height - 1 - neighbour[1]
+                    stack = stacks.stacks[neighbour[0]]
+                    block = stack[index] if 0 <= index < len(stack) else None
+                    other = block.color if block is not None else None
+                if other is not None and (other == color or wildcard in (other, color)):
+                    value += 1
+        return value
+
+
+class RandomPolicy:
+    """Presses random buttons, a baseline to compare the other policies with."""
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+
+    def act(self, engine):
+        action = self.random.choice((None, None, None, MOVE_LEFT, MOVE_RIGHT, ROTATE))
+        if action is not None:
+            engine.step(action)
+
+
+POLICIES = {
+    'greedy': lambda seed, options: GreedyPolicy(options.reaction_time),
+    'search': lambda seed, options: SearchPlayer(options.reaction_time),
+    'random': lambda seed, options: RandomPolicy(seed)
+}
+
+
+def play_game(task):
+    """Play one game to the end (or to the maximum number of ticks), returning its metrics as a row."""
+    setting_index, setting, seed, options = task
+    engine = GameEngine(seed=seed)
+    for name, value in setting.items():
+        setattr(engine, name, value)
+    engine.update_speed = engine.base_update_speed
+    engine.match_engine = MATCH_ENGINE
+    policy = POLICIES[options.policy](seed, options)
+    engine.start()
+
+    play_time = 0
+    matches = 0
+    cascades = 0
+    chain = 0
+    longest_chain = 0
+    cleared_since_landing = False  # did blocks start falling because of a match (as opposed to a piece)?
+    while not engine.game_over and engine.tick_count < options.max_ticks:
+        policy.act(engine)
+        was_clearing = len(engine.fading_tiles) > 0
+        play_time += engine.update_speed
+        engine.tick()
+
+        if was_clearing:
+            cleared_since_landing = len(engine.falling_blocks) > 0
+        elif len(engine.fading_tiles):
+            matches += 1
+            if cleared_since_landing:
+                cascades += 1
+                chain += 1
+            else:
+                chain = 1
+            longest_chain = max(longest_chain, chain)
+            cleared_since_landing = False
+        elif not len(engine.falling_blocks):
+            cleared_since_landing = False  # (everything that fell has landed without making a match)
+
+    row = [setting_index, seed, engine.tick_count, play_time / 1000, engine.number_of_spawned_pieces, engine.score,
+           engine.level, matches, cascades, longest_chain, int(engine.game_over)]
+    return row + [getattr(engine, name) for name in PARAMETERS]
+
+
+class ColumnWriter:
+    """Appends rows to a results directory (see the top of this file), a column at a time."""
+    def __init__(self, path, settings, flush_every=256):
+        self.path = path
+        self.columns = list(METRICS.items()) + [(name, PARAMETER_TYPECODES[kind]) for name, kind in PARAMETERS.items()]
+        self.settings = settings
+        self.flush_every = flush_every
+        self.buffers = [array(typecode) for name, typecode in self.columns]
+        self.number_of_rows = 0
+
+        os.makedirs(path, exist_ok=True)
+        for name, typecode in self.columns:
+            open(self.get_column_path(name), 'wb').close()
+        self.write_description()
+
+    def get_column_path(self, name):
+        return os.path.join(self.path, name + '.bin')
+
+    def write_description(self):
+        with open(os.path.join(self.path, 'columns.json'), 'w') as file:
+            json.dump({
+                'rows': self.number_of_rows,
+                'byte_order': sys.byteorder,
+                'columns': [{'name': name, 'typecode': typecode, 'itemsize': array(typecode).itemsize}
+                            for name, typecode in self.columns],
+                'settings': self.settings
+            }, file, indent=2)
+
+    def append(self, row):
+        for buffer, value in zip(self.buffers, row):
+            buffer.append(value)
+        if len(self.buffers[0]) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        for (name, typecode), buffer in zip(self.columns, self.buffers):
+            with open(self.get_column_path(name), 'ab') as file:
+                buffer.tofile(file)
+        self.number_of_rows += len(self.buffers[0])
+        self.buffers = [array(typecode) for name, typecode in self.columns]
+        self.write_description()
+
+
+def read_columns(path):
+    """Load a results directory, returning a dict of column name -> array."""
+    with open(os.path.join(path, 'columns.json'), 'r') as file:
+        description = json.load(file)
+
+    columns = {}
+    for column in description['columns']:
+        values = array(column['typecode'])
+        with open(os.path.join(path, column['name'] + '.bin'), 'rb') as file:
+            values.frombytes(file.read(description['rows'] * column['itemsize']))
+        if description['byte_order'] != sys.byteorder:
+            values.byteswap()
+        columns[column['name']] = values
+    return columns
+
+
+def parse_sweep(text):
+    """Parse a NAME=VALUE,VALUE,... sweep argument into (name, [values])."""
+    name, separator, values = text.partition('=')
+    if name not in PARAMETERS or not separator or not values:
+        raise argparse.ArgumentTypeError('expected NAME=VALUE,VALUE,... where NAME is one of: %s' %
+                                         ', '.join(PARAMETERS))
+    try:
+        return name, [PARAMETERS[name](value) for value in values.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid value for %s: %s' % (name, values))
+
+
+def get_settings(sweeps):
+    """Every combination of the swept parameter values (a single setting of defaults without any sweeps)."""
+    names = [name for name, values in sweeps]
+    return [dict(zip(names, values)) for values in itertools.product(*[values for name, values in sweeps])]
+
+
+def summarize(columns, number_of_settings):
+    """Print the averages of every setting."""
+    print('%-8s %8s %10s %10s %8s %9s %9s' % ('setting', 'games', 'ticks', 'score', 'level', 'matches', 'cascades'))
+    for setting in range(number_of_settings):
+        rows = [index for index, value in enumerate(columns['setting']) if value == setting]
+        if not rows:
+            continue
+
+        def mean(name):
+            return sum(columns[name][index] for index in rows) / len(rows)
+        print('%-8d %8d %10.0f %10.0f %8.1f %9.1f %9.2f' % (setting, len(rows), mean('ticks'), mean('score'),
+                                                          mean('max_level'), mean('matches'), mean('cascades')))
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Play seeded games of BlockBuster with a scripted player, '
+                                                 'to tune the difficulty.')
+    parser.add_argument('--games', type=int, default=1000, help='games per setting')
+    parser.add_argument('--sweep', type=parse_sweep, action='append', default=[], metavar='NAME=VALUE,VALUE',
+                        help='try every value of a difficulty parameter (can be repeated, every combination is played)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game')
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='greedy', help='scripted player')
+    parser.add_argument('--reaction-time', type=int, default=150, help='milliseconds per action of the player')
+    parser.add_argument('--max-ticks', type=int, default=20000, help='cut games off after this many board updates')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help='worker processes (all cores by default)')
+    parser.add_argument('--output', default='simulation', help='results directory')
+    options = parser.parse_args(arguments)
+
+    settings = get_settings(options.sweep)
+    tasks = ((setting_index, setting, options.seed + game, options)
+             for setting_index, setting in enumerate(settings) for game in range(options.games))
+    writer = ColumnWriter(options.output, settings)
+
+    number_of_games = len(settings) * options.games
+    start = time.perf_counter()
+    with multiprocessing.Pool(options.processes) as pool:
+        for index, row in enumerate(pool.imap_unordered(play_game, tasks, chunksize=8)):
+            writer.append(row)
+            if (index + 1) % 100 == 0 or index + 1 == number_of_games:
+                print('\r%d/%d games (%.1f games/s)' % (index + 1, number_of_games,
+                                                        (index + 1) / (time.perf_counter() - start)), end='')
+    writer.flush()
+    print()
+
+    summarize(read_columns(options.output), len(settings))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
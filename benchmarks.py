@@ -0,0 +1,236 @@
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+from engine import GameEngine
+
+# ----------------------------------------------------BENCHMARKS--------------------------------------------------------
+# Times the hot functions of the game engine on seeded board fixtures, without a display.
+#
+# FIXTURE = A board filled up to a certain height with (seeded) random fixated blocks, in a certain board size
+# BENCHMARK = A function of the engine, along with the preparation it needs before every call (e.g. spawning a piece)
+# SAMPLE = The time it took to run a benchmark once, the preparation is not included
+#
+# Usage:
+#   python3 benchmarks.py --output results.json               (run everything and write the results)
+#   python3 benchmarks.py --baseline results.json             (fail when something became slower than before)
+#   python3 benchmarks.py --filter update_board --size 32x40  (only run some of the benchmarks)
+# ----------------------------------------------------------------------------------------------------------------------
+
+# fixture name -> (fraction of the board which is filled, chance of a block being a wildcard)
+FIXTURES = {
+    'empty': (0.0, 0.0),
+    'half_full': (0.5, 0.0),
+    'nearly_full': (0.85, 0.0),
+    'wildcard_heavy': (0.5, 0.3)
+}
+
+BOARD_SIZES = [(16, 20), (32, 40), (64, 80)]
+
+
+def build_fixture(fill, wildcard_chance, board_width, board_height, seed=0):
+    """Create an engine whose board is filled with settled blocks, and return its snapshot."""
+    engine = GameEngine(board_width, board_height, seed=seed)
+    engine.generate_next_colorized_template()
+
+    for column in range(board_width):
+        # vary the stack heights a little, so there are lines of blocks in every direction
+        height = round(board_height * fill * engine.random.uniform(0.8, 1.0)) if fill else 0
+        colors = engine.pick_random_colors(height, False)
+        for index in range(height):
+            color = engine.wildcard_color if engine.random.random() < wildcard_chance else colors[index]
+            engine.add_block_descriptor(engine.fixated_blocks, color, column, board_height - 1 - index)
+            engine.column_stacks.push(engine.fixated_blocks[-1])
+    return engine.get_snapshot()
+
+
+def get_surface(engine):
+    """The coordinates of the topmost block of every column."""
+    return [(column, engine.column_stacks.get_landing_row(column) + 1) for column in range(engine.board_width)
+            if engine.column_stacks.get_height(column)]
+
+
+# Every benchmark is a pair of functions: the first one prepares the engine (not timed),
+# the second one is timed. The preparation returns the arguments of the timed call.
+def prepare_update_board(engine):
+    engine.spawn_new_piece()
+    return ()
+
+
+def prepare_move_blocks_down(engine):
+    engine.spawn_barricade(1)
+    return (engine.falling_blocks,)
+
+
+def prepare_mark_matches(engine):
+    return ([0, engine.board_height - 1], (1, 0))
+
+
+def prepare_collect_color_matches(engine):
+    engine.landed_cells = set(get_surface(engine))
+    return ()
+
+
+def prepare_collect_bitboard_matches(engine):
+    engine.match_engine = 'bitboard'
+    engine.get_bitboard_matcher()
+    return prepare_collect_color_matches(engine)
+
+
+def prepare_remove_marked_tiles(engine):
+    # clear the top block of every column (as if they all faded out at once)
+    for coordinate in get_surface(engine):
+        engine.migrate_block(engine.fixated_blocks, engine.fading_tiles, engine.fixated_blocks.find(coordinate))
+    engine.tiles_to_be_reset = list(engine.fading_tiles)
+    engine.fading_tiles.clear()
+    return ()
+
+
+def prepare_rotate_piece(engine):
+    engine.spawn_new_piece()
+    return ()
+
+
+def prepare_move_piece(engine):
+    engine.spawn_new_piece()
+    return ((1, 0),)
+
+
+def prepare_hard_drop(engine):
+    engine.spawn_new_piece()
+    return ()
+
+
+BENCHMARKS = {
+    'update_board': (prepare_update_board, GameEngine.update_board),
+    'move_blocks_down': (prepare_move_blocks_down, GameEngine.move_blocks_down),
+    'mark_matches': (prepare_mark_matches, GameEngine.mark_matches),
+    'collect_color_matches': (prepare_collect_color_matches, GameEngine.collect_color_matches),
+    'collect_color_matches[bitboard]': (prepare_collect_bitboard_matches, GameEngine.collect_color_matches),
+    'remove_marked_tiles': (prepare_remove_marked_tiles, GameEngine.remove_marked_tiles),
+    'rotate_piece': (prepare_rotate_piece, GameEngine.rotate_piece),
+    'move_piece': (prepare_move_piece, GameEngine.move_piece),
+    'get_ghost_cells': (prepare_hard_drop, GameEngine.get_ghost_cells),
+    'hard_drop': (prepare_hard_drop, GameEngine.hard_drop)
+}
+
+
+def get_percentile(sorted_samples, percentile):
+    """Nearest-rank percentile of a sorted list of samples."""
+    index = max(0, min(len(sorted_samples) - 1, round(percentile / 100 * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+
+def run_benchmark(name, snapshot, board_width, board_height, iterations, warmup=10):
+    """Run a benchmark on a fixture, returning its statistics (times are in microseconds)."""
+    prepare, function = BENCHMARKS[name]
+    engine = GameEngine(board_width, board_height)
+
+    samples = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()  # a collection in the middle of a sample would only add noise
+    try:
+        for iteration in range(warmup + iterations):
+            engine.restore_snapshot(snapshot)
+            engine.match_engine = 'scanner'
+            arguments = prepare(engine)
+
+            start = time.perf_counter_ns()
+            function(engine, *arguments)
+            elapsed = time.perf_counter_ns() - start
+
+            if iteration >= warmup:
+                samples.append(elapsed / 1000)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    samples.sort()
+    mean = sum(samples) / len(samples)
+    return {
+        'iterations': iterations,
+        'ops_per_second': 1000000 / mean if mean else 0,
+        'mean': mean,
+        'min': samples[0],
+        'p50': get_percentile(samples, 50),
+        'p90': get_percentile(samples, 90),
+        'p99': get_percentile(samples, 99),
+        'max': samples[-1]
+    }
+
+
+def run_suite(iterations, board_sizes, name_filter=None, seed=0):
+    results = {}
+    for board_width, board_height in board_sizes:
+        for fixture_name, (fill, wildcard_chance) in FIXTURES.items():
+            snapshot = build_fixture(fill, wildcard_chance, board_width, board_height, seed)
+            for name in BENCHMARKS:
+                if name_filter and name_filter not in name:
+                    continue
+                key = '%s/%s/%sx%s' % (name, fixture_name, board_width, board_height)
+                results[key] = run_benchmark(name, snapshot, board_width, board_height, iterations)
+                print('%-60s %12.0f ops/s  p50 %9.1fus  p99 %9.1fus' %
+                      (key, results[key]['ops_per_second'], results[key]['p50'], results[key]['p99']))
+    return results
+
+
+def compare_to_baseline(results, baseline, threshold):
+    """Return the benchmarks whose median time grew by more than the threshold (a fraction) since the baseline."""
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        before = baseline[key]['p50']
+        after = result['p50']
+        if before and (after - before) / before > threshold:
+            regressions.append((key, before, after))
+    return regressions
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Benchmark the game logic of BlockBuster.')
+    parser.add_argument('--iterations', type=int, default=200, help='timed calls per benchmark and fixture')
+    parser.add_argument('--seed', type=int, default=0, help='seed used to generate the fixtures')
+    parser.add_argument('--size', action='append', help='board size as WIDTHxHEIGHT (can be repeated)')
+    parser.add_argument('--filter', help='only run the benchmarks whose name contains this text')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare the results to a JSON file written by an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='fail when a median time grew by more than this fraction of the baseline')
+    options = parser.parse_args(arguments)
+
+    board_sizes = BOARD_SIZES
+    if options.size:
+        board_sizes = [tuple(int(value) for value in size.split('x')) for size in options.size]
+
+    results = run_suite(options.iterations, board_sizes, options.filter, options.seed)
+
+    if options.output:
+        with open(options.output, 'w') as file:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'iterations': options.iterations,
+                'seed': options.seed,
+                'results': results
+            }, file, indent=2, sort_keys=True)
+
+    if options.baseline:
+        with open(options.baseline, 'r') as file:
+            baseline = json.load(file)['results']
+
+        regressions = compare_to_baseline(results, baseline, options.threshold)
+        if regressions:
+            print('\nREGRESSION: %s benchmark(s) got more than %d%% slower than the baseline' %
+                  (len(regressions), options.threshold * 100))
+            for key, before, after in regressions:
+                print('  %-58s p50 %9.1fus -> %9.1fus (+%.0f%%)' % (key, before, after, (after - before) / before * 100))
+            return 1
+        print('\nNo regressions compared to %s' % options.baseline)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+# ------------------------------------------------------BITBOARDS-------------------------------------------------------
+# The fixated blocks are kept as one integer bitmask per color, plus one for the wildcard (white) color.
+# Bit (column * stride + row) is set when that tile holds a block of the color. Every column has one
+# spare 'guard' row which is always empty, so shifting a board doesn't wrap a run from one column into the next.
+#
+# When a barricade comes down on top of the settled blocks, two blocks can share a tile (see also: ColumnStacks).
+# The tile then has the color of the block which was added last, like it has for the scanner (see also:
+# OccupancyGrid.get()). The colors of the blocks under it are put aside, and the tile only turns empty once every
+# block on it has been removed.
+#
+# Shifting a board by one of the following amounts moves every bit one step along a line on the board:
+#   1           -> vertically (0, 1)
+#   stride      -> horizontally (1, 0)
+#   stride + 1  -> diagonally (1, 1)
+#   stride - 1  -> diagonally (1, -1)
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+class BitboardMatcher:
+    """Finds groupings of four or more colors using shift-and-AND operations on bitboards.
+
+    Produces the same matches as GameEngine.mark_matches: a streak is a line segment of one color
+    (plus wildcards) which is broken up by empty tiles and other colors. Wildcards between two different
+    colors end up in both streaks only when sweeping from either side, so instead of sweeping twice we
+    collect the forward and backward streaks of every color and keep the ones which are long enough."""
+    def __init__(self, width, height, wildcard_color, match_length=4):
+        self.width = width
+        self.height = height
+        self.wildcard_color = wildcard_color
+        self.match_length = match_length
+        self.stride = height + 1
+        self.longest_line = max(width, height)  # (the fills are done once they have covered this many tiles)
+
+        self.color_boards = {}  # color -> bitboard
+        self.wildcard_board = 0
+        self.occupied_board = 0  # every tile holding a block (wildcards included)
+        self.covered_colors = {}  # bit index -> colors of the blocks under the top block of a shared tile
+
+    def get_bit(self, column, row):
+        return 1 << (column * self.stride + row)
+
+    def get_coordinate(self, bit_index):
+        return divmod(bit_index, self.stride)
+
+    def copy(self):
+        """A matcher holding the same bitboards (they are ints, so the copy is cheap)."""
+        matcher = BitboardMatcher.__new__(BitboardMatcher)
+        matcher.__dict__.update(self.__dict__)
+        matcher.color_boards = dict(self.color_boards)
+        matcher.covered_colors = {bit_index: list(colors) for bit_index, colors in self.covered_colors.items()}
+        return matcher
+
+    def get_color(self, bit):
+        """The color of an occupied tile."""
+        if self.wildcard_board & bit:
+            return self.wildcard_color
+        for color, color_board in self.color_boards.items():
+            if color_board & bit:
+                return color
+        return None
+
+    def set_color(self, color, bit):
+        if color == self.wildcard_color:
+            self.wildcard_board |= bit
+        else:
+            self.color_boards[color] = self.color_boards.get(color, 0) | bit
+
+    def clear_color(self, color, bit):
+        if color == self.wildcard_color:
+            self.wildcard_board &= ~bit
+        elif color in self.color_boards:
+            self.color_boards[color] &= ~bit
+
+    def add_tile(self, color, column, row):
+        bit_index = column * self.stride + row
+        bit = 1 << bit_index
+        if self.occupied_board & bit:
+            # (a block on top of another one, see the top of this file)
+            covered_color = self.get_color(bit)
+            self.covered_colors.setdefault(bit_index, []).append(covered_color)
+            self.clear_color(covered_color, bit)
+        self.occupied_board |= bit
+        self.set_color(color, bit)
+
+    def remove_tile(self, color, column, row):
+        bit_index = column * self.stride + row
+        bit = 1 << bit_index
+        covered_colors = self.covered_colors.get(bit_index)
+        if covered_colors is None:
+            self.occupied_board &= ~bit
+            self.clear_color(color, bit)
+            return
+
+        # one of the blocks sharing the tile is removed, the ones under the top block go first
+        if color in covered_colors:
+            covered_colors.remove(color)
+        else:
+            self.clear_color(color, bit)
+            self.set_color(covered_colors.pop(), bit)
+        if not len(covered_colors):
+            del self.covered_colors[bit_index]
+
+    # the following two functions allow the matcher to observe a block list (see also: BlockList.observers)
+    def block_added(self, block):
+        self.add_tile(block.color, block.column, block.row)
+
+    def block_removed(self, block):
+        self.remove_tile(block.color, block.column, block.row)
+
+    def fill(self, generator, propagator, shift):
+        """Flood the generator bits along a direction through the propagator bits (Kogge-Stone style)."""
+        distance = 1
+        longest_line = self.longest_line
+        while distance < longest_line:
+            if shift > 0:
+                generator |= propagator & (generator << (shift * distance))
+                propagator &= propagator << (shift * distance)
+            else:
+                generator |= propagator & (generator >> (-shift * distance))
+                propagator &= propagator >> (-shift * distance)
+            distance *= 2
+        return generator
+
+    def long_runs(self, board, shift):
+        """Keep the runs of bits in a board which are at least match_length long."""
+        starts = board
+        for step in range(1, self.match_length):
+            starts &= board >> (shift * step)
+
+        result = starts
+        for step in range(1, self.match_length):
+            result |= starts << (shift * step)
+        return result
+
+    def find_direction_matches(self, shift, lines=-1):
+        """Find every matching streak on the board along one direction (the colors which have no tiles on the
+        lines can be skipped, by default every tile is on a line)."""
+        result = 0
+        occupied = self.occupied_board
+
+        # tiles whose predecessor/successor along the line is empty (or off the board)
+        after_empty = ~(occupied << shift)
+        before_empty = ~(occupied >> shift)
+
+        for color_board in self.color_boards.values():
+            if not color_board & lines:
+                continue
+
+            candidates = color_board | self.wildcard_board
+
+            # tiles which can be reached from a block of this color, moving forward and backward
+            reached_forward = self.fill(color_board, candidates, shift)
+            reached_backward = self.fill(color_board, candidates, -shift)
+
+            # wildcards at the edge of a run only belong to the streak if the run is bordered by an empty tile
+            leading_wildcards = self.fill(candidates & after_empty, candidates, shift) & reached_backward
+            trailing_wildcards = self.fill(candidates & before_empty, candidates, -shift) & reached_forward
+
+            result |= self.long_runs(reached_forward | leading_wildcards, shift)
+            result |= self.long_runs(reached_backward | trailing_wildcards, shift)
+        return result
+
+    def find_matches(self, landed_cells):
+        """Return the coordinates of every matching tile on the unbroken lines of blocks crossing the landed cells."""
+        landed_board = 0
+        for column, row in landed_cells:
+            landed_board |= self.get_bit(column, row)
+        landed_board &= self.occupied_board
+
+        matches = 0
+        if landed_board:
+            for shift in (self.stride, 1, self.stride - 1, self.stride + 1):
+                lines = self.fill(landed_board, self.occupied_board, shift) | \
+                        self.fill(landed_board, self.occupied_board, -shift)
+                if self.long_runs(lines, shift):  # (no streak without match_length blocks in a row)
+                    matches |= self.find_direction_matches(shift, lines) & lines
+
+        result = []
+        while matches:
+            lowest_bit = matches & -matches
+            result.append(self.get_coordinate(lowest_bit.bit_length() - 1))
+            matches ^= lowest_bit
+        return result
@@ -0,0 +1,108 @@
+from occupancy_grid import OccupancyGrid, FIXATED, FALLING, CONTROLLED, FADING
+
+
+class Block:
+    """A single block on the board (slotted, so we can afford a lot of them)."""
+    __slots__ = ('color', 'column', 'row', 'state', 'index')
+
+    def __init__(self, color, column, row):
+        self.color = color
+        self.column = column
+        self.row = row
+        self.state = None  # the state of the block list which currently holds this block
+        self.index = None  # position of the block within that list
+
+    def __repr__(self):
+        return 'Block(%s, %s, %s)' % (self.color, self.column, self.row)
+
+
+class BlockList:
+    """A list of blocks which share a state (e.g. all the falling blocks).
+
+    Every block remembers its own position in the list, so removing a block swaps the last block into its
+    slot instead of shifting the entire list. The occupancy grid is kept in sync with the list contents,
+    other indexes can register themselves as observers (they need block_added and block_removed functions)."""
+    def __init__(self, state, occupancy):
+        self.state = state
+        self.occupancy = occupancy
+        self.blocks = []
+        self.observers = []
+
+    def __iter__(self):
+        return iter(self.blocks)
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __getitem__(self, index):
+        return self.blocks[index]
+
+    def append(self, block):
+        block.state = self.state
+        block.index = len(self.blocks)
+        self.blocks.append(block)
+        self.occupancy.add(self.state, block)
+        for observer in self.observers:
+            observer.block_added(block)
+
+    def remove(self, block):
+        if block.state != self.state:
+            return
+
+        index = block.index
+        last_block = self.blocks.pop()
+        if last_block is not block:
+            self.blocks[index] = last_block
+            last_block.index = index
+
+        self.occupancy.remove(self.state, block)
+        for observer in self.observers:
+            observer.block_removed(block)
+        block.state = None
+        block.index = None
+
+    def move(self, block, column, row):
+        """Move one of our blocks to a new coordinate."""
+        for observer in self.observers:
+            observer.block_removed(block)
+        self.occupancy.move(self.state, block, column, row)
+        for observer in self.observers:
+            observer.block_added(block)
+
+    def find(self, coordinate):
+        """Return the block at a given coordinate (or None)."""
+        return self.occupancy.get(self.state, coordinate)
+
+    def find_all(self, coordinate):
+        """Return every block at a given coordinate, the one which was added first comes first."""
+        return self.occupancy.get_all(self.state, coordinate)
+
+    def contains(self, coordinate):
+        return self.occupancy.is_occupied(self.state, coordinate)
+
+    def clear(self):
+        for block in self.blocks:
+            self.occupancy.remove(self.state, block)
+            for observer in self.observers:
+                observer.block_removed(block)
+            block.state = None
+            block.index = None
+        self.blocks.clear()
+
+
+class BlockStore:
+    """Holds every block on the board, grouped by state, along with the occupancy grid which indexes them."""
+    def __init__(self, width, height):
+        self.occupancy = OccupancyGrid(width, height)
+        self.fixated = BlockList(FIXATED, self.occupancy)  # blocks which are not moving
+        self.falling = BlockList(FALLING, self.occupancy)  # blocks which are falling, but not part of a piece
+        self.controlled = BlockList(CONTROLLED, self.occupancy)  # blocks which are part of a controlled piece
+        self.fading = BlockList(FADING, self.occupancy)  # blocks which are in the act of fading out
+
+    def migrate(self, from_block_list, to_block_list, block):
+        """Move a block from one state to another in constant time."""
+        # (a block which isn't in the list it's taken from would end up in two lists)
+        if block.state != from_block_list.state:
+            raise ValueError('%r is not a %s block' % (block, from_block_list.state))
+        from_block_list.remove(block)
+        to_block_list.append(block)
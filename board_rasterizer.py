@@ -0,0 +1,126 @@
+import pygame
+
+try:
+    import numpy
+    import pygame.surfarray
+except ImportError:  # NumPy is optional, without it the board is drawn block by block (see also: GameState.render())
+    numpy = None
+
+# ------------------------------------------------------RASTERIZER------------------------------------------------------
+# Draws the board straight into the pixels of a surface, instead of blitting a sprite for every block.
+#
+# CELLS = The board as a (width, height) array of color indexes, along with the fadeout size of every tile
+# PALETTE = The pixel value of every color index (see also: palette.py), index 0 is the empty (black) tile
+# MASK = Per pixel booleans telling which pixels of a tile are black: the block border (the same for every tile)
+#        and the fadeout square in the center of a fading block (which depends on its fadeout size)
+#
+# Only the tiles which changed get rasterized: a palette lookup turns their color indexes into pixel values, which
+# are scaled up to the block size, and the mask blacks out the borders and fadeout squares. The result is written
+# through a NumPy view of the surface (pygame.surfarray) in one go.
+# ----------------------------------------------------------------------------------------------------------------------
+
+RASTERIZER_MIN_CELLS = 1024  # boards with fewer tiles are drawn faster (and just as well) with block sprites
+
+
+def is_rasterizer_available():
+    return numpy is not None
+
+
+class BoardRasterizer:
+    """Keeps a board of color indexes and rasterizes the tiles which change onto a surface (see also: update())."""
+    def __init__(self, width, height, block_size, border_size, palette, border_color=(0, 0, 0)):
+        self.width = width
+        self.height = height
+        self.block_size = block_size
+
+        self.palette = palette
+        self.border_color = border_color
+        self.mapped_palette = None  # color index -> pixel value in the format of the surface
+        self.black_pixel = None
+
+        # what is currently drawn on the surface
+        self.cells = numpy.zeros((width, height), numpy.uint8)
+        self.fadeout_sizes = numpy.zeros((width, height), numpy.int32)
+
+        self.border_size = border_size  # blocks have a black frame of this many pixels wide
+        self.offsets = numpy.arange(block_size)  # the pixel offsets within a tile
+        self.border_pixels = None  # the black pixels of the block borders, for the entire board
+
+    def update(self, surface, changes, offset=(0, 0)):
+        """Redraw the tiles in a list of (column, row, color, fadeout size) changes (empty tiles have the empty color).
+
+        Returns the area of the surface which was redrawn (None when nothing changed)."""
+        if not changes:
+            return None
+
+        columns, rows, colors, fadeout_sizes = zip(*changes)
+        columns = numpy.array(columns)
+        rows = numpy.array(rows)
+        self.cells[columns, rows] = colors
+        self.fadeout_sizes[columns, rows] = fadeout_sizes
+
+        self.rasterize(surface, columns, rows, offset)
+
+        block_size = self.block_size
+        left = columns.min() * block_size
+        top = rows.min() * block_size
+        return pygame.Rect(offset[0] + left, offset[1] + top, ((columns.max() + 1) * block_size) - left,
+                           ((rows.max() + 1) * block_size) - top)
+
+    def get_black_mask(self, offsets_x, offsets_y, fadeout_sizes=0):
+        """Tell which pixels are black, given their offsets within their tile and the fadeout size of that tile."""
+        block_size = self.block_size
+        border_size = self.border_size
+        black = (offsets_x < border_size) | (offsets_x >= block_size - border_size) | \
+                (offsets_y < border_size) | (offsets_y >= block_size - border_size)
+        if numpy.any(fadeout_sizes):
+            fadeout_start = (block_size // 2) - (fadeout_sizes // 2)
+            fadeout_end = fadeout_start + fadeout_sizes
+            black = black | ((offsets_x >= fadeout_start) & (offsets_x < fadeout_end) &
+                             (offsets_y >= fadeout_start) & (offsets_y < fadeout_end))
+        return black
+
+    def rasterize(self, surface, columns, rows, offset=(0, 0)):
+        """Draw the given tiles (arrays of columns and rows) onto the surface."""
+        block_size = self.block_size
+        offsets = self.offsets
+        if self.mapped_palette is None:
+            self.mapped_palette = numpy.array([surface.map_rgb(self.palette.get_rgb(color))
+                                               for color in range(len(self.palette))], numpy.uint32)
+            self.black_pixel = surface.map_rgb(self.border_color)
+
+        left, right = columns.min(), columns.max() + 1
+        top, bottom = rows.min(), rows.max() + 1
+        black_pixel = self.black_pixel
+        pixels = pygame.surfarray.pixels2d(surface).T  # (rows of pixels, like they are laid out in memory)
+        try:
+            if len(columns) * 2 >= (right - left) * (bottom - top):
+                # most of the area changed: look up the colors of the whole area, scale it up to one value per pixel
+                # and black out the block borders
+                if self.border_pixels is None:
+                    self.border_pixels = self.get_black_mask(numpy.tile(offsets, self.width)[None, :],
+                                                             numpy.tile(offsets, self.height)[:, None])
+                colors = self.mapped_palette.take(self.cells[left:right, top:bottom].T)
+                x = left * block_size
+                y = top * block_size
+                width = colors.shape[1] * block_size
+                height = colors.shape[0] * block_size
+                area = pixels[y + int(offset[1]):, x + int(offset[0]):][:height, :width]
+                area[:, :] = colors.repeat(block_size, 0).repeat(block_size, 1)
+                numpy.copyto(area, black_pixel, where=self.border_pixels[y:y + height, x:x + width])
+
+                # (only the fading blocks differ from one another, those get drawn again on top)
+                columns, rows = numpy.nonzero(self.fadeout_sizes[left:right, top:bottom])
+                columns += left
+                rows += top
+
+            if len(columns):
+                # a (block size x block size) patch of pixels per tile
+                black = self.get_black_mask(offsets[None, None, :], offsets[None, :, None],
+                                            self.fadeout_sizes[columns, rows][:, None, None])
+                colors = self.mapped_palette.take(self.cells[columns, rows])[:, None, None]
+                y = (rows * block_size)[:, None, None] + offsets[None, :, None] + int(offset[1])
+                x = (columns * block_size)[:, None, None] + offsets[None, None, :] + int(offset[0])
+                pixels[y, x] = numpy.where(black, black_pixel, colors)
+        finally:
+            del pixels  # (the surface stays locked for as long as the view exists)
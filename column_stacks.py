@@ -0,0 +1,47 @@
+class ColumnStacks:
+    """The settled (fixated or fading) blocks of every column, stacked from the bottom of the board up.
+
+    Blocks only ever come to rest on top of another block or on the floor, so every column holds an
+    unbroken stack of blocks. The height of a stack tells us where the next block in that column will
+    land, and everything above a cleared tile can be taken off the stack in one slice.
+
+    A barricade can come down on top of the settled blocks though, so two blocks can end up on the same
+    tile. The block which landed first keeps its place on the stack, the other one can only be found
+    through the block store. When only one of them falls, the other one is left hanging on its tile,
+    with an empty slot (None) below it (see also: GameEngine.remove_marked_tiles())."""
+    def __init__(self, width, height):
+        self.height = height
+        self.stacks = [[] for column in range(width)]
+
+    def get_height(self, column):
+        return len(self.stacks[column])
+
+    def get_landing_row(self, column, row=-1):
+        """The row where a block dropped into this column from a given row (from above the board by default) would
+        come to rest. Below a block which was left hanging, that's in the empty slots under it."""
+        stack = self.stacks[column]
+        index = min(self.height - 1 - row, len(stack))
+        while index > 0 and stack[index - 1] is None:
+            index -= 1
+        return self.height - 1 - index
+
+    def push(self, block):
+        """Put a block which just landed on its column stack (a block which shares its tile stays off the stack)."""
+        stack = self.stacks[block.column]
+        index = self.height - 1 - block.row
+        if index < len(stack):
+            if stack[index] is None:
+                stack[index] = block
+        else:
+            stack.extend([None] * (index - len(stack)))
+            stack.append(block)
+
+    def cut(self, column, row):
+        """Take every block at or above a row off the column stack, returning them from the bottom up."""
+        stack = self.stacks[column]
+        index = max(self.height - 1 - row, 0)
+        blocks = [block for block in stack[index:] if block is not None]
+        del stack[index:]
+        while len(stack) and stack[-1] is None:
+            stack.pop()
+        return blocks
@@ -1,29 +1,86 @@
 from globals import *
 from pygame import *
 from math import floor
+from layout import get_ui_scale
+
+# ----------------------------------------------------CONFIGURATION-----------------------------------------------------
+# SETTINGS = Options the player picks from a list (e.g. the window size), saved to disk
+# CONTROLS = The key bound to every action, saved to disk
+# CONSTS = Values which don't change while the game runs, or are derived from the settings (e.g. the block size)
+# SNAPSHOT = An immutable copy of all of the above, read through plain attributes (e.g. config.snapshot.block_size).
+#            A new snapshot is taken whenever something changes, so code that runs every frame never has to go
+#            through get(), which has to search three dicts.
+# CHANGE = The name of the setting which changed, or 'controls'. Observers get told about every change (see also:
+#          add_observer()), instead of polling for flags.
+# ----------------------------------------------------------------------------------------------------------------------
+
+CONTROLS_CHANGED = 'controls'
+
+
+class ConfigSnapshot:
+    """An immutable copy of the configuration (see also: ConfigurationManager.take_snapshot())."""
+    __slots__ = ('version_number', 'fps', 'black', 'white', 'replay_path', 'background_music', 'window_size',
+                 'record_replays', 'ui_scale', 'block_size', 'block_border_size', 'margin_left', 'margin_top',
+                 'back_button', 'pause_button', 'move_left', 'move_right', 'rotate', 'fast_forward', 'hard_drop',
+                 'swap_piece', 'select_menu_option')
+
+    def __init__(self, values):
+        for name in self.__slots__:
+            object.__setattr__(self, name, values.get(name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('configuration snapshots are read-only, change the configuration manager instead')
+
+    def __delattr__(self, name):
+        raise AttributeError('configuration snapshots are read-only, change the configuration manager instead')
+
 
 class ConfigurationManager:
     def __init__(self, logger):
         self.logger = logger
         self.settings = {}
         self.controls = {}
+        self.snapshot = None
+        self.observers = []  # objects with a configuration_changed(change) function
 
         self.consts = {
             'version_number': '1.0',
             'fps': 60,
             'black': (0, 0, 0),
             'white': (255, 255, 255),
-            'recently_resized': False,
-            'music_settings_adjusted': False
+            'replay_path': 'last_replay'  # where the last game gets recorded to (when replays are recorded at all)
         }
         self.load_settings()
         self.load_controls()
 
+    def add_observer(self, observer):
+        if observer not in self.observers:
+            self.observers.append(observer)
+
+    def remove_observer(self, observer):
+        if observer in self.observers:
+            self.observers.remove(observer)
+
+    def notify_observers(self, change):
+        # (iterate over a copy, observers may come and go while handling the change)
+        for observer in list(self.observers):
+            observer.configuration_changed(change)
+
+    def take_snapshot(self):
+        values = dict(self.consts)
+        values.update((key, self.get_setting(key)) for key in self.settings)
+        values['window_size'] = tuple(values['window_size'])
+        values.update(self.controls)
+        self.snapshot = ConfigSnapshot(values)
+
     def determine_size_variables(self):
+        """Derive the base sizes of the layout from the window size (see also: layout.py)."""
+        self.consts['ui_scale'] = get_ui_scale(self.get('window_size'))
         self.consts['block_size'] = floor(self.get('window_size')[0] / 22.5)
         self.consts['block_border_size'] = floor(self.get('block_size') / 20)
         self.consts['margin_left'] = self.consts['block_size'] / 2
         self.consts['margin_top'] = self.consts['margin_left']
+        self.take_snapshot()
 
     def save_settings(self):
         """Write the settings to disk."""
@@ -38,7 +95,8 @@ class ConfigurationManager:
     def load_settings(self):
         self.settings = {
             'background_music': [['Loop', 'Play once', "Off"], 0],
-            'window_size': [[[450, 420], [900, 840]], 1]
+            'window_size': [[[450, 420], [900, 840]], 1],
+            'record_replays': [['Off', 'On'], 0]  # (see also: replay.py)
         }
 
         try:
@@ -63,25 +121,26 @@ class ConfigurationManager:
                 file.write(record)
 
     def load_controls(self):
-        # Load the controls from disk.
-        self.controls = {}
+        # Load the controls from disk (actions which are missing from the file keep their default key).
+        self.controls = {
+            'back_button': K_ESCAPE,
+            'pause_button': K_p,
+            'move_left': K_LEFT,
+            'move_right': K_RIGHT,
+            'rotate': K_UP,
+            'fast_forward': K_DOWN,
+            'hard_drop': K_SPACE,
+            'swap_piece': K_RCTRL,
+            'select_menu_option': K_RETURN
+        }
         try:
             with open('controls', 'r') as file:
                 for line in file:
                     split_line = line.split('|')
                     self.controls[split_line[0]] = int(split_line[1])
         except FileNotFoundError:
-            self.logger.info('No controls file was found, generating default.')
-            self.controls = {
-                'back_button': K_ESCAPE,
-                'pause_button': K_p,
-                'move_left': K_LEFT,
-                'move_right': K_RIGHT,
-                'rotate': K_UP,
-                'fast_forward': K_DOWN,
-                'swap_piece': K_RCTRL,
-                'select_menu_option': K_RETURN
-            }
+            self.logger.info('No controls file was found, using the default controls.')
+        self.take_snapshot()
 
     def get_controls(self):
         return self.controls
@@ -102,14 +161,22 @@ class ConfigurationManager:
         # Increase the selected option index, wrapping around to 0
         selected_setting[1] = (selected_setting[1] + 1) % available_option_count
 
+        if setting_key == 'window_size':
+            self.determine_size_variables()
+        self.take_snapshot()
+        self.notify_observers(setting_key)
+
     def set_key(self, action, key):
         self.controls[action] = key
+        self.take_snapshot()
+        self.notify_observers(CONTROLS_CHANGED)
 
     def get_key(self, key):
         return self.controls[key]
 
     def set_const(self, key, value):
         self.consts[key] = value
+        self.take_snapshot()
 
     def get_const(self, key):
         return self.consts[key]
@@ -29,7 +29,6 @@ class ControlsState(state.State):
 
     def render(self):
         # blank out the screen with blocks, but a splash screen on top of it
-        self.renderer.draw_block_background()
         splash_rect = self.renderer.draw_splash_background()
 
         if self.showing_entry_menu:
@@ -92,6 +91,9 @@ class ControlsState(state.State):
                 elif not self.showing_entry_menu:
                     self.state_manager.pop_state()
 
+    def get_idle_timeout(self):
+        return 0  # (nothing moves here, the screen only changes on input)
+
     def enter(self):
         self.logger.info('Enter: Controls')
         # Translate the controls into human readable format
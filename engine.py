@@ -0,0 +1,682 @@
+import logging
+import random
+from block_store import Block, BlockStore
+from bitboard_matcher import BitboardMatcher
+from column_stacks import ColumnStacks
+from occupancy_grid import FIXATED
+from palette import EMPTY, WILDCARD, COLORS
+from pieces import DEFAULT_TEMPLATES, ObstacleMask, get_template_set
+
+# -----------------------------------------------------TERMINOLOGY------------------------------------------------------
+# ENGINE = The rules of the game (board, pieces, gravity, matching, scoring and levels), without any pygame code.
+#          The GameState feeds it player actions and draws whatever is on the board.
+# LANDED CELLS = Coordinates of blocks which stopped moving, the lines of blocks crossing them are checked for matches
+# BLOCK (DESCRIPTOR) = A small slotted record containing a row, column and color (see also: block_store.py).
+# COLOR = A color index, the engine never deals with RGB values (see also: palette.py)
+# PIECE = A collection of blocks which are controlled by the player, spawned from a template (see also: pieces.py)
+# TICK = A single board update (e.g. everything that is falling moves down one row)
+# ----------------------------------------------------------------------------------------------------------------------
+
+# player actions (named after the controls which trigger them)
+MOVE_LEFT = 'move_left'
+MOVE_RIGHT = 'move_right'
+ROTATE = 'rotate'
+SWAP_PIECE = 'swap_piece'
+HARD_DROP = 'hard_drop'
+
+
+def pick_random_colors(colors, wildcard_color, amount=1, allow_streaks=True, rng=random, wildcard_chance=0.05):
+    """Generate an array of random colors. When streaks are not allowed, no more than three
+    consecutive colors will be the same (and no wildcards will be picked).
+
+    The colors are drawn from rng, which can be any random.Random instance (the random module by default)."""
+    result = []
+
+    latest_color = None
+    color_streak_count = 0
+    for i in range(amount):
+        color_accepted = False
+        while not color_accepted:
+            random_color = colors[rng.randrange(0, len(colors))]
+
+            # 5 percent chance of getting the white color (by default)
+            if allow_streaks and rng.random() <= wildcard_chance:
+                random_color = wildcard_color
+
+            if random_color != latest_color:
+                color_streak_count = 0
+                latest_color = random_color
+            else:
+                color_streak_count += 1
+
+            if allow_streaks or color_streak_count < 3:
+                result.append(random_color)
+                color_accepted = True
+    return result
+
+
+class GameEngine:
+    """The rules of the game, runnable without a display.
+
+    Player input goes through step(action), time goes through tick() (one board update per call).
+    Every random decision is drawn from a per-game random stream, so a game can be reproduced from its seed
+    and the actions which were applied to it (see also: replay.py)."""
+    def __init__(self, board_width=16, board_height=20, logger=None, seed=None, templates=None):
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
+        self.seed = seed if seed is not None else random.randrange(1 << 32)
+        self.random = random.Random(self.seed)
+        self.tick_count = 0  # number of board updates so far
+        self.recorder = None  # when set, every action and tick gets reported to it (see also: ReplayRecorder)
+        self.templates = list(templates if templates is not None else DEFAULT_TEMPLATES)
+        self.template_set = get_template_set(self.templates)  # every template compiled into its four rotations
+
+        self.colors = list(COLORS)
+        self.empty_color = EMPTY
+        self.wildcard_color = WILDCARD
+
+        self.points_per_block = 5
+        self.board_height = board_height  # board height in blocks
+        self.board_width = board_width  # board width in blocks
+
+        self.fast_forward_mode = False
+        self.animate_cascades = True  # when off, falling blocks and cascades are resolved in a single board update
+        self.debug_mode = False
+        self.game_over = False
+
+        self.match_engine = 'scanner'  # either 'scanner' or 'bitboard' (see also: collect_color_matches())
+        self.bitboard_matcher = None
+
+        # difficulty, these only change when the game is being balanced (see also: balance_simulator.py)
+        self.base_update_speed = 500  # the update speed at level 1
+        self.min_update_speed = 200
+        self.update_speed_step = 50  # the board updates this much faster every few levels
+        self.levels_per_speed_step = 3
+        self.pieces_per_level = 20
+        self.levels_per_barricade = 4  # a barricade drops in every few levels
+        self.levels_per_barricade_row = 50  # barricades get an extra row every few levels
+        self.levels_per_color = 10  # pieces get an extra (random) color every few levels
+        self.wildcard_chance = 0.05
+
+        self.score = 0
+        self.level = 1
+        self.update_speed = self.base_update_speed  # update board every x milliseconds
+        self.muligans = 0  # number of times the player can generate a new 'next' piece (see also: spawn_new_piece())
+        self.piece_position = [6, 0]
+
+        # we declare a few lists here which will store references to various tiles/blocks/rows/columns
+        # (otherwise we would have to scan the entire board every time we need to update something)
+        # the block lists are owned by a block store, which also keeps a cell-indexed occupancy grid of them
+        self.block_store = BlockStore(self.board_width, self.board_height)
+        self.occupancy = self.block_store.occupancy
+        self.fixated_blocks = self.block_store.fixated  # blocks which are not moving
+        self.falling_blocks = self.block_store.falling  # blocks which are falling, but not part of a controlled piece
+        self.controlled_blocks = self.block_store.controlled  # blocks which are part of a user-controlled piece
+        self.fading_tiles = self.block_store.fading  # tiles which are in the act of fading out (e.g. part of a color streak)
+        self.column_stacks = ColumnStacks(self.board_width, self.board_height)  # settled blocks per column
+        self.obstacles = self.create_obstacle_mask()  # the tiles pieces can't move into (see also: pieces.py)
+        self.tiles_to_be_reset = []  # board tiles which will be reset (e.g. part of a color streak, fully faded out)
+        self.landed_cells = set()  # coordinates of blocks which were fixated since the last check for matches
+
+        # directions in which we look for matches (the opposite directions are covered by the reverse sweeps)
+        self.match_directions = ((1, 0), (0, 1), (1, -1), (1, 1))
+
+        self.last_barricade_level = 0  # the last level when a barricade was spawned
+        self.number_of_spawned_pieces = 0
+
+        # the colorized template is a copy of a single template
+        # where every 1 has been replaced with a color value
+
+        # when a piece is rotated, what is actually happening is that this matrix is
+        # rotated, and the self.controlled_blocks array is emptied and regenerated
+        self.colorized_template = []
+        self.next_colorized_template = []
+        self.piece = None  # the compiled rotation (see also: PieceRotation) matching the colorized template
+        self.next_piece = None
+
+    def start(self):
+        """Prepare the first piece and drop in the opening barricade."""
+        self.generate_next_colorized_template()
+        self.spawn_barricade(3)
+
+    def step(self, action):
+        """Apply a player action to the controlled piece."""
+        if self.recorder is not None:
+            self.recorder.record_action(self.tick_count, action)
+
+        if action == MOVE_LEFT:
+            self.move_piece((-1, 0))
+        elif action == MOVE_RIGHT:
+            self.move_piece((1, 0))
+        elif action == ROTATE:
+            self.rotate_piece()
+        elif action == SWAP_PIECE:
+            self.swap_piece()
+        elif action == HARD_DROP:
+            self.hard_drop()
+
+    def tick(self):
+        """Advance the game by one board update.
+
+        Faded out tiles are cleared first, otherwise the board is updated. A new piece (or a barricade) is spawned
+        as soon as nothing is moving anymore, so actions which follow the tick can be applied to it."""
+        if len(self.fading_tiles):
+            self.clear_fading_tiles()
+        else:
+            self.update_board()
+        self.spawn_if_idle()
+
+        self.tick_count += 1
+        if self.recorder is not None:
+            self.recorder.record_tick(self)
+
+    def is_board_moving(self):
+        return len(self.falling_blocks) or len(self.controlled_blocks)
+
+    def spawn_if_idle(self):
+        """If nothing is moving on the board either spawn a new piece or a barricade (depending on the current level)."""
+        if not self.is_board_moving():
+            if self.level - self.last_barricade_level == self.levels_per_barricade:
+                self.spawn_barricade()
+            else:
+                self.spawn_new_piece()
+
+    def swap_piece(self):
+        if self.muligans > 0:
+            self.muligans -= 1
+            self.generate_next_colorized_template()
+
+    def pick_random_colors(self, amount=1, allow_streaks=True):
+        return pick_random_colors(self.colors, self.wildcard_color, amount, allow_streaks, self.random,
+                                  self.wildcard_chance)
+
+    def clear_fading_tiles(self):
+        """Reset the tiles which have fully faded out, and let the blocks above them fall down."""
+        self.tiles_to_be_reset = list(self.fading_tiles)
+        self.fading_tiles.clear()
+        self.remove_marked_tiles()
+
+    def get_snapshot(self):
+        """Capture everything needed to resume the game later on as plain (JSON compatible) data."""
+        def describe_blocks(block_list):
+            return [[block.color, block.column, block.row] for block in block_list]
+
+        def describe_template(template):
+            return [list(row) for row in template]
+
+        rng_state = self.random.getstate()
+        return {
+            'tick_count': self.tick_count,
+            'random': [rng_state[0], list(rng_state[1]), rng_state[2]],
+            'fixated': describe_blocks(self.fixated_blocks),
+            'falling': describe_blocks(self.falling_blocks),
+            'controlled': describe_blocks(self.controlled_blocks),
+            'fading': describe_blocks(self.fading_tiles),
+            'landed_cells': sorted(self.landed_cells),
+            'colorized_template': describe_template(self.colorized_template),
+            'next_colorized_template': describe_template(self.next_colorized_template),
+            'piece_position': list(self.piece_position),
+            'score': self.score,
+            'level': self.level,
+            'update_speed': self.update_speed,
+            'muligans': self.muligans,
+            'last_barricade_level': self.last_barricade_level,
+            'number_of_spawned_pieces': self.number_of_spawned_pieces,
+            'fast_forward_mode': self.fast_forward_mode,
+            'game_over': self.game_over
+        }
+
+    def restore_snapshot(self, snapshot):
+        """Resume the game from a snapshot (see also: get_snapshot())."""
+        self.block_store = BlockStore(self.board_width, self.board_height)
+        self.occupancy = self.block_store.occupancy
+        self.fixated_blocks = self.block_store.fixated
+        self.falling_blocks = self.block_store.falling
+        self.controlled_blocks = self.block_store.controlled
+        self.fading_tiles = self.block_store.fading
+        self.column_stacks = ColumnStacks(self.board_width, self.board_height)
+        self.obstacles = self.create_obstacle_mask()
+        self.bitboard_matcher = None
+        self.tiles_to_be_reset = []
+
+        for block_list, key in ((self.fixated_blocks, 'fixated'), (self.falling_blocks, 'falling'),
+                                (self.controlled_blocks, 'controlled'), (self.fading_tiles, 'fading')):
+            for description in snapshot[key]:
+                self.add_block_descriptor(block_list, *description)
+
+        # settled blocks are stacked from the bottom of the board up
+        for block in sorted(list(self.fixated_blocks) + list(self.fading_tiles), key=lambda x: x.row, reverse=True):
+            self.column_stacks.push(block)
+
+        rng_state = snapshot['random']
+        self.random.setstate((rng_state[0], tuple(rng_state[1]), rng_state[2]))
+        self.tick_count = snapshot['tick_count']
+        self.landed_cells = set(tuple(coordinate) for coordinate in snapshot['landed_cells'])
+        self.colorized_template = [list(row) for row in snapshot['colorized_template']]
+        self.next_colorized_template = [list(row) for row in snapshot['next_colorized_template']]
+        self.piece = self.template_set.find(self.colorized_template, self.empty_color)
+        self.next_piece = self.template_set.find(self.next_colorized_template, self.empty_color)
+        self.piece_position = list(snapshot['piece_position'])
+        self.score = snapshot['score']
+        self.level = snapshot['level']
+        self.update_speed = snapshot['update_speed']
+        self.muligans = snapshot['muligans']
+        self.last_barricade_level = snapshot['last_barricade_level']
+        self.number_of_spawned_pieces = snapshot['number_of_spawned_pieces']
+        self.fast_forward_mode = snapshot['fast_forward_mode']
+        self.game_over = snapshot['game_over']
+
+    def create_obstacle_mask(self):
+        obstacles = ObstacleMask(self.board_width, self.board_height)
+        self.fixated_blocks.observers.append(obstacles)
+        self.falling_blocks.observers.append(obstacles)
+        return obstacles
+
+    def add_block_descriptor(self, block_list, color, column, row):
+        """Add a block descriptor to a block_list (e.g register a falling block)."""
+        block_list.append(Block(color, column, row))
+
+    def migrate_block(self, from_block_list, to_block_list, block):
+        self.block_store.migrate(from_block_list, to_block_list, block)
+
+    def remove_from_block_list(self, block_list, block_to_remove):
+        block_list.remove(block_to_remove)
+
+    def is_in_block_list(self, block_list, coordinate):
+        """Determine wether a coordinate is found within a given list of block descriptors."""
+        # (the block lists of the block store are answered by the occupancy grid, without a scan)
+        return block_list.contains(coordinate)
+
+    def is_piece_block(self, coordinate):
+        '''Is coordinate a part of the list of blocks that are controlled by the player?'''
+        return self.is_in_block_list(self.controlled_blocks, coordinate)
+
+
+    def is_falling_block(self, coordinate):
+        '''Is coordinate a part of the list of blocks that are falling?'''
+        return self.is_in_block_list(self.falling_blocks, coordinate)
+
+    def is_fixated_block(self, coordinate):
+        '''Is coordinate a part of the list of blocks that are fixated?'''
+        return self.is_in_block_list(self.fixated_blocks, coordinate)
+
+    def is_within_bounds(self, coordinate):
+        '''Is coordinate within the bounds of the game board?'''
+        return 0 <= coordinate[0] < self.board_width and 0 <= coordinate[1] < self.board_height
+
+
+    def detach_block(self, block):
+        '''Detach a block (i.e. change it from a fixated block to a falling block).'''
+        if not self.is_falling_block((block.column, block.row)):
+            self.migrate_block(self.fixated_blocks, self.falling_blocks, block)
+
+
+    def is_vacant_tile(self, coordinate):
+        '''Is the coordinate an empty slot on the board?'''
+        # within playing field?
+        if not self.is_within_bounds(coordinate):
+            return False
+
+        # empty tile?
+        return not self.is_in_block_list(self.fixated_blocks, coordinate)
+
+    def get_settled_color(self, coordinate):
+        """Get the color of a settled (fixated or fading) block, or the empty color for empty tiles."""
+        block = self.fixated_blocks.find(coordinate)
+        if block is None:
+            block = self.fading_tiles.find(coordinate)
+        return self.empty_color if block is None else block.color
+
+    def find_segment_start(self, coordinate, direction):
+        """Walk backwards from a coordinate to the first block of the unbroken line of blocks it is part of."""
+        if self.get_settled_color(coordinate) == self.empty_color:
+            return None
+
+        current = list(coordinate)
+        while True:
+            previous = [current[0] - direction[0], current[1] - direction[1]]
+            if not self.is_within_bounds(previous) or \
+                    self.get_settled_color(previous) == self.empty_color:
+                return tuple(current)
+            current = previous
+
+    def increase_score(self, increase=0):
+        '''Increase the player score and adjust difficulty.'''
+        self.score += increase
+        self.score += self.muligans * 5
+
+    def remove_marked_tiles(self):
+        lowest_vacated_slots = {}
+
+        score_increase = 0
+        # blank out the tiles and remember what column they are in. Also remember the lowest row
+        # (= highest coordinate) in this column where a tile was blanked out.
+        for block in self.tiles_to_be_reset:
+            score_increase += self.points_per_block
+            column = block.column
+            row = block.row
+            if column not in lowest_vacated_slots or lowest_vacated_slots[column] < row:
+                lowest_vacated_slots[column] = row
+
+        self.tiles_to_be_reset.clear()
+
+        # take the vacated tiles and everything above them off the column stacks, and put the
+        # (still fixated) blocks on the list of moving blocks
+        for column in lowest_vacated_slots:
+            row = lowest_vacated_slots[column]
+            for block in self.column_stacks.cut(column, row):
+                # when blocks share a tile only the one which landed first falls, the others stay where they
+                # are (detach_block() skips them) and go back on the stack (see also: ColumnStacks)
+                settled_blocks = self.fixated_blocks.find_all((block.column, block.row))
+                for settled_block in settled_blocks:
+                    if settled_block.row < row:
+                        self.detach_block(settled_block)
+                for settled_block in settled_blocks:
+                    if settled_block.state == FIXATED:
+                        self.column_stacks.push(settled_block)
+
+        if score_increase:
+            self.increase_score(score_increase)
+
+
+    def move_piece(self, direction=(1, 0)):
+        # the controlled blocks are the blocks of the current rotation, so we only have to check its row masks
+        if len(self.controlled_blocks) and \
+                not self.obstacles.are_cells_free(self.piece, self.piece_position[0] + direction[0],
+                                                  self.piece_position[1]):
+            return
+
+        self.piece_position[0] += direction[0]
+        for block in self.controlled_blocks:
+            self.controlled_blocks.move(block, block.column + direction[0], block.row)
+
+
+    def get_landing_cells(self):
+        """Where the controlled blocks come to rest when they are dropped, (block, column, row) from the bottom up.
+
+        Every block lands on top of its column stack (or in the empty slots under a block which was left hanging,
+        see also: ColumnStacks.get_landing_row()), or on top of the blocks of the piece which landed in the same
+        column before it. That's a lookup per block, instead of moving the piece down one row at a time."""
+        landing_cells = []
+        landed = {}  # column -> the row where the last block of the piece in that column landed
+        for block in sorted(self.controlled_blocks, key=lambda x: x.row, reverse=True):
+            row = self.column_stacks.get_landing_row(block.column, block.row)
+            if block.column in landed:
+                row = min(row, landed[block.column] - 1)
+            row = max(row, block.row)  # (blocks never move up)
+            landed[block.column] = row
+            landing_cells.append((block, block.column, row))
+        return landing_cells
+
+    def get_ghost_cells(self):
+        """The (column, row, color) of every block of the ghost piece, which shows where the piece will land."""
+        return [(column, row, block.color) for block, column, row in self.get_landing_cells()]
+
+    def hard_drop(self):
+        """Drop the controlled piece onto the blocks below it, where it comes to rest right away."""
+        if not len(self.controlled_blocks):
+            return
+
+        # blocks which are still falling would end up below the piece, so they land first
+        if len(self.falling_blocks):
+            self.drop_falling_blocks()
+
+        for block, column, row in self.get_landing_cells():
+            if row != block.row:
+                self.controlled_blocks.move(block, column, row)
+            self.fixate_block(self.controlled_blocks, block)
+
+        # the piece is done, it can't be rotated back onto the board
+        self.colorized_template = []
+        self.piece = None
+
+    def spawn_area_available(self, piece=None):
+        """Is the bounding box of a piece (a compiled rotation, the current one by default) free at the piece position?"""
+        if piece is None:
+            piece = self.piece
+        return self.obstacles.is_box_free(piece, self.piece_position[0], self.piece_position[1])
+
+    def spawn_barricade(self, rows=None):
+        if len(self.falling_blocks) or len(self.controlled_blocks):
+            return
+
+        self.fast_forward_mode = False
+        # add an extra barricade row every 50 levels (by default)
+        number_of_rows = 2 + (self.level // self.levels_per_barricade_row) if rows is None else rows
+
+        for row in range(number_of_rows):
+            # generate an array of random colors as wide as the game board
+            chosen_colors = self.pick_random_colors(self.board_width, False)
+            for column in range(self.board_width):
+                self.add_block_descriptor(self.falling_blocks, chosen_colors[column], column, row)
+
+        self.last_barricade_level = self.level
+
+
+    def spawn_new_piece(self):
+        self.colorized_template = list(self.next_colorized_template)
+        self.piece = self.next_piece
+        self.piece_position = [6, 0]
+        if self.spawn_area_available():
+            self.generate_next_colorized_template()
+            self.generate_controlled_blocks_from_colorized_template()
+            self.muligans = 5  # reset muligans
+            self.fast_forward_mode = False
+        else:
+            self.game_over = True
+
+    def rotate_piece(self):
+        if self.piece is None:
+            return
+
+        if self.spawn_area_available(self.piece.next):
+            self.colorized_template = self.piece.rotate(self.colorized_template)
+            self.piece = self.piece.next
+            self.generate_controlled_blocks_from_colorized_template()
+
+    def generate_next_colorized_template(self):
+        piece_template_index = self.random.randrange(0, len(self.templates))
+        self.next_piece = self.template_set.first_rotations[piece_template_index]
+
+        # select a few random colors, allowing duplicates
+        chosen_colors = self.pick_random_colors(1 + (self.level // self.levels_per_color))
+
+        self.next_colorized_template = [[self.empty_color] * self.next_piece.width
+                                        for row in range(self.next_piece.height)]
+        for column, row in self.next_piece.cells:
+            self.next_colorized_template[row][column] = chosen_colors[self.random.randrange(0, len(chosen_colors))]
+
+
+    def generate_controlled_blocks_from_colorized_template(self):
+        # make sure we're not controlling any leftovers
+        self.controlled_blocks.clear()
+
+        left, top = self.piece_position
+        for column, row in self.piece.cells:
+            if self.is_vacant_tile((left + column, top + row)):
+                self.add_block_descriptor(self.controlled_blocks, self.colorized_template[row][column],
+                                          left + column, top + row)
+
+        # increase the current level based on the number of spawned pieces
+        self.number_of_spawned_pieces += 1
+        self.level = (self.number_of_spawned_pieces // self.pieces_per_level) + 1
+        self.update_speed = self.base_update_speed - \
+            ((self.level // self.levels_per_speed_step) * self.update_speed_step)
+        if self.update_speed < self.min_update_speed:
+            self.update_speed = self.min_update_speed
+
+    def move_blocks_down(self, block_list):
+        # sort the block vertically
+        sorted_list = sorted(block_list, key=lambda x: x.row, reverse=True)
+
+        collision_occured = False
+        for block in sorted_list:
+            destination = (block.column, block.row + 1)
+            if self.is_vacant_tile(destination):  # and not self.is_to_be_fixated(destination):
+                block_list.move(block, destination[0], destination[1])
+            else:
+                collision_occured = True
+                self.fixate_block(block_list, block)
+
+        return collision_occured
+
+    def fixate_block(self, block_list, block):
+        """Stop a block from moving, putting it on top of its column stack."""
+        self.migrate_block(block_list, self.fixated_blocks, block)
+        self.column_stacks.push(block)
+
+        # remember where the block landed, the lines crossing this point will be checked for matches
+        self.landed_cells.add((block.column, block.row))
+
+    def drop_falling_blocks(self):
+        """Drop every falling block straight onto its column stack (i.e. without animating the fall)."""
+        # (blocks under a block which was left hanging land in the empty slots below it, see also: ColumnStacks)
+        for block in sorted(self.falling_blocks, key=lambda x: x.row, reverse=True):
+            landing_row = self.column_stacks.get_landing_row(block.column, block.row)
+            if landing_row > block.row:
+                self.falling_blocks.move(block, block.column, landing_row)
+            self.fixate_block(self.falling_blocks, block)
+
+    def resolve_cascade(self):
+        """Drop, match and clear blocks until nothing is falling or fading anymore, all in a single step."""
+        self.drop_falling_blocks()
+        self.collect_color_matches()
+        while len(self.fading_tiles):
+            self.clear_fading_tiles()
+            self.drop_falling_blocks()
+            self.collect_color_matches()
+
+    def mark_matches(self, starting_point=0, direction=(1, 0)):
+        """Check for grouping of four in a given direction, up until the first empty tile."""
+        current_streak = []
+        # remember the last checked tile in case we need to use it as a starting point
+        # for a reverse sweep
+        last_tile_checked = None
+
+        def flush_streak(current_color):
+            nonlocal current_streak
+            if len(current_streak) > 3 and current_color is not None:
+                for coordinate in current_streak:
+                    if not self.is_in_block_list(self.fading_tiles, coordinate):
+                        self.fade_settled_block(coordinate)
+
+            current_streak = []
+
+        def run_scan(scan_starting_point, scan_direction):
+            nonlocal last_tile_checked
+            current_streak_color = None
+            wildcard_encountered = False
+
+            coordinate_to_check = list(scan_starting_point)
+            in_bounds = self.is_within_bounds(coordinate_to_check)
+
+            while in_bounds:
+                tile_to_check = self.get_settled_color(coordinate_to_check)
+                if tile_to_check == self.empty_color:
+                    break  # the current tile is empty, so whatever streak we had has ended
+
+                last_tile_checked = coordinate_to_check[:]
+
+                if tile_to_check != self.wildcard_color:
+                    if current_streak_color is None:
+                        current_streak_color = tile_to_check
+                    elif current_streak_color != tile_to_check:
+                        flush_streak(current_streak_color)
+                        current_streak_color = tile_to_check
+                else:
+                    wildcard_encountered = True
+
+                current_streak.append(tuple(coordinate_to_check))
+
+                coordinate_to_check[0] += scan_direction[0]
+                coordinate_to_check[1] += scan_direction[1]
+                in_bounds = self.is_within_bounds(coordinate_to_check)
+
+            # we've reached an empty tile or gone out of bounds, flush whatever was left in the streak buffer
+            flush_streak(current_streak_color)
+            return wildcard_encountered
+
+        # run the requested scan, if we encounter a wildcard run it again in the opposite direction
+        # so that we capture all possible match groupings
+        if run_scan(starting_point, direction):
+            reversed_direction = list(direction)
+            reversed_direction[0] *= -1
+            reversed_direction[1] *= -1
+            run_scan(last_tile_checked, reversed_direction)
+
+    def fade_settled_block(self, coordinate):
+        """Start fading out the block on a tile.
+
+        When blocks share a tile, the color of the tile is that of the block which landed last, but the block which
+        landed first is the one that fades (the other one is left on the tile)."""
+        blocks = self.fixated_blocks.find_all(coordinate)
+        if len(blocks):
+            self.migrate_block(self.fixated_blocks, self.fading_tiles, blocks[0])
+
+    def update_board(self):
+        # 1: update falling blocks
+        self.move_blocks_down(self.falling_blocks)
+
+        # if the controlled piece collided with anything add it to the falling blocks
+        # move the controlled piece down, and check if it collided with anything
+        # (we'll want to stop controlling them in that case)
+        piece_collision = self.move_blocks_down(self.controlled_blocks)
+        self.piece_position[1] += 1
+
+        # list and stop controlling it
+        if piece_collision:
+            for block in list(self.controlled_blocks):
+                self.migrate_block(self.controlled_blocks, self.falling_blocks, block)
+
+        # nothing is under the player's control, so unless we want to watch it happen we can skip ahead
+        # to the point where the board has settled
+        if not self.animate_cascades and not len(self.controlled_blocks):
+            self.resolve_cascade()
+
+        # when things have stopped moving, mark matching block groups and remove them
+        # the mark matches function will automatically perform a scan in the opposite direction
+        # if it encounters a wildcard block (because this block may be part of several colors group at the same time)
+        if not len(self.falling_blocks):
+            self.collect_color_matches()
+
+        self.remove_marked_tiles()
+
+    def get_bitboard_matcher(self):
+        """Set up the bitboard matcher the first time we need it, from then on it follows the fixated blocks."""
+        if self.bitboard_matcher is None:
+            self.bitboard_matcher = BitboardMatcher(self.board_width, self.board_height,
+                                                    self.wildcard_color)
+            for block in self.fixated_blocks:
+                self.bitboard_matcher.block_added(block)
+            self.fixated_blocks.observers.append(self.bitboard_matcher)
+        return self.bitboard_matcher
+
+    def collect_color_matches(self):
+        # in debug mode both match engines are used, so we can check that they agree with each other
+        bitboard_matches = None
+        if self.match_engine == 'bitboard' or self.debug_mode:
+            bitboard_matches = self.get_bitboard_matcher().find_matches(self.landed_cells)
+
+        if self.match_engine == 'scanner' or self.debug_mode:
+            self.scan_color_matches()
+            if bitboard_matches is not None:
+                scanned_matches = set((block.column, block.row) for block in self.fading_tiles)
+                if scanned_matches != set(bitboard_matches):
+                    self.logger.warning('Match engines disagree, scanner: %s bitboard: %s' %
+                                        (sorted(scanned_matches), sorted(bitboard_matches)))
+        else:
+            for coordinate in bitboard_matches:
+                self.fade_settled_block(coordinate)
+
+        self.landed_cells = set()
+
+    def scan_color_matches(self):
+        # sweep every unbroken line of blocks which crosses a landed block, in every direction.
+        # Several landed blocks will often share a line, so we remember which ones we already checked.
+        checked_lines = set()
+        for coordinate in self.landed_cells:
+            for direction in self.match_directions:
+                line_start = self.find_segment_start(coordinate, direction)
+                if line_start is None or (line_start, direction) in checked_lines:
+                    continue
+                checked_lines.add((line_start, direction))
+                self.mark_matches(list(line_start), direction)
@@ -4,645 +4,339 @@ import pygame
 import sys
 # import logging
 from pygame.locals import *
-from random import randrange, random
 from high_scores_state import HighScoresState
+from engine import GameEngine, MOVE_LEFT, MOVE_RIGHT, ROTATE, SWAP_PIECE, HARD_DROP
+from ai_player import SearchPlayer
+from replay import ReplayRecorder
+from board_rasterizer import BoardRasterizer, RASTERIZER_MIN_CELLS, is_rasterizer_available
+from layout import get_layout
+from pieces import DEFAULT_TEMPLATES, load_templates
 from globals import *
 
 # -----------------------------------------------------TERMINOLOGY------------------------------------------------------
-# TILE = A non-moving 'slot' on the game board, holds pygame.rect information
+# TILE = A non-moving 'slot' on the game board, its rect comes from the layout (see also: layout.py)
 # BOARD = A two-dimensional array of Tiles, describing the entire game space
-# COLOR_GRID = A copy of the board, which holds color information - this is used to check for groupings of colors
-# BLOCK (DESCRIPTOR) = A small dictionary object containing a row, column and color.
-# PIECE = A collection of blocks which are controlled by the player
+# ENGINE = The rules of the game, the game state feeds it input and draws the board (see also: engine.py)
 # ----------------------------------------------------------------------------------------------------------------------
 
 
 class GameState(state.State):
-    class Tile:
-        """A tile represents a slot on the board"""
-        def __init__(self, x, y, rect_offset=(0, 0), config=None):
-            block_size = config.get('block_size')
-            self.column = x
-            self.row = y
-            self.rect = pygame.Rect(rect_offset[0] + config.get('margin_left') + (block_size * x),
-                                    rect_offset[1] + config.get('margin_top') + (block_size * y), block_size,
-                                    block_size)
-
-    def __init__(self, high_scores):
+    def __init__(self, high_scores, board_width=16, board_height=20):
         super().__init__()
-        self.templates = [
-            [
-                (0, 1, 1),
-                (0, 1, 0),
-                (0, 1, 0)
-            ],
-            [
-                (0, 1, 0),
-                (1, 1, 1)
-            ],
-            [
-                (1, 1, 0),
-                (0, 1, 1)
-            ],
-            [
-                (1, 1),
-                (1, 1)
-            ]
-        ]
-
-        self.points_per_block = 5
-        self.board_height = 20  # board height in blocks
-        self.board_width = 16  # board width in blocks
-        self.preview_height = 3  # preview window height in blocks
-        self.preview_width = 3  # preview window width in blocks
-
-
-        self.fast_forward_mode = False
-        self.debug_mode = False
-        self.game_over = False
+        self.engine = GameEngine(board_width, board_height, templates=DEFAULT_TEMPLATES + load_templates())
+        self.recorder = None  # records the game to a replay file (see also: replay.py)
+        self.computer_player = None  # plays the game when it's switched on with the A key (see also: ai_player.py)
+
+        self.board_height = self.engine.board_height  # board height in blocks
+        self.board_width = self.engine.board_width  # board width in blocks
+        # preview window size in blocks (large enough for the largest template)
+        self.preview_height = max(3, self.engine.template_set.max_size)
+        self.preview_width = max(3, self.engine.template_set.max_size)
+
         self.game_paused = False
         self.music_paused = False
         self.last_update = 0
 
-        self.color_grid = []
-
-
-        self.score = 0
-        self.level = 1
-        self.update_speed = 500  # update board every x milliseconds
-        self.muligans = 0  # number of times the player can generate a new 'next' piece (see also: spawn_new_piece())
-        self.piece_position = [6, 0]
-
-        # we declare a few lists here which will store references to various tiles/blocks/rows/columns
-        # (otherwise we would have to scan the entire board every time we need to update something)
-        self.fixated_blocks = []  # blocks which are not moving
-        self.falling_blocks = []  # blocks which are falling, but not part of a controlled piece
-        self.controlled_blocks = []  # blocks which are part of a user-controlled piece
-        self.fading_tiles = []  # tiles which are in the act of fading out (e.g. part of a color streak)
-        self.tiles_to_be_reset = []  # board tiles which will be reset (e.g. part of a color streak, fully faded out)
-        self.blocks_to_be_fixated = []  # list of blocks which have stopped moving and will be fixated on the board
-        self.dirty_rows = []  # list of rows which need to be checked for matches
-        self.dirty_columns = []  # list of columns which need to be checked for matches
-        self.dirty_diag_ne = []  # coordinates which will be checked diagonally in north-east direction
-        self.dirty_diag_nw = []  # coordinates which will be checked diagonally in north-west direction
-
         self.current_fadeout_value = 2  # current width of the fadeout rectangle
+        self.show_ghost_piece = True  # show where the controlled piece will land (see also: GameEngine.get_ghost_cells())
+        self.interpolate_moving_blocks = True  # draw moving blocks part of the way to the next row between updates
+
+        self.stat_labels = ['level: ', 'score: ', 'speed: ', 'swaps left: ']
+        self.layout = None  # the rects of everything on the game screen (see also: relayout())
+
+        # the layers the screen is composed of (see also: set_up_layers()), along with what was drawn on them
+        # during the previous frame, so the next frame only has to redraw what changed
+        self.layers = []
+        self.rendered_cells = {}  # (column, row) -> (color, size of the fadeout rectangle)
+        self.rendered_preview = None
+        self.rendered_stats = []  # (value, rect on the HUD layer) of every stat line
+        self.rendered_overlay_text = None
+        self.rendered_moving_rects = []  # display rects of the moving blocks, which are drawn over the layers
+
+        # large boards are rasterized with NumPy instead of drawn block by block (see also: board_rasterizer.py),
+        # None picks whichever suits the board size
+        self.use_rasterizer = None
+        self.rasterizer = None
         self.high_scores = high_scores
         self.lowest_high_score = None
-        self.last_barricade_level = 0  # the last level when a barricade was spawned
-        self.number_of_spawned_pieces = 0
 
         for score in self.high_scores:
             as_int = int(score[0])
             if self.lowest_high_score == None or as_int < self.lowest_high_score:
                 self.lowest_high_score = as_int
 
-        # the colorized template is a copy of a single template
-        # where every 1 has been replaced with a color value
-
-        # when a piece is rotated, what is actually happening is that this matrix is
-        # rotated, and the self.controlled_blocks array is emptied and regenerated
-        self.colorized_template = []
-        self.next_colorized_template = []
-
-    def add_block_descriptor(self, block_list, color, column, row):
-        """Add a block descriptor to a block_list (e.g register a falling block)."""
-        block_list.append({
-            'color': color,
-            'column': column,
-            'row': row
-        })
-
-    def migrate_block(self, from_block_list, to_block_list, block):
-        to_block_list.append(block)
-        self.remove_from_block_list(from_block_list, block)
-
-    def find_fixated_blocks_above_point(self, coordinate):
-        result = []
-        for block in self.fixated_blocks:
-            if block['column'] == coordinate[0] and block['row'] < coordinate[1]:
-                result.append(block)
-        return result
-
-    def remove_from_block_list(self, block_list, block_to_remove):
-        for block in list(block_list):
-            if block['column'] == block_to_remove['column'] and block['row'] == block_to_remove['row']:
-                block_list.remove(block)
-                break
-
-    def is_in_block_list(self, block_list, coordinate):
-        """Determine wether a coordinate is found within a given list of block descriptors."""
-        result = False
-        for block in block_list:
-            if block['column'] == coordinate[0] and block['row'] == coordinate[1]:
-                result = True
-                break
-        return result
-
-    def is_piece_block(self, coordinate):
-        '''Is coordinate a part of the list of blocks that are controlled by the player?'''
-        return self.is_in_block_list(self.controlled_blocks, coordinate)
-
-
-    def is_falling_block(self, coordinate):
-        '''Is coordinate a part of the list of blocks that are falling?'''
-        return self.is_in_block_list(self.falling_blocks, coordinate)
-
-    def is_fixated_block(self, coordinate):
-        '''Is coordinate a part of the list of blocks that are fixated?'''
-        return self.is_in_block_list(self.fixated_blocks, coordinate)
-
-    def is_within_bounds(self, coordinate):
-        '''Is coordinate within the bounds of the game board?'''
-        return 0 <= coordinate[0] < self.board_width and 0 <= coordinate[1] < self.board_height
-
-
-    def detach_block(self, block):
-        '''Detach a block (i.e. change it from a fixated block to a falling block).'''
-        if not self.is_falling_block((block['column'], block['row'])):
-            self.migrate_block(self.fixated_blocks, self.falling_blocks, block)
-
-    def rotate_matrix(self, matrix):
-        '''Rotate a matrix 90 degrees clockwist by transposing it + reversing the columns.'''
-        matrix[:] = [[column[i] for column in reversed(matrix)] for i in range(len(matrix[0]))]
-
-
-    def is_vacant_tile(self, coordinate):
-        '''Is the coordinate an empty slot on the board?'''
-        # within playing field?
-        if not self.is_within_bounds(coordinate):
-            return False
-
-        # empty tile?
-        return not self.is_in_block_list(self.fixated_blocks, coordinate)
-
-    def find_furthest_diagonal_point(self, starting_point, direction):
-        current = starting_point[:]
-        last_valid_coordinate = None
-        in_bounds = self.is_within_bounds(current)
-        while in_bounds:
-            last_valid_coordinate = current[:]
-            current[0] += direction[0]
-            current[1] += direction[1]
-            in_bounds = self.is_within_bounds(current)
-        return last_valid_coordinate
-
-    def increase_fadeout_value(self, last_tick):
-        if self.current_fadeout_value >= self.config.get('block_size'):
+    def increase_fadeout_value(self, elapsed_time):
+        if self.current_fadeout_value >= self.config.snapshot.block_size:
             self.current_fadeout_value = 0
-            self.tiles_to_be_reset = list(self.fading_tiles)
-            self.fading_tiles.clear()
-            self.remove_marked_tiles()
-
-        growth_factor = 3
-        if self.config.get('window_size')[0] == 900:
-            growth_factor *= 2
-        self.current_fadeout_value += (last_tick / 1000) * growth_factor
-
-    def increase_score(self, increase=0):
-        '''Increase the player score and adjust difficulty.'''
-        self.score += increase
-        self.score += self.muligans * 5
-
-    def remove_marked_tiles(self):
-        lowest_vacated_slots = {}
-
-        score_increase = 0
-        # blank out the tiles and remember what column they are in. Also remember the lowest row
-        # (= highest coordinate) in this column where a tile was blanked out.
-        for block in self.tiles_to_be_reset:
-            score_increase += self.points_per_block
-            column = block['column']
-            row = block['row']
-            if column not in lowest_vacated_slots or lowest_vacated_slots[column] < row:
-                lowest_vacated_slots[column] = row
-
-        self.tiles_to_be_reset.clear()
-
-        # put all the blocks above this one on the list of moving blocks
-        # (provided it's not already on there)
-        for column in lowest_vacated_slots:
-            row = lowest_vacated_slots[column]
-            blocks_above = self.find_fixated_blocks_above_point((column, row))
-            for block in blocks_above:
-                self.detach_block(block)
-
-        if score_increase:
-            self.increase_score(score_increase)
-
-
-    def move_piece(self, direction=(1, 0)):
-        all_tiles_available = True
-
-        # first pass: check if the tiles we want to move to are all available
-        for block in self.controlled_blocks:
-            # check if the tile we want to move to is available
-            desired_coordinate = (block['column'] + direction[0], block['row'])
-            if not self.is_vacant_tile(desired_coordinate) or self.is_falling_block(desired_coordinate):
-                all_tiles_available = False
-                break
-
-        # second pass: actually move the blocks
-        if all_tiles_available:
-            self.piece_position[0] += direction[0]
-
-            for block in self.controlled_blocks:
-                block['column'] += direction[0]
-
-
-    def spawn_area_available(self, template=None):
-        if template is None:
-            template = self.colorized_template
-
-        all_tiles_available = True
-        for row in range(self.piece_position[1], self.piece_position[1] + len(template)):
-            for column in range(self.piece_position[0], self.piece_position[0] + len(template[0])):
-                # check if the tile we want to move to is available
-                desired_coordinate = (column, row)
-                if not self.is_vacant_tile(desired_coordinate) or self.is_falling_block(desired_coordinate):
-                    all_tiles_available = False
-                    break
-        return all_tiles_available
-
-    def spawn_barricade(self, rows=None):
-        if len(self.falling_blocks) or len(self.controlled_blocks):
-            return
-
-        self.fast_forward_mode = False
-        number_of_rows = 2 + (self.level // 50) if rows is None else rows  # add an extra barricade row every 50 levels
-
-        for row in range(number_of_rows):
-            # generate an array of random colors as wide as the game board
-            chosen_colors = self.renderer.pick_random_colors(self.board_width, False)
-            for column in range(self.board_width):
-                self.add_block_descriptor(self.falling_blocks, chosen_colors[column], column, row)
-
-        self.last_barricade_level = self.level
-
-
-    def spawn_new_piece(self):
-        self.colorized_template = list(self.next_colorized_template)
-        self.piece_position = [6, 0]
-        if self.spawn_area_available():
-            self.generate_next_colorized_template()
-            self.generate_controlled_blocks_from_colorized_template()
-            self.muligans = 5  # reset muligans
-            self.fast_forward_mode = False
-        else:
-            # self.save_high_scores()
-            self.game_over = True
-            if self.lowest_high_score is None or self.lowest_high_score <= self.score:
-                self.state_manager.show_score_entry(self.high_scores, [self.score, self.level])
-
-    def rotate_piece(self):
-        # global self.colorized_template
-        rotated_matrix = list(self.colorized_template)
-        if not len(rotated_matrix):
-            return
-        self.rotate_matrix(rotated_matrix)
-
-        if self.spawn_area_available(rotated_matrix):
-            self.colorized_template = rotated_matrix
-            self.generate_controlled_blocks_from_colorized_template()
-
-    def generate_next_colorized_template(self):
-        self.next_colorized_template = []
-
-        piece_template_index = randrange(0, len(self.templates))
-
-        # select a few random colors, allowing duplicates
-        chosen_colors = self.renderer.pick_random_colors(1 + (self.level // 10))
-
-        for row in self.preview_window:
-            for column in row:
-                column.color = self.config.get_const('black')
-
-        for row in range(len(self.templates[piece_template_index])):
-            self.next_colorized_template.append([])
-            for column in range(len(self.templates[piece_template_index][row])):
-                generated_color = self.config.get_const('black')
-                if self.templates[piece_template_index][row][column] == 1:
-                    generated_color = chosen_colors[randrange(0, len(chosen_colors))]
-                self.next_colorized_template[row].append(generated_color)
-                self.preview_window[column][row].color = generated_color
-
-
-    def generate_controlled_blocks_from_colorized_template(self):
-        # make sure we're not controlling any leftovers
-        self.controlled_blocks = []
-
-        spawn_coord = list(self.piece_position)
-
-        number_of_rows = len(self.colorized_template)
-        number_of_columns = len(self.colorized_template[0])
-
-        for row in range(number_of_rows):
-            for column in range(number_of_columns):
-                if self.colorized_template[row][column] != self.config.get_const('black') and \
-                        self.is_vacant_tile(spawn_coord):
-                    self.add_block_descriptor(self.controlled_blocks, self.colorized_template[row][column],
-                                         spawn_coord[0], spawn_coord[1])
-
-                spawn_coord[0] += 1
-            spawn_coord[1] += 1
-            spawn_coord[0] = self.piece_position[0]
-
-        # increase the current level based on the number of spawned pieces
-        self.number_of_spawned_pieces += 1
-        self.level = (self.number_of_spawned_pieces // 20) + 1
-        self.update_speed = 500 - ((self.level // 3) * 50)
-        if self.update_speed < 200:
-            self.update_speed = 200
-
-    def move_blocks_down(self, block_list):
-        # sort the block vertically
-        sorted_list = sorted(block_list, key=lambda x: x['row'], reverse=True)
-
-        collision_occured = False
-        for block in sorted_list:
-            destination = (block['column'], block['row'] + 1)
-            if self.is_vacant_tile(destination):  # and not self.is_to_be_fixated(destination):
-                block['row'] += 1
-            else:
-                collision_occured = True
-                # self.blocks_to_be_fixated.append(block)
-                self.fixated_blocks.append(block)
-                # block['stopped'] = True
-
-                # collect the furthest points on the board which are diagonal to this one
-                block_coordinate = [block['column'], block['row']]
-                diag_point_south_west = self.find_furthest_diagonal_point(block_coordinate, (-1, 1))
-                diag_point_south_east = self.find_furthest_diagonal_point(block_coordinate, (1, 1))
-
-                # piggy backing off block functions here, but we're not interested in the color
-                if not self.is_in_block_list(self.dirty_diag_ne, diag_point_south_west):
-                    self.add_block_descriptor(self.dirty_diag_ne, self.config.get_const('black'),
-                                              diag_point_south_west[0], diag_point_south_west[1])
-
-                if not self.is_in_block_list(self.dirty_diag_nw, diag_point_south_east):
-                    self.add_block_descriptor(self.dirty_diag_nw, self.config.get_const('black'),
-                                              diag_point_south_east[0], diag_point_south_east[1])
-
-                if block['row'] not in self.dirty_rows:
-                    self.dirty_rows.append(block['row'])
-
-                if block['column'] not in self.dirty_columns:
-                    self.dirty_columns.append(block['column'])
-
-                block_list.remove(block)
-
-        return collision_occured
-
-    def mark_matches(self, starting_point=0, direction=(1, 0)):
-        """Check for grouping of four in a given direction."""
-        current_streak = []
-        # remember the last checked tile in case we need to use it as a starting point
-        # for a reverse sweep
-        last_tile_checked = None
-
-        def flush_streak(current_color):
-            nonlocal current_streak
-            if len(current_streak) > 3 and current_color is not None:
-                for block in current_streak:
-                    if not self.is_in_block_list(self.fading_tiles, (block['column'], block['row'])):
-                        self.migrate_block(self.fixated_blocks, self.fading_tiles, block)
-
-            current_streak = []
-
-        def run_scan(scan_starting_point, scan_direction):
-            nonlocal last_tile_checked
-            current_streak_color = None
-            wildcard_encountered = False
-
-            coordinate_to_check = list(scan_starting_point)
-            in_bounds = self.is_within_bounds(coordinate_to_check)
-
-            while in_bounds:
-                tile_to_check = self.color_grid[coordinate_to_check[0]][coordinate_to_check[1]]
-                last_tile_checked = coordinate_to_check[:]
-
-                if tile_to_check != self.config.get_const('black'):
-                    if tile_to_check != self.config.get_const('white'):
-                        if current_streak_color is None:
-                            current_streak_color = tile_to_check
-                        elif current_streak_color != tile_to_check:
-                            flush_streak(current_streak_color)
-                            current_streak_color = tile_to_check
-                    else:
-                        wildcard_encountered = True
-
-                    self.add_block_descriptor(current_streak, tile_to_check, coordinate_to_check[0], coordinate_to_check[1])
-
-                else:  # the current tile is black, so whatever streak we had has ended
-                    flush_streak(current_streak_color)
-                    current_streak_color = None
-
-                coordinate_to_check[0] += scan_direction[0]
-                coordinate_to_check[1] += scan_direction[1]
-                in_bounds = self.is_within_bounds(coordinate_to_check)
-
-            flush_streak(current_streak_color)  # we've gone out of bounds, flush whatever was left in the streak buffer
-            return wildcard_encountered
-
-        # run the requested scan, if we encounter a wildcard run it again in the opposite direction
-        # so that we capture all possible match groupings
-        if run_scan(starting_point, direction):
-            reversed_direction = list(direction)
-            reversed_direction[0] *= -1
-            reversed_direction[1] *= -1
-            run_scan(last_tile_checked, reversed_direction)
-
-    def render(self):
-        def render_block_descriptor(block_to_render):
-            rect = self.board[block_to_render['column']][block_to_render['row']].rect
-            self.renderer.draw_block(rect, block_to_render['color'])
-
-        # blank out the screen
-        self.renderer.fill(self.config.get_const('black'))
-
-        # draw the preview window
-        for row in range(len(self.preview_window)):
-            for column in range(len(self.preview_window[0])):
-                    block = self.preview_window[row][column]
-                    self.renderer.draw_block(block.rect, block.color)
-
-        for block in self.fixated_blocks:
-            render_block_descriptor(block)
-
-        # draw falling and controller blocks
-        for block in self.falling_blocks:
-            render_block_descriptor(block)
-
-        for block in self.controlled_blocks:
-            render_block_descriptor(block)
-
-        for block in self.fading_tiles:
-            render_block_descriptor(block)
-
-        # render fadeout rectangles
-        fadeout_rect = pygame.Rect(0, 0, self.current_fadeout_value, self.current_fadeout_value)
-        for block in self.fading_tiles:
-            fadeout_rect.center = self.board[block['column']][block['row']].rect.center
-            self.renderer.draw_rect(fadeout_rect, self.config.get_const('black'))
-
-        # draw the board border (grey, 5 pixels thick)
-        self.renderer.draw_rect(self.board_border, (100, 100, 100), 5)
-
-        # render stats
-        offset_growth = 15
-        if self.config.get('window_size')[0] == 900:
-            offset_growth = 30
+            self.engine.tick()
 
-        top_margin = self.config.get('margin_top') + (self.preview_height * self.config.get('block_size')) + 10
-        self.renderer.draw_text('level: %s' % self.level, (self.preview_window_offset, top_margin), True)
-        self.renderer.draw_text('score: %s' % self.score, (self.preview_window_offset, top_margin + offset_growth), True)
-        self.renderer.draw_text('speed: %ss' % (self.update_speed / 1000), (self.preview_window_offset, top_margin + (offset_growth * 2)), True)
-        self.renderer.draw_text('swaps left: %s' % self.muligans, (self.preview_window_offset, top_margin + (offset_growth * 3)), True)
+        self.current_fadeout_value += (elapsed_time / 1000) * self.layout.fadeout_growth
 
-        if self.game_over:
-            self.renderer.draw_text('GAME OVER')
-        elif self.game_paused:
-            self.renderer.draw_text('PAUSED')
+    def get_update_interval(self):
+        """The number of milliseconds between two board updates."""
+        engine = self.engine
+        return min(engine.update_speed, 15) if engine.fast_forward_mode else engine.update_speed
 
-    def update_board(self):
-        # 1: update falling blocks
-        self.move_blocks_down(self.falling_blocks)
+    def get_moving_blocks(self):
+        """The falling and controlled blocks which move down a row during the next board update, along with how far
+        (in pixels) they should be drawn below their tiles. Nothing moves while tiles are fading out."""
+        engine = self.engine
+        if not self.interpolate_moving_blocks or len(engine.fading_tiles) or engine.game_over:
+            return [], 0
 
-        # if the controlled piece collided with anything add it to the falling blocks
-        # move the controlled piece down, and check if it collided with anything
-        # (we'll want to stop controlling them in that case)
-        piece_collision = self.move_blocks_down(self.controlled_blocks)
-        self.piece_position[1] += 1
+        fraction = min(self.last_update / self.get_update_interval(), 1)
+        offset = int(fraction * self.layout.board_block_size)
+        return [block for block_list in (engine.falling_blocks, engine.controlled_blocks) for block in block_list
+                if engine.is_vacant_tile((block.column, block.row + 1))], offset
 
-        # list and stop controlling it
-        if piece_collision:
-            self.falling_blocks += self.controlled_blocks
-            self.controlled_blocks.clear()
-
-        # when things have stopped moving, mark matching block groups and remove them
-        # the mark matches function will automatically perform a scan in the opposite direction
-        # if it encounters a wildcard block (because this block may be part of several colors group at the same time)
-        if not len(self.falling_blocks):
-            self.collect_color_matches()
-
-        self.remove_marked_tiles()
-
-    def collect_color_matches(self):
-            self.color_grid = [[self.config.get_const('black') for row in range(self.board_height)] for column in range(self.board_width)]
-
-            # now fill in the fixated colors
-            for block in self.fixated_blocks:
-                self.color_grid[block['column']][block['row']] = block['color']
-
-            for block in self.dirty_diag_ne:  # sweep from bottom to top left
-                self.mark_matches([block['column'], block['row']], (1, -1))
-
-            for block in self.dirty_diag_nw:  # sweep from bottom to top right
-                self.mark_matches([block['column'], block['row']], (-1, -1))
-
-            for row in self.dirty_rows:
-                self.mark_matches([0, row], (1, 0))  # sweep from left to right
-
-            for column in self.dirty_columns:
-                self.mark_matches([column, 0], (0, 1))  # sweep from top to bottom
+    def render(self):
+        # the screen is composed of three layers, which only get redrawn where something changed:
+        # the static layer (background, board border and stat labels), the board layer and the HUD layer
+        # (preview window and stat values). The layers are copied to the display by the compositor.
+        engine = self.engine
+        overlay_text = 'GAME OVER' if engine.game_over else 'PAUSED' if self.game_paused else None
+        regions = []  # parts of the screen which changed since the previous frame
 
-            self.dirty_diag_ne = []
-            self.dirty_diag_nw = []
-            self.dirty_columns = []
-            self.dirty_rows = []
+        # draw the preview window
+        preview = [list(row) for row in engine.next_colorized_template]
+        if preview != self.rendered_preview:
+            layout = self.layout
+            self.hud_layer.fill(self.config.snapshot.black, layout.preview_layer_area)
+            self.renderer.draw_blocks([(layout.preview_layer_rects[column][row], preview[row][column])
+                                       for row in range(len(preview)) for column in range(len(preview[row]))
+                                       if preview[row][column] != engine.empty_color], self.hud_layer)
+            regions.append(layout.preview_area)
+            self.rendered_preview = preview
+
+        # collect what should be on every occupied tile, (color, size of the fadeout rectangle) pairs
+        # (the blocks which are on their way down to the next row are drawn over the layers instead, see below)
+        moving_blocks, moving_offset = self.get_moving_blocks()
+        cells = {}
+        for block_list in (engine.fixated_blocks, engine.falling_blocks, engine.controlled_blocks):
+            for block in block_list:
+                cells[(block.column, block.row)] = (block.color, 0)
+        for block in moving_blocks:
+            cells.pop((block.column, block.row), None)
+        fadeout_size = int(self.current_fadeout_value)
+        for block in engine.fading_tiles:
+            cells[(block.column, block.row)] = (block.color, fadeout_size)
+
+        # the ghost piece is drawn as hollow blocks, wherever the board is still empty
+        if self.show_ghost_piece:
+            for column, row, color in engine.get_ghost_cells():
+                if (column, row) not in cells:
+                    cells[(column, row)] = (color, self.layout.ghost_hole_size)
+
+        # update the tiles which changed on the board layer, and blank out the ones which were vacated
+        changes = [(coordinate[0], coordinate[1], cell[0], cell[1]) for coordinate, cell in cells.items()
+                   if self.rendered_cells.get(coordinate) != cell]
+        changes.extend((coordinate[0], coordinate[1], engine.empty_color, 0) for coordinate in self.rendered_cells
+                       if coordinate not in cells)
+        self.rendered_cells = cells
+
+        if self.rasterizer is not None:
+            changed_area = self.rasterizer.update(self.board_layer, changes)
+            if changed_area is not None:
+                regions.append(changed_area.move(self.layout.board_border.topleft))
+        else:
+            layer_rects = self.layout.board_layer_rects
+            self.renderer.draw_blocks([(layer_rects[change[0]][change[1]], change[2], change[3])
+                                       for change in changes if change[2] != engine.empty_color], self.board_layer)
+            for change in changes:
+                if change[2] == engine.empty_color:
+                    self.board_layer.fill(self.config.snapshot.black, layer_rects[change[0]][change[1]])
+            regions.extend(self.layout.board_rects[change[0]][change[1]] for change in changes)
+
+        # the board border overlaps the tiles along the edges of the board
+        if any(change[0] in (0, self.board_width - 1) or change[1] in (0, self.board_height - 1)
+               for change in changes):
+            self.draw_board_border()
+
+        # update the stat values which changed on the HUD layer
+        for index, value in enumerate(self.get_stat_values()):
+            previous_value, previous_rect = self.rendered_stats[index]
+            if value != previous_value:
+                if previous_rect is not None:
+                    self.hud_layer.fill(self.config.snapshot.black, previous_rect)
+                    regions.append(previous_rect.move(self.layout.hud_position))
+                rect = self.renderer.draw_numeric_text(value, self.stat_value_positions[index], True, self.hud_layer)
+                regions.append(rect.move(self.layout.hud_position))
+                self.rendered_stats[index] = (value, rect)
+
+        # the moving blocks were drawn over the layers last frame, so those rects have to be composed again
+        board_rects = self.layout.board_rects
+        moving_rects = [board_rects[block.column][block.row].move(0, moving_offset) for block in moving_blocks]
+        regions.extend(self.rendered_moving_rects)
+        regions.extend(moving_rects)
+        self.rendered_moving_rects = moving_rects
+
+        # the overlay text is drawn on top of the layers, so the whole screen gets composed while it is shown
+        # (and once more when it disappears)
+        if not self.renderer.begin_partial_redraw(self) or overlay_text is not None or \
+                overlay_text != self.rendered_overlay_text:
+            self.renderer.composite(self.layers)
+        else:
+            self.renderer.composite(self.layers, regions)
+        self.rendered_overlay_text = overlay_text
+
+        if moving_blocks:
+            # (within the board border, like the tiles on the board layer)
+            display = self.renderer.display
+            display.set_clip(self.layout.board_border.inflate(-10, -10))
+            self.renderer.draw_blocks([(rect, block.color) for rect, block in zip(moving_rects, moving_blocks)])
+            display.set_clip(None)
+
+        if overlay_text is not None:
+            self.renderer.draw_centered_text(overlay_text, render_surface=self.layout.board_border)
+
+    def get_stat_values(self):
+        engine = self.engine
+        return [str(engine.level), str(engine.score), '%ss' % (engine.update_speed / 1000), str(engine.muligans)]
+
+    def draw_board_border(self):
+        """Draw the board border (grey, 5 pixels thick) on the board layer."""
+        self.renderer.draw_rect(self.board_layer.get_rect(), (100, 100, 100), 5, self.board_layer)
+
+    def set_up_layers(self):
+        """Create the layers the game screen is composed of, and draw their static parts."""
+        black = self.config.snapshot.black
+        layout = self.layout
+
+        # the static layer: a black background with the stat labels on it
+        self.static_layer = self.renderer.create_layer(layout.window_size)
+        self.static_layer.fill(black)
+
+        self.stat_value_positions = []
+        for label, position in zip(self.stat_labels, layout.stat_positions):
+            label_surface = self.renderer.get_text_surface(label, self.renderer.get_font(True))
+            self.static_layer.blit(label_surface, position)
+            self.stat_value_positions.append((position[0] + label_surface.get_width() - layout.hud_position[0],
+                                              position[1] - layout.hud_position[1]))
+
+        # the board layer holds the tiles (and the border which is drawn on top of them)
+        self.board_layer = self.renderer.create_layer(layout.board_border.size)
+        self.board_layer.fill(black)
+        self.draw_board_border()
+
+        self.rasterizer = None
+        use_rasterizer = self.use_rasterizer
+        if use_rasterizer is None:
+            use_rasterizer = self.board_width * self.board_height >= RASTERIZER_MIN_CELLS
+        if use_rasterizer and is_rasterizer_available():
+            self.rasterizer = BoardRasterizer(self.board_width, self.board_height, layout.board_block_size,
+                                              self.config.snapshot.block_border_size, self.renderer.palette, black)
+
+        # the HUD layer holds the preview window and the stat values, on a transparent (black) background
+        self.hud_layer = self.renderer.create_layer(layout.hud_size, black)
+
+        self.layers = [(self.static_layer, (0, 0)), (self.board_layer, layout.board_border.topleft),
+                       (self.hud_layer, layout.hud_position)]
+
+        self.rendered_cells = {}
+        self.rendered_preview = None
+        self.rendered_stats = [(None, None)] * len(self.stat_labels)
+        self.rendered_overlay_text = None
+        self.rendered_moving_rects = []
 
     def update(self, elapsed_time):
-        # Resize the game screen or adjust the music settings if applicable
-        if self.config.get('recently_resized'):
-            self.set_up_game()
-            self.config.set_const('recently_resized', False)
-        if self.config.get('music_settings_adjusted'):
-            self.check_music_settings()
-            self.config.set_const('music_settings_adjusted', False)
-
+        engine = self.engine
+        controls = self.config.snapshot
         for event in pygame.event.get():
             if event.type == QUIT:
                 self.state_manager.stop_game()
             elif event.type == KEYDOWN:
-                if event.key == self.config.get_key('fast_forward'):
-                    self.fast_forward_mode = True
+                if event.key == controls.fast_forward:
+                    engine.fast_forward_mode = True
+                elif event.key == controls.hard_drop:
+                    # (on key down, and the board gets updated right away: the dropped piece is checked for
+                    # matches and the next piece comes in during this frame)
+                    engine.step(HARD_DROP)
+                    self.last_update = engine.update_speed
             elif event.type == KEYUP:
-                if self.game_over:
+                if engine.game_over:
                     self.state_manager.shut_down_game()
-                elif event.key == self.config.get_key('fast_forward'):
-                    self.fast_forward_mode = False
-                elif event.key == self.config.get_key('move_left'):
-                    self.move_piece((-1, 0))
-                elif event.key == self.config.get_key('move_right'):
-                    self.move_piece((1, 0))
-                elif event.key == self.config.get_key('rotate'):
-                    self.rotate_piece()
-                elif event.key == self.config.get_key('back_button'):
+                elif event.key == controls.fast_forward:
+                    engine.fast_forward_mode = False
+                elif event.key == controls.move_left:
+                    engine.step(MOVE_LEFT)
+                elif event.key == controls.move_right:
+                    engine.step(MOVE_RIGHT)
+                elif event.key == controls.rotate:
+                    engine.step(ROTATE)
+                elif event.key == controls.back_button:
                     self.pause_music()
                     self.state_manager.show_menu()
-                elif event.key == self.config.get_key('pause_button'):
+                elif event.key == controls.pause_button:
                     self.game_paused = not self.game_paused
-                elif event.key == self.config.get_key('swap_piece'):
-                    if self.muligans > 0:
-                        self.muligans -= 1
-                        self.generate_next_colorized_template()
+                elif event.key == controls.swap_piece:
+                    engine.step(SWAP_PIECE)
                 elif event.key == K_d:
-                    self.debug_mode = not self.debug_mode
-
-        # if nothing is moving on the board either spawn a new piece or a barricade (depending on the current level)
-        if not (len(self.falling_blocks) or len(self.controlled_blocks)):
-            if self.level - self.last_barricade_level == 4:
-                self.spawn_barricade()
-            else:
-                self.spawn_new_piece()
+                    engine.debug_mode = not engine.debug_mode
+                elif event.key == K_a:
+                    self.computer_player = SearchPlayer() if self.computer_player is None else None
 
+        # every board update (and every completed fadeout) is a tick of the engine, new pieces get spawned
+        # by the engine as soon as nothing is moving anymore
+        # (the state manager calls this in fixed steps, see also: StateManager.update())
         if not self.game_paused:
-            update_required = self.last_update >= self.update_speed or (self.fast_forward_mode and self.last_update >= 15)
-
-            if len(self.fading_tiles):
-                self.increase_fadeout_value(self.last_update)
-            elif update_required:
-                self.update_board()
-                self.last_update = 0
+            if self.computer_player is not None and not engine.game_over:
+                self.computer_player.act(engine, elapsed_time)
 
             self.last_update += elapsed_time
+            update_interval = self.get_update_interval()
+            if len(engine.fading_tiles):
+                self.increase_fadeout_value(elapsed_time)
+                # (the board stands still while tiles fade out, and gets updated as soon as they're gone)
+                self.last_update = min(self.last_update, update_interval)
+            elif self.last_update >= update_interval:
+                engine.tick()
+                # (one interval per update, so an update which came late is caught up with during the next steps)
+                self.last_update -= update_interval
+
+        if engine.game_over and (self.lowest_high_score is None or self.lowest_high_score <= engine.score):
+            self.state_manager.show_score_entry(self.high_scores, [engine.score, engine.level])
+
+    def get_idle_timeout(self):
+        # (nothing moves while the game is paused or over, the computer player doesn't act then either)
+        if self.game_paused or self.engine.game_over:
+            return 0
+        return None
+
+    def configuration_changed(self, change):
+        if change == 'window_size':
+            self.relayout()
 
     def enter(self):
         self.logger.info('Enter: GameState')
+        self.config.add_observer(self)
+        self.engine.logger = self.logger
         self.set_up_game()
+        if self.config.snapshot.record_replays == 'On':
+            self.recorder = ReplayRecorder(self.engine)
 
     def set_up_game(self):
         self.logger.info('Setting up the game.')
         pygame.mixer.music.load('assets/Odyssey.ogg')
-        self.determine_size_variables()
+        self.relayout()
         self.check_music_settings()
-        self.generate_next_colorized_template()
-        self.spawn_barricade(3)
+        self.engine.start()
         self.music_paused = False
 
     def check_music_settings(self):
-        if self.config.get('background_music') != 'Off':
-            if self.config.get('background_music') == 'loop':
+        background_music = self.config.snapshot.background_music
+        if background_music != 'Off':
+            if background_music == 'loop':
                 self.start_music()
             else:
                 self.start_music(False)
         else:
             self.stop_music()
 
-    def determine_size_variables(self):
-        margin_left = self.config.get('margin_left')
-        margin_top = self.config.get('margin_top')
-
-        self.preview_window_offset = margin_left + (self.board_width * self.config.get('block_size')) + (margin_left * 2)
-        self.block_size = self.config.get('block_size')
-
-        self.board = [[GameState.Tile(x, y, config=self.config) for y in range(self.board_height)] for x in range(self.board_width)]
-        self.preview_window = [[GameState.Tile(x, y, (self.preview_window_offset, 0), self.config) for y in
-                                range(self.preview_height)] for x in range(self.preview_height)]
-
-        self.board_border = pygame.Rect(margin_left, margin_top, (self.board_width * self.block_size),
-                                        (self.board_height * self.block_size))
-
+    def relayout(self):
+        """Fit the game screen to the window size, the game itself is left alone (see also: layout.py)."""
+        self.layout = get_layout(self.config, self.board_width, self.board_height, self.preview_width,
+                                 self.preview_height, len(self.stat_labels))
+        self.set_up_layers()
 
     def stop_music(self):
         self.music_paused = True
@@ -672,3 +366,8 @@ class GameState(state.State):
 
     def exit(self):
         self.logger.info('Exit: GameState')
+        self.config.remove_observer(self)
+        if self.recorder is not None:
+            self.recorder.save(self.config.snapshot.replay_path)
+            self.recorder = None
+            self.engine.recorder = None
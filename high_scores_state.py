@@ -31,7 +31,6 @@ class HighScoresState(state.State):
 
     def render(self):
         # blank out the screen with blocks, but a splash screen on top of it
-        self.renderer.draw_block_background()
         splash_rect = self.renderer.draw_splash_background()
 
         if self.showing_entry_menu:
@@ -62,6 +61,9 @@ class HighScoresState(state.State):
                     else:
                         self.entered_name += chr(event.key)
 
+    def get_idle_timeout(self):
+        return 0  # (nothing moves here, the screen only changes on input)
+
     def enter(self):
         self.logger.info('Enter: HighScores')
 
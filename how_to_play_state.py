@@ -21,8 +21,7 @@ class HowToPlayState(state.State):
         ]
 
     def render(self):
-        # blank out the screen
-        self.renderer.draw_block_background()
+        # blank out the screen with blocks, but a splash screen on top of it
         splash = self.renderer.draw_splash_background()
         self.renderer.draw_centered_text(self.lines, render_surface=splash)
 
@@ -31,6 +30,9 @@ class HowToPlayState(state.State):
             if event.type == QUIT or event.type == KEYUP:
                 self.state_manager.pop_state()
 
+    def get_idle_timeout(self):
+        return 0  # (nothing moves here, the screen only changes on input)
+
     def enter(self):
         self.logger.info('Enter: Help')
 
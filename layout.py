@@ -0,0 +1,79 @@
+import pygame
+from math import floor
+
+# --------------------------------------------------------LAYOUT--------------------------------------------------------
+# The geometry of the game screen, computed from the window size instead of being tuned for every window size.
+# Everything is derived from the base block size (see also: ConfigurationManager.determine_size_variables()) and the
+# UI scale, which is the window width relative to the 450 pixels wide window the screens were originally made for.
+#
+# RECT TABLE = A list of columns, holding the rect of every tile (rect_table[column][row]), computed once per layout
+# LAYER RECTS = The same rects relative to the layer they are drawn on, so drawing doesn't have to move them around
+#
+# A layout only depends on the window size and the size of the board, so it is shared by every game which needs it
+# (see also: get_layout()). Laying out the screen again after a resize leaves the game itself alone.
+# ----------------------------------------------------------------------------------------------------------------------
+
+REFERENCE_WINDOW_WIDTH = 450
+
+
+def get_ui_scale(window_size):
+    return window_size[0] / REFERENCE_WINDOW_WIDTH
+
+
+def create_rect_table(left, top, block_size, width, height):
+    return [[pygame.Rect(left + (block_size * column), top + (block_size * row), block_size, block_size)
+             for row in range(height)] for column in range(width)]
+
+
+class Layout:
+    """The rects of the board, the preview window and the stat lines for a window and board size."""
+    def __init__(self, window_size, block_size, margin_left, margin_top, board_width=16, board_height=20,
+                 preview_width=3, preview_height=3, stat_lines=4):
+        self.window_size = tuple(window_size)
+        self.ui_scale = get_ui_scale(window_size)
+
+        # boards larger than the default 16x20 get smaller blocks, so they take up the same part of the window
+        self.block_size = block_size
+        self.board_block_size = min(block_size, floor(block_size * 16 / board_width),
+                                    floor(block_size * 20 / board_height))
+
+        # the board, and the tiles on it
+        self.board_border = pygame.Rect(margin_left, margin_top, board_width * self.board_block_size,
+                                        board_height * self.board_block_size)
+        self.board_rects = create_rect_table(margin_left, margin_top, self.board_block_size, board_width, board_height)
+        self.board_layer_rects = create_rect_table(0, 0, self.board_block_size, board_width, board_height)
+        self.ghost_hole_size = self.board_block_size - (2 * max(2, self.board_block_size // 5))  # (a hollow block)
+
+        # the preview window (and the stat lines below it) sit to the right of the board, on the HUD layer
+        self.preview_window_offset = margin_left + self.board_border.width + (margin_left * 2)
+        self.hud_position = (int(self.preview_window_offset), 0)
+        self.hud_size = (self.window_size[0] - self.hud_position[0], self.window_size[1])
+
+        self.preview_rects = create_rect_table(self.preview_window_offset + margin_left, margin_top, block_size,
+                                               preview_width, preview_height)
+        self.preview_layer_rects = [[rect.move(-self.hud_position[0], -self.hud_position[1]) for rect in column]
+                                    for column in self.preview_rects]
+        self.preview_area = self.preview_rects[0][0].unionall([rect for column in self.preview_rects
+                                                               for rect in column])
+        self.preview_layer_area = self.preview_area.move(-self.hud_position[0], -self.hud_position[1])
+
+        # the stat lines (e.g. 'score: 123'), their labels are drawn at these positions on the screen
+        stat_top = margin_top + (preview_height * block_size) + 10
+        line_height = 15 * self.ui_scale
+        self.stat_positions = [(self.preview_window_offset, stat_top + (line_height * index))
+                               for index in range(stat_lines)]
+
+        self.fadeout_growth = block_size / 0.45  # pixels the fadeout rectangles grow per second (a fade takes 450ms)
+
+
+layouts = {}  # (window size, board size, ...) -> Layout
+
+
+def get_layout(config, board_width=16, board_height=20, preview_width=3, preview_height=3, stat_lines=4):
+    """Return the layout of the game screen for the current window size, computing it the first time it is needed."""
+    key = (tuple(config.get('window_size')), config.get('block_size'), config.get('margin_left'),
+           config.get('margin_top'), board_width, board_height, preview_width, preview_height, stat_lines)
+    layout = layouts.get(key)
+    if layout is None:
+        layout = layouts[key] = Layout(*key)
+    return layout
@@ -30,16 +30,14 @@ class MainMenuState(state.State):
         self.menu_options = []
         self.showing_menu = False
         self.active_game = None
+        self.music_settings_adjusted = False  # the music settings changed while a game was running
         self.shut_down_game()  # perform some extra initialization
 
     def render(self):
         if self.active_game is not None and not self.showing_menu:
             self.active_game.render()
         else:
-            # blank out the screen with colored blocks
-            self.renderer.draw_block_background()
-
-            # draw a splash background
+            # blank out the screen with colored blocks, and draw a splash background on top of it
             splash = self.renderer.draw_splash_background()
 
             # Collect all the menu option texts, we will send them as an array to the
@@ -56,10 +54,7 @@ class MainMenuState(state.State):
             prefix_offset = self.renderer.get_distance_from_center(list(text_rect_to_prefix.center))
             prefix_offset[1] *= -1
             prefix_offset[1] += text_rect_to_prefix.height / 2
-            prefix_offset[0] = -80
-
-            if self.config.get('window_size')[0] == 900:
-                prefix_offset[0] *= 2
+            prefix_offset[0] = -80 * self.config.snapshot.ui_scale
 
             self.renderer.draw_centered_text('>', offset=prefix_offset, render_surface=splash)
 
@@ -84,8 +79,9 @@ class MainMenuState(state.State):
 
     def continue_game(self):
         """Continue playing the game (i.e. hide the main menu)"""
-        if self.config.get('music_settings_adjusted'):
+        if self.music_settings_adjusted:
             self.active_game.check_music_settings()
+            self.music_settings_adjusted = False
         else:
             self.active_game.unpause_music()
 
@@ -142,7 +138,7 @@ class MainMenuState(state.State):
                 if event.type == QUIT:
                     self.state_manager.pop_state()
                 elif event.type == KEYUP:
-                    if event.key == self.config.get_key('back_button'):
+                    if event.key == self.config.snapshot.back_button:
                         self.state_manager.pop_state()
                     elif event.key == K_DOWN:
                         # increase selected option with wrap around
@@ -152,15 +148,26 @@ class MainMenuState(state.State):
                         self.selected_option -= 1
                         if self.selected_option < 0:
                             self.selected_option = len(self.menu_options) - 1
-                    elif event.key == self.config.get_key('select_menu_option'):
+                    elif event.key == self.config.snapshot.select_menu_option:
                         # fire the callback related to the currently selected option
                         self.menu_options[self.selected_option][1]()
 
+    def get_idle_timeout(self):
+        if self.active_game is not None and not self.showing_menu:
+            return self.active_game.get_idle_timeout()
+        return 0  # (nothing moves in the menu)
+
+    def configuration_changed(self, change):
+        if change == 'background_music':
+            self.music_settings_adjusted = True
+
     def enter(self):
         self.logger.info('Enter: MainMenu')
+        self.config.add_observer(self)
         self.high_scores = self.load_high_scores()
 
     def exit(self):
         self.logger.info('Exit: MainMenu')
+        self.config.remove_observer(self)
         if self.active_game is not None:
             self.active_game.exit()
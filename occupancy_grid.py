@@ -0,0 +1,94 @@
+# block states tracked by the occupancy grid
+FIXATED = 'fixated'
+FALLING = 'falling'
+CONTROLLED = 'controlled'
+FADING = 'fading'
+
+BLOCK_STATES = (FIXATED, FALLING, CONTROLLED, FADING)
+
+
+class OccupancyGrid:
+    """A cell-indexed lookup of the blocks on the board.
+
+    Every block state gets its own layer (a two-dimensional array as big as the board), so we can tell
+    what is at a (column, row) coordinate and in which state without scanning the block lists.
+    Cells are None when vacant and otherwise hold the occupying block. In the rare case of several blocks
+    sharing a cell in the same state, the cell holds a list of them."""
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.layers = {state: [[None] * height for column in range(width)] for state in BLOCK_STATES}
+
+    def is_within_bounds(self, column, row):
+        return 0 <= column < self.width and 0 <= row < self.height
+
+    def add(self, state, block):
+        column = block.column
+        row = block.row
+        if not self.is_within_bounds(column, row):
+            return
+
+        layer = self.layers[state]
+        cell = layer[column][row]
+        if cell is None:
+            layer[column][row] = block
+        elif isinstance(cell, list):
+            cell.append(block)
+        else:
+            layer[column][row] = [cell, block]
+
+    def remove(self, state, block):
+        column = block.column
+        row = block.row
+        if not self.is_within_bounds(column, row):
+            return
+
+        layer = self.layers[state]
+        cell = layer[column][row]
+        if cell is block:
+            layer[column][row] = None
+            return
+
+        if isinstance(cell, list):
+            for index, occupant in enumerate(cell):
+                if occupant is block:
+                    del cell[index]
+                    if len(cell) == 1:
+                        layer[column][row] = cell[0]
+                    return
+
+        # (a block which isn't in its cell means the grid and the block lists no longer agree)
+        raise ValueError('%r is not on the %s layer' % (block, state))
+
+    def move(self, state, block, column, row):
+        """Move a block to a new coordinate, updating both the block and the grid."""
+        self.remove(state, block)
+        block.column = column
+        block.row = row
+        self.add(state, block)
+
+    def clear(self, state, blocks):
+        """Remove a collection of blocks from a layer (e.g. when a block list is cleared)."""
+        for block in blocks:
+            self.remove(state, block)
+
+    def get(self, state, coordinate):
+        """Return the block found at the coordinate in the given state, or None."""
+        if not self.is_within_bounds(coordinate[0], coordinate[1]):
+            return None
+        cell = self.layers[state][coordinate[0]][coordinate[1]]
+        if isinstance(cell, list):
+            return cell[-1]
+        return cell
+
+    def get_all(self, state, coordinate):
+        """Return every block found at the coordinate in the given state, in the order in which they were added."""
+        if not self.is_within_bounds(coordinate[0], coordinate[1]):
+            return []
+        cell = self.layers[state][coordinate[0]][coordinate[1]]
+        if isinstance(cell, list):
+            return list(cell)
+        return [] if cell is None else [cell]
+
+    def is_occupied(self, state, coordinate):
+        return self.get(state, coordinate) is not None
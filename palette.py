@@ -0,0 +1,40 @@
+# -------------------------------------------------------PALETTE--------------------------------------------------------
+# Blocks don't carry RGB values around, they carry a color index: a small int which fits in a byte. The game rules only
+# ever compare indexes, the RGB value of an index is looked up when a block gets drawn (see also: Renderer.palette).
+#
+# EMPTY = Index 0, a tile without a block (drawn black)
+# WILDCARD = Index 1, the white blocks which match any other color
+# COLORS = Index 2 and up, the regular block colors
+# ----------------------------------------------------------------------------------------------------------------------
+
+EMPTY = 0
+WILDCARD = 1
+FIRST_COLOR = 2
+
+DEFAULT_RGB_VALUES = [
+    (0, 0, 0),  # empty
+    (255, 255, 255),  # wildcard
+    (255, 0, 0),
+    (0, 255, 0),
+    (0, 0, 255)
+]
+
+COLORS = list(range(FIRST_COLOR, len(DEFAULT_RGB_VALUES)))  # the regular colors of the default palette
+
+
+class Palette:
+    """The RGB values of the color indexes (empty, wildcard and the regular colors, in that order)."""
+    def __init__(self, rgb_values=DEFAULT_RGB_VALUES):
+        if len(rgb_values) <= FIRST_COLOR:
+            raise ValueError('a palette needs an empty color, a wildcard color and at least one regular color')
+        self.rgb_values = [tuple(rgb) for rgb in rgb_values]
+
+    def __len__(self):
+        return len(self.rgb_values)
+
+    def get_rgb(self, color):
+        return self.rgb_values[color]
+
+    def get_colors(self):
+        """The indexes of the regular colors."""
+        return list(range(FIRST_COLOR, len(self.rgb_values)))
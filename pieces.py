@@ -0,0 +1,211 @@
+import logging
+
+# --------------------------------------------------------PIECES--------------------------------------------------------
+# TEMPLATE = The shape of a piece, a matrix of 0s and 1s (a 1 becomes a block when the piece is spawned)
+# ROTATION = A template compiled for one of its four orientations (see also: PieceRotation)
+# BOX = The bounding box of a rotation, a piece can only spawn or rotate where its whole box is free
+# OBSTACLES = The tiles a piece can't move into (fixated and falling blocks), as one bitmask per row
+#             (bit n of a row mask stands for column n)
+#
+# Every template is compiled into its four rotations once, so moving, rotating and spawning a piece only takes
+# a few row mask tests instead of walking over the tiles of its matrix.
+#
+# Extra templates can be added in a 'templates' file, one row of 0s and 1s per line, with a blank line between
+# two templates. Lines starting with # are ignored.
+# ----------------------------------------------------------------------------------------------------------------------
+
+DEFAULT_TEMPLATES = [
+    (
+        (0, 1, 1),
+        (0, 1, 0),
+        (0, 1, 0)
+    ),
+    (
+        (0, 1, 0),
+        (1, 1, 1)
+    ),
+    (
+        (1, 1, 0),
+        (0, 1, 1)
+    ),
+    (
+        (1, 1),
+        (1, 1)
+    )
+]
+
+MAX_TEMPLATE_SIZE = 4  # (the preview window has room for four blocks next to the board)
+
+
+def rotate_shape(shape):
+    """Rotate a matrix 90 degrees clockwise."""
+    return tuple(tuple(row[column] for row in reversed(shape)) for column in range(len(shape[0])))
+
+
+def get_shape(matrix, empty=0):
+    """The template of a (colorized) matrix, 1 wherever it holds something other than empty."""
+    return tuple(tuple(0 if cell == empty else 1 for cell in row) for row in matrix)
+
+
+class PieceRotation:
+    """A template in one of its orientations, along with everything the collision checks need."""
+    __slots__ = ('shape', 'width', 'height', 'cells', 'row_masks', 'box_mask', 'left', 'right', 'next', 'sources')
+
+    def __init__(self, shape):
+        self.shape = shape
+        self.width = len(shape[0])
+        self.height = len(shape)
+
+        # the (column, row) offsets of the blocks, in the order in which they are spawned
+        self.cells = [(column, row) for row in range(self.height) for column in range(self.width) if shape[row][column]]
+        self.row_masks = [(row, sum(1 << column for column in range(self.width) if shape[row][column]))
+                          for row in range(self.height) if any(shape[row])]
+        self.box_mask = (1 << self.width) - 1
+        self.left = min(column for column, row in self.cells)
+        self.right = max(column for column, row in self.cells)
+
+        self.next = None  # the rotation after a clockwise turn
+        self.sources = None  # for every tile of the next rotation, the (column, row) it was rotated from
+
+    def rotate(self, matrix):
+        """Rotate a colorized matrix of this shape clockwise, the result is a colorized matrix of the next rotation."""
+        return [[matrix[row][column] for column, row in sources] for sources in self.next.sources]
+
+
+class TemplateSet:
+    """The rotations of a list of templates, compiled once (see also: get_template_set())."""
+    def __init__(self, templates):
+        self.templates = templates
+        self.rotations = {}  # shape -> PieceRotation
+        self.first_rotations = [self.compile(template) for template in templates]
+        self.max_size = max(max(len(template), len(template[0])) for template in templates)
+
+    def compile(self, template):
+        """Compile the four rotations of a template, returning the first one."""
+        first = self.rotations.get(template)
+        if first is not None:
+            return first
+
+        rotations = []
+        shape = template
+        for turn in range(4):
+            rotation = self.rotations.get(shape)
+            if rotation is None:
+                rotation = self.rotations[shape] = PieceRotation(shape)
+            rotations.append(rotation)
+            shape = rotate_shape(shape)
+
+        for index, rotation in enumerate(rotations):
+            rotation.next = rotations[(index + 1) % 4]
+            # clockwise, tile (column, row) of the next rotation comes from (row, height - 1 - column)
+            rotation.next.sources = [[(row, rotation.height - 1 - column) for column in range(rotation.height)]
+                                     for row in range(rotation.width)]
+        return rotations[0]
+
+    def find(self, matrix, empty=0):
+        """Find the rotation matching the shape of a colorized matrix (shapes we don't know yet get compiled)."""
+        if not len(matrix):
+            return None
+        shape = get_shape(matrix, empty)
+        rotation = self.rotations.get(shape)
+        if rotation is None:
+            rotation = self.compile(shape)
+        return rotation
+
+
+template_sets = {}  # tuple of templates -> TemplateSet
+
+
+def get_template_set(templates):
+    """Return the compiled rotations of a list of templates, compiling them the first time they are needed."""
+    key = tuple(tuple(tuple(row) for row in template) for template in templates)
+    template_set = template_sets.get(key)
+    if template_set is None:
+        template_set = template_sets[key] = TemplateSet(key)
+    return template_set
+
+
+class ObstacleMask:
+    """Follows block lists (see also: BlockList.observers), keeping one bitmask of occupied columns per row."""
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.rows = [0] * height
+        self.counts = bytearray(width * height)  # blocks per tile (two blocks can end up on the same tile)
+
+    def block_added(self, block):
+        if not (0 <= block.column < self.width and 0 <= block.row < self.height):
+            return
+        index = (block.row * self.width) + block.column
+        self.counts[index] += 1
+        self.rows[block.row] |= 1 << block.column
+
+    def block_removed(self, block):
+        if not (0 <= block.column < self.width and 0 <= block.row < self.height):
+            return
+        index = (block.row * self.width) + block.column
+        if self.counts[index]:
+            self.counts[index] -= 1
+        if not self.counts[index]:
+            self.rows[block.row] &= ~(1 << block.column)
+
+    def is_box_free(self, rotation, column, row):
+        """Is the bounding box of a rotation within the board, without any obstacles in it?"""
+        if column < 0 or row < 0 or column + rotation.width > self.width or row + rotation.height > self.height:
+            return False
+        box_mask = rotation.box_mask << column
+        rows = self.rows
+        for offset in range(rotation.height):
+            if rows[row + offset] & box_mask:
+                return False
+        return True
+
+    def are_cells_free(self, rotation, column, row):
+        """Are the blocks of a rotation within the board, without any obstacles on them?"""
+        if column + rotation.left < 0 or column + rotation.right >= self.width:
+            return False
+        rows = self.rows
+        for offset, mask in rotation.row_masks:
+            if not 0 <= row + offset < self.height:
+                return False
+            if rows[row + offset] & (mask << column if column >= 0 else mask >> -column):
+                return False
+        return True
+
+
+def parse_templates(lines, logger=None):
+    """Read templates from lines of 0s and 1s (see the top of this file), skipping the ones which are invalid."""
+    logger = logger if logger is not None else logging.getLogger(__name__)
+    templates = []
+    rows = []
+    for line in list(lines) + ['']:
+        line = line.strip()
+        if line.startswith('#'):
+            continue
+        if line:
+            rows.append(line)
+            continue
+        if not rows:
+            continue
+
+        if any(character not in '01' for row in rows for character in row) or \
+                any(len(row) != len(rows[0]) for row in rows) or '1' not in ''.join(rows):
+            logger.warning('Skipping template %s, its rows should be equally long and only contain 0s and 1s' % rows)
+        elif len(rows) > MAX_TEMPLATE_SIZE or len(rows[0]) > MAX_TEMPLATE_SIZE:
+            logger.warning('Skipping template %s, templates can be %s by %s at most' %
+                           (rows, MAX_TEMPLATE_SIZE, MAX_TEMPLATE_SIZE))
+        else:
+            templates.append(tuple(tuple(int(character) for character in row) for row in rows))
+        rows = []
+    return templates
+
+
+def load_templates(path='templates', logger=None):
+    """Load the user-defined templates from a file, if there is one."""
+    logger = logger if logger is not None else logging.getLogger(__name__)
+    try:
+        with open(path, 'r') as file:
+            return parse_templates(file, logger)
+    except FileNotFoundError:
+        logger.info('No templates file was found, using the default templates.')
+        return []
@@ -0,0 +1,287 @@
+import os
+
+# render without a display (or a sound card), this has to happen before pygame is initialized
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import argparse
+import gc
+import json
+import logging
+import platform
+import sys
+import time
+import tracemalloc
+import pygame
+from benchmarks import FIXTURES, build_fixture, get_surface, get_percentile, compare_to_baseline
+from configuration import ConfigurationManager
+from renderer import Renderer
+from game_state import GameState
+from main_menu_state import MainMenuState
+from high_scores_state import HighScoresState
+
+# ------------------------------------------------RENDER BENCHMARKS-----------------------------------------------------
+# Times the render() functions of the states (and the presentation of the frame) under the SDL dummy video driver,
+# so renderer optimizations can be measured on a machine without a display.
+#
+# SCENE = A state with scripted contents (e.g. a game with a half full board), rendered over and over again
+# DRAW CALL = A fill, blit or pygame.draw call on the display, or a text render
+# ALLOCATIONS = The Python memory allocated while rendering a frame (measured in a separate pass, tracing slows
+#               things down). Pixel data is allocated by SDL instead, new text surfaces show up as text draw calls.
+#
+# Usage:
+#   python3 render_benchmarks.py --output results.json
+#   python3 render_benchmarks.py --baseline results.json --scene game
+# ----------------------------------------------------------------------------------------------------------------------
+
+WINDOW_SIZES = {450: 0, 900: 1}  # window width -> index of the window_size setting
+
+
+class DrawCallCounter:
+    """Counts the draw calls made by the renderer (see also: install_counter())."""
+    def __init__(self):
+        self.counts = {}
+
+    def count(self, name, amount=1):
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    def reset(self):
+        self.counts = {}
+
+
+class CountingSurface:
+    """Stands in for the display surface, counting the calls that draw on it."""
+    def __init__(self, surface, counter):
+        self.surface = surface
+        self.counter = counter
+
+    def fill(self, *arguments, **keywords):
+        self.counter.count('fill')
+        return self.surface.fill(*arguments, **keywords)
+
+    def blit(self, *arguments, **keywords):
+        self.counter.count('blit')
+        return self.surface.blit(*arguments, **keywords)
+
+    def blits(self, blit_sequence, *arguments, **keywords):
+        blit_sequence = list(blit_sequence)
+        self.counter.count('blit', len(blit_sequence))
+        return self.surface.blits(blit_sequence, *arguments, **keywords)
+
+    def __getattr__(self, name):
+        return getattr(self.surface, name)
+
+
+class CountingFont:
+    """Stands in for a font, counting the text it renders."""
+    def __init__(self, font, counter):
+        self.font = font
+        self.counter = counter
+
+    def render(self, *arguments, **keywords):
+        self.counter.count('text')
+        return self.font.render(*arguments, **keywords)
+
+    def __getattr__(self, name):
+        return getattr(self.font, name)
+
+
+def install_counter(renderer, counter):
+    """Wrap the display and fonts of a renderer (and the pygame.draw functions) so every draw call gets counted."""
+    renderer.display = CountingSurface(renderer.display, counter)
+    renderer.big_font = CountingFont(renderer.big_font, counter)
+    renderer.small_font = CountingFont(renderer.small_font, counter)
+
+    def counting(name, function):
+        def wrapper(surface, *arguments, **keywords):
+            counter.count('draw.%s' % name)
+            if isinstance(surface, CountingSurface):
+                surface = surface.surface
+            return function(surface, *arguments, **keywords)
+        wrapper.original = function
+        return wrapper
+
+    for name in ('rect', 'line', 'lines', 'circle', 'polygon'):
+        function = getattr(pygame.draw, name)
+        setattr(pygame.draw, name, counting(name, getattr(function, 'original', function)))
+
+
+class ScriptedStateManager:
+    """Ignores whatever the states ask of it, the scenes never change."""
+    def __getattr__(self, name):
+        return lambda *arguments, **keywords: None
+
+
+def create_game_scene(renderer, logger, config, board_width=16, board_height=20):
+    """A game on a half full board, with a piece under control and a few fading tiles."""
+    state = GameState([], board_width, board_height)
+    state.inject_services(renderer, logger, ScriptedStateManager(), config)
+    engine = state.engine
+    engine.restore_snapshot(build_fixture(*FIXTURES['half_full'], engine.board_width, engine.board_height))
+    engine.spawn_new_piece()
+    for coordinate in get_surface(engine)[:6]:
+        engine.migrate_block(engine.fixated_blocks, engine.fading_tiles, engine.fixated_blocks.find(coordinate))
+    state.relayout()
+    state.current_fadeout_value = config.get('block_size') / 2
+    return state
+
+
+def create_large_game_scene(renderer, logger, config):
+    """The game scene on a board which is too large to draw block by block (see also: board_rasterizer.py)."""
+    return create_game_scene(renderer, logger, config, 64, 80)
+
+
+def create_main_menu_scene(renderer, logger, config):
+    state = MainMenuState()
+    state.inject_services(renderer, logger, ScriptedStateManager(), config)
+    return state
+
+
+def create_high_scores_scene(renderer, logger, config, number_of_scores=200):
+    """The high score table, filled with a lot of scores."""
+    high_scores = [[str(100000 - (index * 250)), str(50 - (index // 5)), 'player %s' % index]
+                   for index in range(number_of_scores)]
+    state = HighScoresState(high_scores)
+    state.inject_services(renderer, logger, ScriptedStateManager(), config)
+    return state
+
+
+def animate_game_scene(state, frame):
+    """Grow the fadeout rectangles, like they do while a match is being cleared."""
+    state.current_fadeout_value = (frame % state.config.get('block_size')) + 1
+
+
+# scene name -> (function creating the state, function animating it before every frame (or None))
+SCENES = {
+    'game': (create_game_scene, animate_game_scene),
+    'large_game': (create_large_game_scene, animate_game_scene),
+    'main_menu': (create_main_menu_scene, None),
+    'high_scores': (create_high_scores_scene, None)
+}
+
+
+def render_frame(state, renderer, animate=None, frame=0):
+    if animate is not None:
+        animate(state, frame)
+    state.render()
+    renderer.update()
+
+
+def run_scene(name, renderer, logger, config, frames, warmup=10):
+    """Render a scene over and over again, returning its statistics (times are in milliseconds)."""
+    renderer.resize()  # start every scene with fresh caches
+    counter = DrawCallCounter()
+    install_counter(renderer, counter)
+    create, animate = SCENES[name]
+    state = create(renderer, logger, config)
+
+    for frame in range(warmup):
+        render_frame(state, renderer, animate, frame)
+
+    # first pass: frame times and draw calls
+    samples = []
+    draw_calls = {}
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for frame in range(frames):
+            counter.reset()
+            start = time.perf_counter()
+            render_frame(state, renderer, animate, frame)
+            samples.append((time.perf_counter() - start) * 1000)
+            for key, amount in counter.counts.items():
+                draw_calls[key] = draw_calls.get(key, 0) + amount
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    # second pass: memory allocated per frame
+    allocated = []
+    tracemalloc.start()
+    try:
+        for frame in range(min(frames, 50)):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            render_frame(state, renderer, animate, frame)
+            allocated.append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+
+    samples.sort()
+    mean = sum(samples) / len(samples)
+    return {
+        'frames': frames,
+        'fps': 1000 / mean if mean else 0,
+        'mean': mean,
+        'min': samples[0],
+        'p50': get_percentile(samples, 50),
+        'p90': get_percentile(samples, 90),
+        'p99': get_percentile(samples, 99),
+        'max': samples[-1],
+        'draw_calls_per_frame': sum(draw_calls.values()) / frames,
+        'draw_calls': {key: amount / frames for key, amount in sorted(draw_calls.items())},
+        'allocated_kb_per_frame': sum(allocated) / len(allocated) / 1024
+    }
+
+
+def run_suite(frames, scene_names, window_widths):
+    pygame.init()
+    logger = logging.getLogger(__name__)
+    config = ConfigurationManager(logger)
+    renderer = Renderer(logger, config)
+
+    results = {}
+    for window_width in window_widths:
+        config.settings['window_size'][1] = WINDOW_SIZES[window_width]  # (not saved to disk)
+        for name in scene_names:
+            key = '%s/%s' % (name, window_width)
+            results[key] = run_scene(name, renderer, logger, config, frames)
+            print('%-20s %8.0f fps  p50 %7.2fms  p99 %7.2fms  %7.1f draw calls  %8.1fkB allocated' %
+                  (key, results[key]['fps'], results[key]['p50'], results[key]['p99'],
+                   results[key]['draw_calls_per_frame'], results[key]['allocated_kb_per_frame']))
+    pygame.quit()
+    return results
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Benchmark the renderer of BlockBuster without a display.')
+    parser.add_argument('--frames', type=int, default=200, help='timed frames per scene and window size')
+    parser.add_argument('--scene', action='append', choices=sorted(SCENES), help='scene to render (can be repeated)')
+    parser.add_argument('--window-size', type=int, action='append', choices=sorted(WINDOW_SIZES),
+                        help='window width to render at (can be repeated)')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare the results to a JSON file written by an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='fail when a median frame time grew by more than this fraction of the baseline')
+    options = parser.parse_args(arguments)
+
+    results = run_suite(options.frames, options.scene or list(SCENES), options.window_size or sorted(WINDOW_SIZES))
+
+    if options.output:
+        with open(options.output, 'w') as file:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'pygame': pygame.version.ver,
+                'video_driver': os.environ['SDL_VIDEODRIVER'],
+                'frames': options.frames,
+                'results': results
+            }, file, indent=2, sort_keys=True)
+
+    if options.baseline:
+        with open(options.baseline, 'r') as file:
+            baseline = json.load(file)['results']
+
+        regressions = compare_to_baseline(results, baseline, options.threshold)
+        if regressions:
+            print('\nREGRESSION: %s scene(s) got more than %d%% slower than the baseline' %
+                  (len(regressions), options.threshold * 100))
+            for key, before, after in regressions:
+                print('  %-18s p50 %7.2fms -> %7.2fms (+%.0f%%)' % (key, before, after, (after - before) / before * 100))
+            return 1
+        print('\nNo regressions compared to %s' % options.baseline)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
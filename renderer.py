@@ -1,81 +1,189 @@
 import pygame
+from collections import OrderedDict
 from globals import *
 from math import ceil
-from random import randrange, random
+from engine import pick_random_colors
+from palette import Palette, WILDCARD
+
+TEXT_COLOR = (200, 200, 200)
+DIGITS = '0123456789'
 
 class Renderer:
     def __init__(self, logger, config):
         self.config = config
-        self.background_block_grid = []
-        self.colors = [
-            (255, 0, 0),
-            (0, 255, 0),
-            (0, 0, 255)
-        ]
+        self.block_background = None  # surface covering the window with randomly colored blocks
+        self.splash_backgrounds = {}  # (outer margin, inner margin, border color) -> block background with a splash
+        self.block_sprites = {}  # (color index, block size, border size, fadeout size) -> pre-rendered block surface
+        self.text_surfaces = OrderedDict()  # (text, font, color) -> rendered text, least recently used first
+        self.text_surfaces_size = 0  # bytes of pixel data held by the text surface cache
+        self.text_surfaces_limit = 4 * 1024 * 1024
+        self.text_sizes = {}  # (text, font) -> (width, height) of the rendered text
+        self.digit_atlases = {}  # (font, color) -> (surface holding the digits 0-9, width of a digit)
+        self.palette = Palette()  # the RGB values of the color indexes blocks are drawn in
+
+        # dirty rectangles: states which only redraw what changed report the regions they touched, so only
+        # those get presented. Every other frame (and the first frame after a resize) presents the entire display.
+        self.dirty_rects = None  # regions of the display changed during this frame, None means everything
+        self.full_redraw_required = True
+        self.frame_owner = None  # the object which is drawing the current frame using dirty rectangles
+        self.last_frame_owner = None
 
         self.resize()
+        config.add_observer(self)
 
     def update(self):
-        pygame.display.update()
+        if self.dirty_rects is None:
+            pygame.display.update()
+        elif len(self.dirty_rects):
+            pygame.display.update(self.dirty_rects)
+
+        self.last_frame_owner = self.frame_owner
+        self.frame_owner = None
+        self.dirty_rects = None
+        self.full_redraw_required = False
+
+    def begin_partial_redraw(self, owner):
+        """Start a frame in which only the changed regions get redrawn (and reported with add_dirty_rect).
+
+        Returns False when the owner has to redraw everything instead, because the window was resized or
+        because somebody else drew the previous frame (e.g. after a state change)."""
+        self.frame_owner = owner
+        if self.full_redraw_required or self.last_frame_owner is not owner:
+            self.dirty_rects = None
+            return False
+
+        self.dirty_rects = []
+        return True
+
+    def skip_frame(self):
+        """Present nothing during this frame, the display keeps showing the last frame that was drawn."""
+        self.frame_owner = self.last_frame_owner
+        self.dirty_rects = []
+
+    def add_dirty_rect(self, rect):
+        if self.dirty_rects is not None:
+            self.dirty_rects.append(pygame.Rect(rect))
+
+    def request_full_redraw(self):
+        self.full_redraw_required = True
+
+    def configuration_changed(self, change):
+        if change == 'window_size':
+            self.resize()
 
     def resize(self):
         pygame.display.set_caption('BLOCK BUSTER (v%s)' % self.config.get_const('version_number'))
         self.display = pygame.display.set_mode(self.config.get_setting('window_size'))
         self.config.determine_size_variables()
-        if self.background_block_grid:
-            self.background_block_grid = []
-
-        if self.config.get('window_size')[0] == 450:
-            self.big_font = pygame.font.Font(None, 30)
-            self.small_font = pygame.font.Font(None, 20)
-        else:
-            self.big_font = pygame.font.Font(None, 60)
-            self.small_font = pygame.font.Font(None, 40)
+        self.request_full_redraw()
+        self.block_background = None
+        self.splash_backgrounds = {}
+        self.block_sprites = {}
+        self.text_surfaces.clear()
+        self.text_surfaces_size = 0
+        self.text_sizes = {}
+        self.digit_atlases = {}
+
+        self.big_font = pygame.font.Font(None, round(30 * self.config.snapshot.ui_scale))
+        self.small_font = pygame.font.Font(None, round(20 * self.config.snapshot.ui_scale))
 
     def fill(self, color):
         self.display.fill(color)
 
-    def draw_rect(self, rect, color, border_width=0):
+    def draw_rect(self, rect, color, border_width=0, surface=None):
+        if surface is None:
+            surface = self.display
         if border_width == 0:  # filled rectangles can use the fill function which  can be hardware accelerated
-            self.display.fill(color, rect)
+            return surface.fill(color, rect)
         else:
-            pygame.draw.rect(self.display, color, rect, border_width)
+            return pygame.draw.rect(surface, color, rect, border_width)
+
+    def create_layer(self, size, colorkey=None):
+        """Create a surface to compose part of the screen on (see also: composite()).
+
+        When a colorkey is given the layer starts out filled with it, and it won't be copied to the layers below.
+        (anti-aliased text would get blended twice on a per-pixel alpha layer, colorkeys don't have that problem)"""
+        layer = pygame.Surface(size).convert()
+        if colorkey is not None:
+            layer.fill(colorkey)
+            layer.set_colorkey(colorkey)
+        return layer
+
+    def composite(self, layers, regions=None):
+        """Copy a stack of (layer, position) pairs to the display, bottom layer first.
+
+        When regions are given only those parts of the display get updated (and reported as dirty rectangles),
+        otherwise the layers are copied entirely."""
+        blits = []
+        if regions is None:
+            for layer, position in layers:
+                blits.append((layer, position))
+        else:
+            for region in regions:
+                # go through the layers top down, until we reach an opaque layer which covers the entire region
+                region_blits = []
+                for layer, position in reversed(layers):
+                    layer_rect = layer.get_rect(topleft=position)
+                    area = region.clip(layer_rect)
+                    if area.width and area.height:
+                        region_blits.append((layer, area.topleft, area.move(-position[0], -position[1])))
+                    if layer.get_colorkey() is None and layer_rect.contains(region):
+                        break
+                blits.extend(reversed(region_blits))
+                self.add_dirty_rect(region)
+        self.display.blits(blits, False)
+
+    def get_block_sprite(self, color, size, fadeout_size=0):
+        """Return a block of the given color (index) and (width, height) size, rendering it the first time.
+
+        Blocks which are fading out have a black square of fadeout_size pixels wide in their center."""
+        settings = self.config.snapshot
+        key = (color, size, settings.block_border_size, fadeout_size)
+        sprite = self.block_sprites.get(key)
+        if sprite is None:
+            sprite = pygame.Surface(size).convert()
+            sprite.fill(self.palette.get_rgb(color))  # a colored rect
+            pygame.draw.rect(sprite, settings.black, sprite.get_rect(), settings.block_border_size)  # with a black border
+            if fadeout_size:
+                fadeout_rect = pygame.Rect(0, 0, fadeout_size, fadeout_size)
+                fadeout_rect.center = sprite.get_rect().center
+                sprite.fill(settings.black, fadeout_rect)
+            self.block_sprites[key] = sprite
+        return sprite
 
     def draw_block(self, rect, color):
-        self.draw_rect(rect, color)  # fill a colored rect
-        self.draw_rect(rect, self.config.get_const('black'), self.config.get('block_border_size'))  # draw a black border on it
+        self.display.blit(self.get_block_sprite(color, rect.size), rect)
+        return rect
 
-    # todo generate rects once instead of for every draw call
-    def draw_block_background(self):
+    def draw_blocks(self, blocks, surface=None):
+        """Draw a batch of (rect, color) or (rect, color, fadeout size) blocks in a single call."""
+        if surface is None:
+            surface = self.display
+        surface.blits([(self.get_block_sprite(block[1], block[0].size, *block[2:]), block[0]) for block in blocks], False)
+
+    def get_block_background(self):
+        """Return a surface covering the window with randomly colored blocks, composing it the first time."""
         # initialize a background block grid if none is present
-        if not len(self.background_block_grid):
+        if self.block_background is None:
             window_size = self.config.get('window_size')
             block_size = self.config.get('block_size')
 
             number_of_columns = ceil(window_size[0] / block_size)
             number_of_rows = ceil(window_size[1] / block_size)
 
-            current_position = [0, 0]
+            blocks = []
             for row in range(number_of_rows):
                 color_row = self.pick_random_colors(number_of_columns)
-                self.background_block_grid.append([])
-                for current_color in color_row:
-                    rect = pygame.Rect(current_position, (block_size, block_size))
-                    self.background_block_grid[row].append({
-                        'color': current_color,
-                        'rect': rect,
-                        'obfuscated': False
-                    })
-                    current_position[0] += block_size
-                current_position[0] = 0
-                current_position[1] += block_size
-
-        for row in self.background_block_grid:
-            for block in row:
-                if not block['obfuscated']:
-                    self.draw_block(block['rect'], block['color'])
+                for column, current_color in enumerate(color_row):
+                    rect = pygame.Rect((column * block_size, row * block_size), (block_size, block_size))
+                    blocks.append((self.get_block_sprite(current_color, rect.size), rect))
 
-    def draw_splash_background(self, outer_margin=30, inner_margin=10, border_color=(255, 255, 255)):
+            self.block_background = pygame.Surface(window_size).convert()
+            self.block_background.blits(blocks, False)
+        return self.block_background
+
+    def get_splash_rects(self, outer_margin=30, inner_margin=10):
+        """Return the area of a splash screen, and the area enclosing its outer border."""
         window_size = self.config.get('window_size')
         width = window_size[0] - outer_margin
         height = window_size[1] - outer_margin
@@ -85,17 +193,27 @@ class Renderer:
         expanded_area.width += inner_margin
         expanded_area.height += inner_margin
         expanded_area.center = background_rect.center
+        return background_rect, expanded_area
 
-        self.draw_rect(background_rect, self.config.get('black'))
-        self.draw_rect(background_rect, border_color, 3)
-        self.draw_rect(expanded_area, border_color, 3)
+    def draw_block_background(self):
+        self.display.blit(self.get_block_background(), (0, 0))
 
-        # If we have a background block grid, mark the obscured blocks
-        if len(self.background_block_grid):
-            for row in self.background_block_grid:
-                for block_desc in row:
-                    if background_rect.contains(block_desc['rect']):
-                        block_desc['obfuscated'] = True
+    def draw_splash_background(self, outer_margin=30, inner_margin=10, border_color=(255, 255, 255)):
+        """Draw the block background with a splash screen on top of it, returning the area of the splash screen.
+
+        Both are composed into a single layer the first time a splash screen of this size is drawn, so every
+        frame after that only needs a single blit (until the window gets resized)."""
+        key = (outer_margin, inner_margin, border_color)
+        background_rect, expanded_area = self.get_splash_rects(outer_margin, inner_margin)
+        layer = self.splash_backgrounds.get(key)
+        if layer is None:
+            layer = self.get_block_background().copy()
+            layer.fill(self.config.get('black'), background_rect)
+            pygame.draw.rect(layer, border_color, background_rect, 3)
+            pygame.draw.rect(layer, border_color, expanded_area, 3)
+            self.splash_backgrounds[key] = layer
+
+        self.display.blit(layer, (0, 0))
         return background_rect
 
     def get_distance_from_center(self, position=(0, 0), surface=None):
@@ -107,7 +225,86 @@ class Renderer:
         result[1] = center[1] - position[1]
         return result
 
-    # todo generate surface once and store it instead of doing it every update tick
+    def get_font(self, small=False):
+        return self.small_font if small else self.big_font
+
+    def get_text_surface(self, text, font, color=TEXT_COLOR):
+        """Return the rendered text, from the cache if it was rendered before.
+
+        The cache forgets the least recently used text once its surfaces take up more than text_surfaces_limit bytes."""
+        key = (text, font, color)
+        surface = self.text_surfaces.get(key)
+        if surface is not None:
+            self.text_surfaces.move_to_end(key)
+            return surface
+
+        surface = font.render(text, True, color)
+        self.text_surfaces[key] = surface
+        self.text_surfaces_size += surface.get_pitch() * surface.get_height()
+        while self.text_surfaces_size > self.text_surfaces_limit and len(self.text_surfaces) > 1:
+            evicted = self.text_surfaces.popitem(last=False)[1]
+            self.text_surfaces_size -= evicted.get_pitch() * evicted.get_height()
+        return surface
+
+    def get_text_size(self, text, font):
+        """Measure text without rendering it (measuring isn't free either, so the sizes are cached as well)."""
+        key = (text, font)
+        size = self.text_sizes.get(key)
+        if size is None:
+            if len(self.text_sizes) >= 4096:
+                self.text_sizes = {}
+            size = self.text_sizes[key] = font.size(text)
+        return size
+
+    def get_digit_atlas(self, font, color=TEXT_COLOR):
+        """Return a surface holding the digits 0-9 side by side in equally wide cells, along with the cell width."""
+        key = (font, color)
+        if key not in self.digit_atlases:
+            glyphs = [font.render(digit, True, color) for digit in DIGITS]
+            digit_width = max(glyph.get_width() for glyph in glyphs)
+            atlas = pygame.Surface((digit_width * len(DIGITS), font.get_height()), pygame.SRCALPHA)
+            atlas.fill((0, 0, 0, 0))
+            for index, glyph in enumerate(glyphs):
+                # (the max blend copies the glyph including its alpha, instead of blending it onto the empty atlas)
+                atlas.blit(glyph, ((index * digit_width) + ((digit_width - glyph.get_width()) // 2), 0),
+                           special_flags=pygame.BLEND_RGBA_MAX)
+            self.digit_atlases[key] = (atlas, digit_width)
+        return self.digit_atlases[key]
+
+    def draw_numeric_text(self, text, position, small=False, surface=None):
+        """Draw text containing frequently changing numbers (e.g. the score) at a position.
+
+        The digits are copied from a digit atlas instead of rendering the text again for every new number,
+        every other part of the text comes from the text surface cache. Digits get equally wide cells."""
+        font = self.get_font(small)
+        atlas, digit_width = self.get_digit_atlas(font)
+        text = text.rstrip()
+
+        blits = []
+        x = position[0]
+        y = position[1]
+        start = 0
+        while start < len(text):
+            end = start
+            if text[start] in DIGITS:
+                while end < len(text) and text[end] in DIGITS:
+                    blits.append((atlas, (x, y), pygame.Rect(DIGITS.index(text[end]) * digit_width, 0,
+                                                                 digit_width, atlas.get_height())))
+                    x += digit_width
+                    end += 1
+            else:
+                while end < len(text) and text[end] not in DIGITS:
+                    end += 1
+                text_surface = self.get_text_surface(text[start:end], font)
+                blits.append((text_surface, (x, y)))
+                x += text_surface.get_width()
+            start = end
+
+        if surface is None:
+            surface = self.display
+        surface.blits(blits, False)
+        return pygame.Rect(position[0], position[1], x - position[0], font.get_height())
+
     def draw_centered_text(self, text, offset=(0, 0), small=False, render_surface=None):
         """Draw some text (small or large) on screen."""
 
@@ -120,10 +317,7 @@ class Renderer:
         # Generate the text surfaces, keeping track of how much vertical and horizontal space it occupies.
         total_text_dimensions = [0, 0]
         for line in text:
-            if small:
-                current_surface = self.small_font.render(line, True, (200, 200, 200))
-            else:
-                current_surface = self.big_font.render(line, True, (200, 200, 200))
+            current_surface = self.get_text_surface(line, self.get_font(small))
 
             text_surfaces.append(current_surface)
             text_rect = current_surface.get_rect()
@@ -168,11 +362,11 @@ class Renderer:
         row_height = 0
         row_margin = 20
         if len(headers):
-            row_height = self.big_font.size(headers[0])[1]
+            row_height = self.get_text_size(headers[0], self.big_font)[1]
             number_of_columns = len(headers)
         elif len(entries):
             number_of_columns = len(entries[0])
-            row_height = self.small_font.size(entries[0][0])[1]
+            row_height = self.get_text_size(entries[0][0], self.small_font)[1]
 
         # calculate the width of the columns (width / number_of_columns)
         column_width = table_area.width / number_of_columns
@@ -187,7 +381,7 @@ class Renderer:
         # render the headers
         for header in headers:
             header = str(header)
-            text_size = self.big_font.size(header)
+            text_size = self.get_text_size(header, self.big_font)
             # determine the offset needed to center the text
             text_width_offset = text_size[0] / 2
 
@@ -220,14 +414,14 @@ class Renderer:
                     break
 
                 column_entry = str(column_entry)
-                text_size = self.small_font.size(column_entry)
+                text_size = self.get_text_size(column_entry, self.small_font)
                 text_width_offset = text_size[0] / 2
 
                 # Offset the current draw position to center the text.
                 offset_draw_position = current_draw_position[:]
                 offset_draw_position[0] -= text_width_offset
 
-                if remaining_vertical_space >= self.small_font.size(column_entry)[1]:
+                if remaining_vertical_space >= text_size[1]:
                     self.draw_text(column_entry, offset_draw_position, True)
                 current_draw_position[0] += column_width
             current_draw_position[0] += row_height
@@ -235,14 +429,9 @@ class Renderer:
         return line_rects
 
 
-    def draw_text(self, text, position=None, small=False):
+    def draw_text(self, text, position=None, small=False, surface=None):
         '''Draw some text (small or large) on screen.'''
-        text_surface = None
-
-        if small:
-            text_surface = self.small_font.render(text.rstrip(), True, (200, 200, 200))
-        else:
-            text_surface = self.big_font.render(text.rstrip(), True, (200, 200, 200))
+        text_surface = self.get_text_surface(text.rstrip(), self.get_font(small))
 
         text_rect = text_surface.get_rect()
 
@@ -253,34 +442,12 @@ class Renderer:
             position[1] -= text_surface.get_height() / 2
 
         text_rect.topleft = position
-        self.display.blit(text_surface, text_rect)
+        if surface is None:
+            surface = self.display
+        surface.blit(text_surface, text_rect)
         return text_rect
 
     def pick_random_colors(self, amount=1, allow_streaks=True):
         """Generate an array of random colors (we placed this function in renderer because we also want to use
             it to draw backgrounds."""
-        # global COLORS
-        # select a few random colors
-        result = []
-
-        latest_color = None
-        color_streak_count = 0
-        for i in range(amount):
-            color_accepted = False
-            while not color_accepted:
-                random_color = self.colors[randrange(0, len(self.colors))]
-
-                # 5 percent chance of getting the white color
-                if allow_streaks and random() <= 0.05:
-                    random_color = self.config.get_const('white')
-
-                if random_color != latest_color:
-                    color_streak_count = 0
-                    latest_color = random_color
-                else:
-                    color_streak_count += 1
-
-                if allow_streaks or color_streak_count < 3:
-                    result.append(random_color)
-                    color_accepted = True
-        return result
\ No newline at end of file
+        return pick_random_colors(self.palette.get_colors(), WILDCARD, amount, allow_streaks)
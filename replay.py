@@ -0,0 +1,200 @@
+import json
+import struct
+import zlib
+from bisect import bisect_left
+from engine import GameEngine, MOVE_LEFT, MOVE_RIGHT, ROTATE, SWAP_PIECE, HARD_DROP
+
+# -----------------------------------------------------REPLAY FILES-----------------------------------------------------
+# A replay file contains everything needed to reproduce a game: the seed of its random stream, and the
+# (tick, action) pairs which were applied to it. Periodic keyframes (engine snapshots) are stored as well,
+# so a viewer can jump to any tick by restoring the nearest keyframe instead of re-simulating the whole game.
+#
+# HEADER   = magic, version, flags, seed, board width, board height, keyframe interval
+# TEMPLATES = byte length, followed by the zlib compressed JSON piece templates of the game (see also: pieces.py)
+# EVENTS   = byte length, followed by (tick delta as a varint, action code as a single byte) pairs
+# KEYFRAMES = zlib compressed JSON engine snapshots, one after the other
+# INDEX    = number of keyframes, followed by a (tick, offset, length) entry for every keyframe
+# TRAILER  = total number of ticks, offset of the index, magic
+# ----------------------------------------------------------------------------------------------------------------------
+
+MAGIC = b'BBRP'
+INDEX_MAGIC = b'BBIX'
+VERSION = 3  # (version 1 keyframes stored RGB colors instead of color indexes, version 2 had no templates)
+
+HEADER_FORMAT = '<4sBBQHHI'
+INDEX_ENTRY_FORMAT = '<IQI'
+TRAILER_FORMAT = '<IQ4s'
+
+FLAG_ANIMATE_CASCADES = 1
+
+ACTION_CODES = {
+    MOVE_LEFT: 1,
+    MOVE_RIGHT: 2,
+    ROTATE: 3,
+    SWAP_PIECE: 4,
+    HARD_DROP: 5
+}
+ACTIONS = {code: action for action, code in ACTION_CODES.items()}
+
+
+def encode_varint(value):
+    result = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            result.append(byte | 0x80)
+        else:
+            result.append(byte)
+            return bytes(result)
+
+
+def decode_varint(data, offset):
+    """Decode a varint starting at offset, returning the value and the offset of the next byte."""
+    result = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, offset
+        shift += 7
+
+
+class ReplayRecorder:
+    """Records the actions applied to an engine, along with a keyframe every keyframe_interval ticks."""
+    def __init__(self, engine, keyframe_interval=500):
+        self.engine = engine
+        self.keyframe_interval = keyframe_interval
+        self.seed = engine.seed
+        self.board_width = engine.board_width
+        self.board_height = engine.board_height
+        self.templates = engine.templates
+        self.animate_cascades = engine.animate_cascades
+
+        self.events = bytearray()
+        self.last_event_tick = 0
+        self.keyframes = []  # (tick, compressed snapshot) pairs
+        self.total_ticks = engine.tick_count
+
+        engine.recorder = self
+
+    def record_action(self, tick, action):
+        if action not in ACTION_CODES:
+            return
+        self.events += encode_varint(tick - self.last_event_tick)
+        self.events.append(ACTION_CODES[action])
+        self.last_event_tick = tick
+
+    def record_tick(self, engine):
+        self.total_ticks = engine.tick_count
+        if engine.tick_count % self.keyframe_interval == 0:
+            snapshot = json.dumps(engine.get_snapshot(), separators=(',', ':')).encode()
+            self.keyframes.append((engine.tick_count, zlib.compress(snapshot)))
+
+    def save(self, path):
+        flags = FLAG_ANIMATE_CASCADES if self.animate_cascades else 0
+        with open(path, 'wb') as file:
+            file.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, flags, self.seed, self.board_width,
+                                   self.board_height, self.keyframe_interval))
+            templates = zlib.compress(json.dumps(self.templates, separators=(',', ':')).encode())
+            file.write(struct.pack('<I', len(templates)))
+            file.write(templates)
+            file.write(struct.pack('<I', len(self.events)))
+            file.write(self.events)
+
+            index = []
+            for tick, data in self.keyframes:
+                index.append((tick, file.tell(), len(data)))
+                file.write(data)
+
+            index_offset = file.tell()
+            file.write(struct.pack('<I', len(index)))
+            for entry in index:
+                file.write(struct.pack(INDEX_ENTRY_FORMAT, *entry))
+            file.write(struct.pack(TRAILER_FORMAT, self.total_ticks, index_offset, INDEX_MAGIC))
+
+
+class ReplayPlayer:
+    """Plays back a replay file on a headless engine, as fast as possible."""
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            data = file.read()
+
+        header_size = struct.calcsize(HEADER_FORMAT)
+        magic, version, flags, self.seed, self.board_width, self.board_height, self.keyframe_interval = \
+            struct.unpack_from(HEADER_FORMAT, data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not a (supported) replay file' % path)
+        self.animate_cascades = bool(flags & FLAG_ANIMATE_CASCADES)
+
+        templates_length = struct.unpack_from('<I', data, header_size)[0]
+        offset = header_size + 4
+        self.templates = json.loads(zlib.decompress(data[offset:offset + templates_length]))
+        offset += templates_length
+
+        # decode the events
+        events_length = struct.unpack_from('<I', data, offset)[0]
+        offset += 4
+        events_end = offset + events_length
+        self.event_ticks = []
+        self.event_actions = []
+        tick = 0
+        while offset < events_end:
+            delta, offset = decode_varint(data, offset)
+            tick += delta
+            self.event_ticks.append(tick)
+            self.event_actions.append(ACTIONS[data[offset]])
+            offset += 1
+
+        # read the keyframe index (the keyframes themselves are only loaded when needed)
+        self.total_ticks, index_offset, index_magic = struct.unpack_from(
+            TRAILER_FORMAT, data, len(data) - struct.calcsize(TRAILER_FORMAT))
+        if index_magic != INDEX_MAGIC:
+            raise ValueError('%s has no keyframe index' % path)
+
+        keyframe_count = struct.unpack_from('<I', data, index_offset)[0]
+        entry_size = struct.calcsize(INDEX_ENTRY_FORMAT)
+        self.keyframe_index = [struct.unpack_from(INDEX_ENTRY_FORMAT, data, index_offset + 4 + (i * entry_size))
+                               for i in range(keyframe_count)]
+
+    def create_engine(self):
+        engine = GameEngine(self.board_width, self.board_height, seed=self.seed, templates=self.templates)
+        engine.animate_cascades = self.animate_cascades
+        engine.start()
+        return engine
+
+    def load_keyframe(self, entry):
+        with open(self.path, 'rb') as file:
+            file.seek(entry[1])
+            return json.loads(zlib.decompress(file.read(entry[2])))
+
+    def apply_actions(self, engine):
+        """Apply the actions which were recorded at the current tick of the engine."""
+        index = bisect_left(self.event_ticks, engine.tick_count)
+        while index < len(self.event_ticks) and self.event_ticks[index] == engine.tick_count:
+            engine.step(self.event_actions[index])
+            index += 1
+
+    def run(self, engine, tick):
+        """Run an engine up to (and including the actions of) a given tick."""
+        self.apply_actions(engine)
+        while engine.tick_count < tick:
+            engine.tick()
+            self.apply_actions(engine)
+        return engine
+
+    def play(self, tick=None):
+        """Play the replay from the start, returning the engine after the last (or given) tick."""
+        return self.run(self.create_engine(), self.total_ticks if tick is None else tick)
+
+    def seek(self, tick):
+        """Return the engine at a given tick, starting from the nearest keyframe before it."""
+        engine = self.create_engine()
+        keyframe_ticks = [entry[0] for entry in self.keyframe_index]
+        position = bisect_left(keyframe_ticks, tick + 1) - 1
+        if position >= 0:
+            engine.restore_snapshot(self.load_keyframe(self.keyframe_index[position]))
+        return self.run(engine, tick)
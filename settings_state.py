@@ -36,7 +36,6 @@ class SettingsState(state.State):
 
     def render(self):
         # blank out the screen with blocks, but a splash screen on top of it
-        self.renderer.draw_block_background()
         splash_rect = self.renderer.draw_splash_background()
 
 
@@ -69,12 +68,6 @@ class SettingsState(state.State):
 
                     self.config.select_next_setting(selected_setting_name)
 
-                    if selected_setting_name == 'window_size':
-                        self.config.set_const('recently_resized', True)
-                        self.renderer.resize()
-                    elif selected_setting_name == 'background_music':
-                        self.config.set_const('music_settings_adjusted', True)
-
                     self.translate_keys()
                 elif event.key == K_DOWN:
                     # increase selected option with wrap around
@@ -87,6 +80,9 @@ class SettingsState(state.State):
                 elif event.key == self.config.get_key('back_button'):
                     self.state_manager.pop_state()
 
+    def get_idle_timeout(self):
+        return 0  # (nothing moves here, the screen only changes on input)
+
     def enter(self):
         self.logger.info('Enter: Settings')
         self.translate_keys()
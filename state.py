@@ -1,5 +1,9 @@
+import pygame
 from globals import *
 
+# the events a state can change on, any other input (e.g. moving the mouse) doesn't make an idle state draw again
+REDRAW_EVENTS = (pygame.QUIT, pygame.KEYDOWN, pygame.KEYUP, pygame.VIDEOEXPOSE, pygame.VIDEORESIZE)
+
 class State:
     def __init__(self):
         self.renderer = None
@@ -19,6 +23,13 @@ class State:
     def update(self, elapsed_time):
         self.logger.info('state run called')
 
+    def get_idle_timeout(self):
+        """How long (in milliseconds) the state can wait for input before it has to be updated again, 0 to wait
+        indefinitely. States which change by themselves return None, those are updated and drawn every frame.
+
+        Idle states are only drawn again when something changed (see also: StateManager.update())."""
+        return None
+
     def enter(self):
         self.logger.info('state enter called')
 
@@ -33,6 +44,16 @@ class StateManager:
         self.config = configuration
         self.state_stack = []
 
+        # the states are updated in fixed steps, whatever the frame rate (see also: update())
+        self.step_size = 5  # milliseconds per update
+        self.max_steps_per_frame = 50  # when a frame took longer than this many steps, the rest of it is dropped
+        self.accumulated_time = 0  # time which passed but wasn't stepped through yet
+
+        # idle states (see also: State.get_idle_timeout()) sleep until there is input, instead of being drawn again
+        # every frame without anything having changed
+        self.idle_time = 0  # milliseconds spent waiting for input during the last frame
+        self.rendered_state = None
+
     def get_active_state(self):
         stack_length = len(self.state_stack)
         if not stack_length:
@@ -59,10 +80,67 @@ class StateManager:
         self.push_state(state)
 
     def update(self, elapsed_time):
+        """Update the active state in as many fixed steps as fit in the elapsed time, then render it.
+
+        Leftover time is kept for the next frame, so the game runs at the same pace at any frame rate. After a
+        very long frame (e.g. while the window was being dragged around) the game slows down instead of racing
+        through the backlog.
+
+        An idle state is updated once input arrives, and only rendered when that input could have changed it (the
+        frame is skipped otherwise, see also: Renderer.skip_frame())."""
+        # (time spent waiting for input doesn't count, a game continued from the menu shouldn't make up for it)
+        elapsed_time = max(elapsed_time - self.idle_time, 0)
+        self.idle_time = 0
+
         active_state = self.get_active_state()
-        if active_state:
-            active_state.update(elapsed_time)
+        if not active_state:
+            return False
+
+        self.accumulated_time += elapsed_time
+        steps = int(self.accumulated_time // self.step_size)
+        self.accumulated_time -= steps * self.step_size
+
+        redraw_required = True
+        idle_timeout = active_state.get_idle_timeout()
+        if idle_timeout is not None:
+            redraw_required = self.wait_for_input(idle_timeout)
+            steps = max(steps, 1)  # (whatever arrived gets handled right away)
+
+        for step in range(min(steps, self.max_steps_per_frame)):
+            active_state = self.get_active_state()
+            if not active_state:
+                return False
+            active_state.update(self.step_size)
+
+        active_state = self.get_active_state()
+        if not active_state:
+            return False
+
+        if redraw_required or active_state is not self.rendered_state or self.renderer.full_redraw_required:
             active_state.render()
-            return True
+            self.rendered_state = active_state
         else:
-            return False
+            self.renderer.skip_frame()
+        return True
+
+    def wait_for_input(self, timeout):
+        """Sleep until there are events to handle, or until the timeout (in milliseconds, 0 waits indefinitely) runs
+        out. Returns whether the state should be drawn again: when the timeout ran out (the state has something to
+        show by then), or when the events could have changed it (see also: REDRAW_EVENTS)."""
+        # (the events are taken off the queue and put back in the same order, the state handles them after this...
+        # pygame.event.peek() can't be used to look at them, it loses the attributes of posted events)
+        events = pygame.event.get()
+        if not events:
+            start = pygame.time.get_ticks()
+            event = pygame.event.wait(timeout)
+            self.idle_time += pygame.time.get_ticks() - start
+            if event.type == pygame.NOEVENT:
+                return True
+            events = [event] + pygame.event.get()
+        for event in events:
+            pygame.event.post(event)
+
+        event_types = set(event.type for event in events)
+        if pygame.VIDEOEXPOSE in event_types:
+            self.renderer.request_full_redraw()  # (the window was uncovered, all of it has to be presented again)
+        return not event_types.isdisjoint(REDRAW_EVENTS)
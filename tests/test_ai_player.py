@@ -0,0 +1,24 @@
+from engine import GameEngine
+from ai_player import SearchPlayer, create_search_board
+
+
+def test_placement_values_follow_the_muligans():
+    # the muligans left add to the points of every match, so the placements of a piece on the same board are worth
+    # more with muligans left than without (see also: SearchBoard.resolve())
+    engine = GameEngine(seed=0)
+    engine.start()
+    while not len(engine.controlled_blocks):
+        engine.tick()
+    player = SearchPlayer()
+    board = create_search_board(engine, player.get_keys(engine))
+
+    values = {}
+    for muligans in (0, 5, 0):
+        engine.muligans = muligans
+        fresh_player = SearchPlayer()
+        fresh_player.get_keys(engine)
+        expected = fresh_player.get_placement_values(engine, board, engine.piece, engine.colorized_template)
+        values[muligans] = player.get_placement_values(engine, board, engine.piece, engine.colorized_template)
+        assert values[muligans] == expected
+    assert values[0] != values[5]
+    assert player.table.hits == 1
@@ -0,0 +1,13 @@
+import argparse
+import balance_simulator
+
+
+def test_both_match_engines_give_the_same_results(monkeypatch):
+    # (in these games a barricade comes down on top of the settled blocks, see also: ColumnStacks)
+    options = argparse.Namespace(policy='greedy', reaction_time=150, max_ticks=6000)
+    for seed in (25, 36):
+        rows = []
+        for match_engine in ('scanner', 'bitboard'):
+            monkeypatch.setattr(balance_simulator, 'MATCH_ENGINE', match_engine)
+            rows.append(balance_simulator.play_game((0, {}, seed, options)))
+        assert rows[0] == rows[1]
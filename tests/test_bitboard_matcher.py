@@ -0,0 +1,55 @@
+import random
+import pytest
+from bitboard_matcher import BitboardMatcher
+from engine import GameEngine
+from palette import WILDCARD
+
+
+def fill_random_board(engine, rng):
+    """Scatter fixated blocks over the board, with a random density and a random mix of colors and wildcards."""
+    colors = [2, 3, 4]
+    density = rng.random()
+    for column in range(engine.board_width):
+        for row in range(engine.board_height):
+            if rng.random() < density:
+                color = rng.choice(colors[:rng.randint(1, 3)] + [WILDCARD] * rng.randint(0, 2))
+                engine.add_block_descriptor(engine.fixated_blocks, color, column, row)
+    engine.landed_cells = set((column, row) for column in range(engine.board_width)
+                              for row in range(engine.board_height) if rng.random() < 0.2)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_bitboards_find_the_same_matches_as_the_scanner(seed):
+    # odd seeds get a small board of a random size (lines of a single tile, boards narrower than a streak, ...)
+    for board in range(50):
+        rng = random.Random(seed * 50 + board)
+        size = (rng.randint(1, 12), rng.randint(1, 12)) if seed % 2 else (16, 20)
+        engine = GameEngine(*size, seed=seed)
+        fill_random_board(engine, rng)
+
+        bitboard_matches = engine.get_bitboard_matcher().find_matches(engine.landed_cells)
+        engine.scan_color_matches()
+        scanned_matches = set((block.column, block.row) for block in engine.fading_tiles)
+        assert set(bitboard_matches) == scanned_matches
+        assert len(bitboard_matches) == len(scanned_matches)
+
+
+def test_shared_tiles_have_the_color_of_the_top_block():
+    # (a barricade can come down on top of the settled blocks, see also: ColumnStacks)
+    matcher = BitboardMatcher(4, 1, WILDCARD)
+    for column in range(3):
+        matcher.add_tile(2, column, 0)
+    matcher.add_tile(3, 3, 0)
+    matcher.add_tile(2, 3, 0)
+    assert sorted(matcher.find_matches([(3, 0)])) == [(0, 0), (1, 0), (2, 0), (3, 0)]
+
+    matcher.remove_tile(3, 3, 0)  # (the block underneath goes, the top block stays)
+    assert sorted(matcher.find_matches([(3, 0)])) == [(0, 0), (1, 0), (2, 0), (3, 0)]
+
+    matcher.add_tile(3, 3, 0)
+    matcher.remove_tile(3, 3, 0)  # (the top block goes, the one underneath shows)
+    assert sorted(matcher.find_matches([(3, 0)])) == [(0, 0), (1, 0), (2, 0), (3, 0)]
+
+    matcher.remove_tile(2, 3, 0)
+    assert matcher.find_matches([(3, 0)]) == []
+    assert not matcher.occupied_board & matcher.get_bit(3, 0)
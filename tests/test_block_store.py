@@ -0,0 +1,46 @@
+import pytest
+from block_store import Block, BlockStore
+from occupancy_grid import FIXATED
+
+
+def test_migrate_moves_a_block_between_lists():
+    store = BlockStore(4, 4)
+    block = Block(2, 1, 3)
+    store.falling.append(block)
+    store.migrate(store.falling, store.fixated, block)
+    assert list(store.falling) == []
+    assert list(store.fixated) == [block]
+    assert store.fixated.find((1, 3)) is block
+    assert not store.falling.contains((1, 3))
+
+
+def test_migrate_refuses_blocks_from_another_list():
+    store = BlockStore(4, 4)
+    block = Block(2, 1, 3)
+    store.fixated.append(block)
+    with pytest.raises(ValueError):
+        store.migrate(store.falling, store.fading, block)
+    assert list(store.fixated) == [block]
+    assert list(store.fading) == []
+
+
+def test_blocks_sharing_a_tile_are_removed_one_by_one():
+    store = BlockStore(4, 4)
+    first, second = Block(2, 1, 3), Block(3, 1, 3)
+    store.fixated.append(first)
+    store.fixated.append(second)
+    assert store.fixated.find_all((1, 3)) == [first, second]
+
+    store.fixated.remove(first)
+    assert store.fixated.find_all((1, 3)) == [second]
+    store.fixated.remove(second)
+    assert not store.fixated.contains((1, 3))
+
+
+def test_removing_a_block_which_isnt_on_the_grid_fails():
+    store = BlockStore(4, 4)
+    block = Block(2, 1, 3)
+    store.fixated.append(block)
+    with pytest.raises(ValueError):
+        store.occupancy.remove(FIXATED, Block(3, 1, 3))
+    assert store.fixated.find((1, 3)) is block
@@ -0,0 +1,92 @@
+import pytest
+from block_store import Block
+from column_stacks import ColumnStacks
+from engine import GameEngine
+
+
+def fill_column(engine, column, colors):
+    """Stack fixated blocks in a column, from the bottom of the board up."""
+    for index, color in enumerate(colors):
+        engine.add_block_descriptor(engine.fixated_blocks, color, column, engine.board_height - 1 - index)
+        engine.column_stacks.push(engine.fixated_blocks[-1])
+
+
+def test_push_keeps_the_block_which_landed_first():
+    stacks = ColumnStacks(1, 4)
+    first = Block(2, 0, 3)
+    stacks.push(first)
+    stacks.push(Block(3, 0, 3))
+    assert stacks.stacks[0] == [first]
+    assert stacks.get_landing_row(0) == 2
+
+
+def test_cut_skips_empty_slots():
+    stacks = ColumnStacks(1, 4)
+    hanging = Block(2, 0, 1)
+    stacks.push(hanging)
+    assert stacks.stacks[0] == [None, None, hanging]
+    assert stacks.get_landing_row(0) == 0
+
+    assert stacks.get_landing_row(0, 2) == 3  # (a block under the hanging one falls into the empty slots)
+    assert stacks.get_landing_row(0, 1) == 3  # (and so does a block which shared its tile)
+
+    assert stacks.cut(0, 1) == [hanging]
+    assert stacks.stacks[0] == []
+
+
+def test_barricade_landing_on_a_full_column():
+    engine = GameEngine(board_width=1, board_height=6, seed=0)
+    fill_column(engine, 0, [2, 3, 2, 3, 2])  # rows 5 up to 1 (no four of a kind, so nothing gets matched)
+    shared = engine.fixated_blocks.find((0, 1))
+
+    # the barricade comes down on top of the column: its bottom row shares a tile with the topmost block
+    engine.spawn_barricade(2)
+    while len(engine.falling_blocks):
+        engine.update_board()
+    barricade = [block for block in engine.fixated_blocks.find_all((0, 1)) if block is not shared][0]
+    assert len(engine.fixated_blocks) == 7
+    assert engine.column_stacks.get_landing_row(0) == -1
+
+    # clearing the bottom tile detaches the block which landed first, the barricade block stays on the tile
+    engine.migrate_block(engine.fixated_blocks, engine.fading_tiles, engine.fixated_blocks.find((0, 5)))
+    engine.clear_fading_tiles()
+    assert shared.state == engine.falling_blocks.state
+    assert barricade.state == engine.fixated_blocks.state
+    assert engine.column_stacks.get_landing_row(0) == 0
+
+    # everything below the barricade block falls into place, after which the column is an unbroken stack again
+    while len(engine.falling_blocks):
+        engine.update_board()
+    assert len(engine.fixated_blocks) == 6
+    assert not len(engine.fading_tiles)
+    assert sorted((block.row for block in engine.column_stacks.stacks[0]), reverse=True) == [5, 4, 3, 2, 1, 0]
+    assert sorted(block.row for block in engine.fixated_blocks) == [0, 1, 2, 3, 4, 5]
+
+
+@pytest.mark.parametrize('drop', ('animated', 'drop_falling_blocks', 'hard_drop'))
+def test_blocks_under_a_hanging_block_settle(drop):
+    # (the column of the test above, next to an empty one)
+    engine = GameEngine(board_width=2, board_height=6, seed=0)
+    fill_column(engine, 0, [2, 3, 2, 3, 2])
+    engine.spawn_barricade(2)
+    while len(engine.falling_blocks):
+        engine.update_board()
+    assert len(engine.fixated_blocks.find_all((0, 1))) == 2
+
+    engine.migrate_block(engine.fixated_blocks, engine.fading_tiles, engine.fixated_blocks.find((0, 5)))
+    engine.clear_fading_tiles()
+    assert len(engine.falling_blocks) == 5  # (everything in the column but the barricade block on the shared tile)
+    if drop == 'animated':
+        while len(engine.falling_blocks):
+            engine.update_board()
+    elif drop == 'drop_falling_blocks':
+        engine.drop_falling_blocks()
+    else:
+        # (the piece drops into the empty column, the falling blocks land before it does)
+        engine.add_block_descriptor(engine.controlled_blocks, 4, 1, 0)
+        engine.hard_drop()
+        assert engine.fixated_blocks.find((1, 3)).color == 4
+
+    assert not len(engine.falling_blocks)
+    assert sorted(block.row for block in engine.fixated_blocks if block.column == 0) == [0, 1, 2, 3, 4, 5]
+    assert [block.row for block in engine.column_stacks.stacks[0]] == [5, 4, 3, 2, 1, 0]
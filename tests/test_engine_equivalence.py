@@ -0,0 +1,449 @@
+import random
+import pytest
+from collections import Counter
+from engine import GameEngine, MOVE_LEFT, MOVE_RIGHT, ROTATE, SWAP_PIECE, pick_random_colors
+from palette import EMPTY, WILDCARD, COLORS
+
+# -------------------------------------------------ENGINE EQUIVALENCE---------------------------------------------------
+# The game rules as they were before the block lists, occupancy grid, column stacks and match engines were added
+# (a port of the original GameState, with lists of dicts and scans over the whole board), played side by side with
+# the GameEngine on the same seeds and the same actions. The boards have to be identical after every tick.
+#
+# Only the bookkeeping was changed while porting: colors are palette indexes, random numbers come from the seeded
+# random stream of the game (in the same order as the engine draws them), and the board gets updated in ticks
+# (clear the fading tiles or update the board, then spawn something when nothing is moving).
+# ----------------------------------------------------------------------------------------------------------------------
+
+TEMPLATES = [
+    [
+        (0, 1, 1),
+        (0, 1, 0),
+        (0, 1, 0)
+    ],
+    [
+        (0, 1, 0),
+        (1, 1, 1)
+    ],
+    [
+        (1, 1, 0),
+        (0, 1, 1)
+    ],
+    [
+        (1, 1),
+        (1, 1)
+    ]
+]
+
+
+class ReferenceGame:
+    """The original rules of the game (see the top of this file)."""
+    def __init__(self, seed, board_width=16, board_height=20):
+        self.random = random.Random(seed)
+        self.templates = TEMPLATES
+        self.points_per_block = 5
+        self.board_height = board_height
+        self.board_width = board_width
+        self.game_over = False
+        self.color_grid = []
+
+        self.score = 0
+        self.level = 1
+        self.update_speed = 500
+        self.muligans = 0
+        self.piece_position = [6, 0]
+
+        self.fixated_blocks = []
+        self.falling_blocks = []
+        self.controlled_blocks = []
+        self.fading_tiles = []
+        self.tiles_to_be_reset = []
+        self.dirty_rows = []
+        self.dirty_columns = []
+        self.dirty_diag_ne = []
+        self.dirty_diag_nw = []
+
+        self.last_barricade_level = 0
+        self.number_of_spawned_pieces = 0
+        self.colorized_template = []
+        self.next_colorized_template = []
+
+    def start(self):
+        self.generate_next_colorized_template()
+        self.spawn_barricade(3)
+
+    def step(self, action):
+        if action == MOVE_LEFT:
+            self.move_piece((-1, 0))
+        elif action == MOVE_RIGHT:
+            self.move_piece((1, 0))
+        elif action == ROTATE:
+            self.rotate_piece()
+        elif action == SWAP_PIECE:
+            if self.muligans > 0:
+                self.muligans -= 1
+                self.generate_next_colorized_template()
+
+    def tick(self):
+        if len(self.fading_tiles):
+            self.tiles_to_be_reset = list(self.fading_tiles)
+            self.fading_tiles.clear()
+            self.remove_marked_tiles()
+        else:
+            self.update_board()
+
+        if not (len(self.falling_blocks) or len(self.controlled_blocks)):
+            if self.level - self.last_barricade_level == 4:
+                self.spawn_barricade()
+            else:
+                self.spawn_new_piece()
+
+    def pick_random_colors(self, amount=1, allow_streaks=True):
+        return pick_random_colors(COLORS, WILDCARD, amount, allow_streaks, self.random)
+
+    def add_block_descriptor(self, block_list, color, column, row):
+        block_list.append({
+            'color': color,
+            'column': column,
+            'row': row
+        })
+
+    def migrate_block(self, from_block_list, to_block_list, block):
+        to_block_list.append(block)
+        self.remove_from_block_list(from_block_list, block)
+
+    def find_fixated_blocks_above_point(self, coordinate):
+        result = []
+        for block in self.fixated_blocks:
+            if block['column'] == coordinate[0] and block['row'] < coordinate[1]:
+                result.append(block)
+        return result
+
+    def remove_from_block_list(self, block_list, block_to_remove):
+        for block in list(block_list):
+            if block['column'] == block_to_remove['column'] and block['row'] == block_to_remove['row']:
+                block_list.remove(block)
+                break
+
+    def is_in_block_list(self, block_list, coordinate):
+        for block in block_list:
+            if block['column'] == coordinate[0] and block['row'] == coordinate[1]:
+                return True
+        return False
+
+    def is_within_bounds(self, coordinate):
+        return 0 <= coordinate[0] < self.board_width and 0 <= coordinate[1] < self.board_height
+
+    def detach_block(self, block):
+        if not self.is_in_block_list(self.falling_blocks, (block['column'], block['row'])):
+            self.migrate_block(self.fixated_blocks, self.falling_blocks, block)
+
+    def rotate_matrix(self, matrix):
+        matrix[:] = [[column[i] for column in reversed(matrix)] for i in range(len(matrix[0]))]
+
+    def is_vacant_tile(self, coordinate):
+        if not self.is_within_bounds(coordinate):
+            return False
+        return not self.is_in_block_list(self.fixated_blocks, coordinate)
+
+    def find_furthest_diagonal_point(self, starting_point, direction):
+        current = starting_point[:]
+        last_valid_coordinate = None
+        while self.is_within_bounds(current):
+            last_valid_coordinate = current[:]
+            current[0] += direction[0]
+            current[1] += direction[1]
+        return last_valid_coordinate
+
+    def increase_score(self, increase=0):
+        self.score += increase
+        self.score += self.muligans * 5
+
+    def remove_marked_tiles(self):
+        lowest_vacated_slots = {}
+        score_increase = 0
+        for block in self.tiles_to_be_reset:
+            score_increase += self.points_per_block
+            column = block['column']
+            row = block['row']
+            if column not in lowest_vacated_slots or lowest_vacated_slots[column] < row:
+                lowest_vacated_slots[column] = row
+        self.tiles_to_be_reset.clear()
+
+        for column in lowest_vacated_slots:
+            for block in self.find_fixated_blocks_above_point((column, lowest_vacated_slots[column])):
+                self.detach_block(block)
+
+        if score_increase:
+            self.increase_score(score_increase)
+
+    def move_piece(self, direction=(1, 0)):
+        for block in self.controlled_blocks:
+            desired_coordinate = (block['column'] + direction[0], block['row'])
+            if not self.is_vacant_tile(desired_coordinate) or \
+                    self.is_in_block_list(self.falling_blocks, desired_coordinate):
+                return
+
+        self.piece_position[0] += direction[0]
+        for block in self.controlled_blocks:
+            block['column'] += direction[0]
+
+    def spawn_area_available(self, template=None):
+        if template is None:
+            template = self.colorized_template
+
+        for row in range(self.piece_position[1], self.piece_position[1] + len(template)):
+            for column in range(self.piece_position[0], self.piece_position[0] + len(template[0])):
+                if not self.is_vacant_tile((column, row)) or self.is_in_block_list(self.falling_blocks, (column, row)):
+                    return False
+        return True
+
+    def spawn_barricade(self, rows=None):
+        if len(self.falling_blocks) or len(self.controlled_blocks):
+            return
+
+        number_of_rows = 2 + (self.level // 50) if rows is None else rows
+        for row in range(number_of_rows):
+            chosen_colors = self.pick_random_colors(self.board_width, False)
+            for column in range(self.board_width):
+                self.add_block_descriptor(self.falling_blocks, chosen_colors[column], column, row)
+
+        self.last_barricade_level = self.level
+
+    def spawn_new_piece(self):
+        self.colorized_template = list(self.next_colorized_template)
+        self.piece_position = [6, 0]
+        if self.spawn_area_available():
+            self.generate_next_colorized_template()
+            self.generate_controlled_blocks_from_colorized_template()
+            self.muligans = 5
+        else:
+            self.game_over = True
+
+    def rotate_piece(self):
+        rotated_matrix = list(self.colorized_template)
+        if not len(rotated_matrix):
+            return
+        self.rotate_matrix(rotated_matrix)
+
+        if self.spawn_area_available(rotated_matrix):
+            self.colorized_template = rotated_matrix
+            self.generate_controlled_blocks_from_colorized_template()
+
+    def generate_next_colorized_template(self):
+        self.next_colorized_template = []
+        piece_template_index = self.random.randrange(0, len(self.templates))
+        chosen_colors = self.pick_random_colors(1 + (self.level // 10))
+
+        for row in range(len(self.templates[piece_template_index])):
+            self.next_colorized_template.append([])
+            for column in range(len(self.templates[piece_template_index][row])):
+                generated_color = EMPTY
+                if self.templates[piece_template_index][row][column] == 1:
+                    generated_color = chosen_colors[self.random.randrange(0, len(chosen_colors))]
+                self.next_colorized_template[row].append(generated_color)
+
+    def generate_controlled_blocks_from_colorized_template(self):
+        self.controlled_blocks = []
+        spawn_coord = list(self.piece_position)
+        for row in range(len(self.colorized_template)):
+            for column in range(len(self.colorized_template[0])):
+                if self.colorized_template[row][column] != EMPTY and self.is_vacant_tile(spawn_coord):
+                    self.add_block_descriptor(self.controlled_blocks, self.colorized_template[row][column],
+                                              spawn_coord[0], spawn_coord[1])
+                spawn_coord[0] += 1
+            spawn_coord[1] += 1
+            spawn_coord[0] = self.piece_position[0]
+
+        self.number_of_spawned_pieces += 1
+        self.level = (self.number_of_spawned_pieces // 20) + 1
+        self.update_speed = max(500 - ((self.level // 3) * 50), 200)
+
+    def move_blocks_down(self, block_list):
+        collision_occured = False
+        for block in sorted(block_list, key=lambda x: x['row'], reverse=True):
+            destination = (block['column'], block['row'] + 1)
+            if self.is_vacant_tile(destination):
+                block['row'] += 1
+            else:
+                collision_occured = True
+                self.fixated_blocks.append(block)
+
+                block_coordinate = [block['column'], block['row']]
+                diag_point_south_west = self.find_furthest_diagonal_point(block_coordinate, (-1, 1))
+                diag_point_south_east = self.find_furthest_diagonal_point(block_coordinate, (1, 1))
+                if not self.is_in_block_list(self.dirty_diag_ne, diag_point_south_west):
+                    self.add_block_descriptor(self.dirty_diag_ne, EMPTY, *diag_point_south_west)
+                if not self.is_in_block_list(self.dirty_diag_nw, diag_point_south_east):
+                    self.add_block_descriptor(self.dirty_diag_nw, EMPTY, *diag_point_south_east)
+                if block['row'] not in self.dirty_rows:
+                    self.dirty_rows.append(block['row'])
+                if block['column'] not in self.dirty_columns:
+                    self.dirty_columns.append(block['column'])
+
+                block_list.remove(block)
+        return collision_occured
+
+    def mark_matches(self, starting_point=0, direction=(1, 0)):
+        current_streak = []
+        last_tile_checked = None
+
+        def flush_streak(current_color):
+            nonlocal current_streak
+            if len(current_streak) > 3 and current_color is not None:
+                for block in current_streak:
+                    if not self.is_in_block_list(self.fading_tiles, (block['column'], block['row'])):
+                        self.migrate_block(self.fixated_blocks, self.fading_tiles, block)
+            current_streak = []
+
+        def run_scan(scan_starting_point, scan_direction):
+            nonlocal last_tile_checked
+            current_streak_color = None
+            wildcard_encountered = False
+
+            coordinate_to_check = list(scan_starting_point)
+            while self.is_within_bounds(coordinate_to_check):
+                tile_to_check = self.color_grid[coordinate_to_check[0]][coordinate_to_check[1]]
+                last_tile_checked = coordinate_to_check[:]
+
+                if tile_to_check != EMPTY:
+                    if tile_to_check != WILDCARD:
+                        if current_streak_color is None:
+                            current_streak_color = tile_to_check
+                        elif current_streak_color != tile_to_check:
+                            flush_streak(current_streak_color)
+                            current_streak_color = tile_to_check
+                    else:
+                        wildcard_encountered = True
+                    self.add_block_descriptor(current_streak, tile_to_check, *coordinate_to_check)
+                else:
+                    flush_streak(current_streak_color)
+                    current_streak_color = None
+
+                coordinate_to_check[0] += scan_direction[0]
+                coordinate_to_check[1] += scan_direction[1]
+
+            flush_streak(current_streak_color)
+            return wildcard_encountered
+
+        if run_scan(starting_point, direction):
+            run_scan(last_tile_checked, (-direction[0], -direction[1]))
+
+    def update_board(self):
+        self.move_blocks_down(self.falling_blocks)
+
+        piece_collision = self.move_blocks_down(self.controlled_blocks)
+        self.piece_position[1] += 1
+        if piece_collision:
+            self.falling_blocks += self.controlled_blocks
+            self.controlled_blocks = []
+
+        if not len(self.falling_blocks):
+            self.collect_color_matches()
+
+        self.remove_marked_tiles()
+
+    def collect_color_matches(self):
+        self.color_grid = [[EMPTY for row in range(self.board_height)] for column in range(self.board_width)]
+        for block in self.fixated_blocks:
+            self.color_grid[block['column']][block['row']] = block['color']
+
+        for block in self.dirty_diag_ne:
+            self.mark_matches([block['column'], block['row']], (1, -1))
+        for block in self.dirty_diag_nw:
+            self.mark_matches([block['column'], block['row']], (-1, -1))
+        for row in self.dirty_rows:
+            self.mark_matches([0, row], (1, 0))
+        for column in self.dirty_columns:
+            self.mark_matches([column, 0], (0, 1))
+
+        self.dirty_diag_ne = []
+        self.dirty_diag_nw = []
+        self.dirty_columns = []
+        self.dirty_rows = []
+
+
+def describe(block_list, key):
+    """The contents of a block list as a multiset (several blocks can share a tile)."""
+    return Counter(key(block) for block in block_list)
+
+
+def get_tile(block):
+    # fading tiles are compared without their colors: when blocks share a tile, the original rules fade a copy of
+    # the tile (in the color of the block which landed last), the engine fades the block which landed first
+    # (see also: GameEngine.fade_settled_block()). Either way the block which landed last is left on the tile.
+    if isinstance(block, dict):
+        return block['column'], block['row']
+    return block.column, block.row
+
+
+def describe_reference(game):
+    def key(block):
+        return block['color'], block['column'], block['row']
+
+    return {
+        'fixated': describe(game.fixated_blocks, key),
+        'falling': describe(game.falling_blocks, key),
+        'controlled': describe(game.controlled_blocks, key),
+        'fading': describe(game.fading_tiles, get_tile),
+        'score': game.score,
+        'level': game.level,
+        'muligans': game.muligans,
+        'game_over': game.game_over
+    }
+
+
+def describe_engine(engine):
+    def key(block):
+        return block.color, block.column, block.row
+
+    return {
+        'fixated': describe(engine.fixated_blocks, key),
+        'falling': describe(engine.falling_blocks, key),
+        'controlled': describe(engine.controlled_blocks, key),
+        'fading': describe(engine.fading_tiles, get_tile),
+        'score': engine.score,
+        'level': engine.level,
+        'muligans': engine.muligans,
+        'game_over': engine.game_over
+    }
+
+
+def play_side_by_side(seed, max_ticks=3000, **engine_settings):
+    """Play the reference rules and the engine on the same seed and the same random actions, comparing the boards
+    after every tick. Returns the number of ticks played, and the number of barricades which came down."""
+    reference = ReferenceGame(seed)
+    engine = GameEngine(seed=seed)
+    for name, value in engine_settings.items():
+        setattr(engine, name, value)
+    reference.start()
+    engine.start()
+
+    actions = random.Random(seed + 1000)
+    barricades = 0
+    for tick in range(max_ticks):
+        for action in range(actions.randrange(4)):
+            action = actions.choice((MOVE_LEFT, MOVE_RIGHT, ROTATE, ROTATE, SWAP_PIECE, MOVE_LEFT))
+            reference.step(action)
+            engine.step(action)
+
+        last_barricade_level = reference.last_barricade_level
+        reference.tick()
+        engine.tick()
+        barricades += reference.last_barricade_level != last_barricade_level
+
+        expected = describe_reference(reference)
+        actual = describe_engine(engine)
+        assert actual == expected, 'seed %s diverged at tick %s: %s' % (
+            seed, tick, {key: (expected[key], actual[key]) for key in expected if expected[key] != actual[key]})
+        if reference.game_over:
+            break
+    return tick + 1, barricades
+
+
+@pytest.mark.parametrize('match_engine', ('scanner', 'bitboard'))
+@pytest.mark.parametrize('seed', range(40))
+def test_seeded_games_match_the_original_rules(seed, match_engine):
+    # the games are played until they are over, so every one of them gets to see a few barricades (some of which
+    # come down on top of the settled blocks, see also: ColumnStacks)
+    ticks, barricades = play_side_by_side(seed, max_ticks=20000, match_engine=match_engine)
+    assert barricades > 0
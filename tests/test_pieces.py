@@ -0,0 +1,32 @@
+from engine import GameEngine
+from pieces import DEFAULT_TEMPLATES, parse_templates, load_templates
+
+
+def test_valid_templates_are_parsed():
+    lines = ['# a comment', '010', '111', '', '', '11', '11']
+    assert parse_templates(lines) == [((0, 1, 0), (1, 1, 1)), ((1, 1), (1, 1))]
+
+
+def test_templates_larger_than_four_by_four_are_skipped():
+    assert parse_templates(['11111']) == []
+    assert parse_templates(['1', '1', '1', '1', '1']) == []
+    assert parse_templates(['1111', '1111', '1111', '1111']) == [((1, 1, 1, 1),) * 4]
+
+
+def test_invalid_templates_are_skipped():
+    # ragged rows, other characters and empty templates, the valid template after them is still loaded
+    lines = ['110', '11', '', '1x', '', '00', '00', '', '1']
+    assert parse_templates(lines) == [((1,),)]
+
+
+def test_templates_file_is_read(tmp_path):
+    path = tmp_path / 'templates'
+    path.write_text('# an L\n10\n10\n11\n\n111\n11\n')
+    assert load_templates(str(path)) == [((1, 0), (1, 0), (1, 1))]
+
+
+def test_missing_templates_file_leaves_the_default_templates(tmp_path):
+    templates = load_templates(str(tmp_path / 'templates'))
+    assert templates == []
+    # (see also: GameState.__init__())
+    assert GameEngine(templates=DEFAULT_TEMPLATES + templates).templates == DEFAULT_TEMPLATES
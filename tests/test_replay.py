@@ -0,0 +1,72 @@
+import pytest
+from ai_player import SearchPlayer
+from engine import GameEngine, HARD_DROP
+from replay import ReplayRecorder, ReplayPlayer, encode_varint, decode_varint
+
+
+def describe(engine):
+    """The snapshot of an engine, with its block lists in a fixed order (blocks are removed from a list by moving its
+    last block into their place, see also: BlockList, so a game resumed from a keyframe lists them differently)."""
+    snapshot = engine.get_snapshot()
+    for key in ('fixated', 'falling', 'controlled', 'fading'):
+        snapshot[key].sort()
+    return snapshot
+
+
+def record_game(path, seed, ticks, animate_cascades=True, keyframe_interval=100):
+    """Record a game played by the computer player (which hard drops its pieces), returning the snapshots of the
+    engine at every 50th tick (taken after the actions of that tick, like ReplayPlayer.run() leaves the engine)."""
+    engine = GameEngine(seed=seed)
+    engine.animate_cascades = animate_cascades
+    recorder = ReplayRecorder(engine, keyframe_interval)
+    engine.start()
+
+    player = SearchPlayer()
+    snapshots = {}
+    while engine.tick_count < ticks and not engine.game_over:
+        player.act(engine)
+        if engine.tick_count % 50 == 0:
+            snapshots[engine.tick_count] = describe(engine)
+        engine.tick()
+    snapshots[engine.tick_count] = describe(engine)
+    recorder.save(path)
+    return snapshots
+
+
+@pytest.mark.parametrize('value', (0, 1, 127, 128, 300, 1 << 32))
+def test_varints_round_trip(value):
+    data = b'\x00' + encode_varint(value) + b'\x00'
+    assert decode_varint(data, 1) == (value, len(data) - 1)
+
+
+@pytest.mark.parametrize('animate_cascades', (True, False))
+def test_replays_play_back_the_recorded_game(tmp_path, animate_cascades):
+    path = str(tmp_path / 'replay')
+    snapshots = record_game(path, 7, 1000, animate_cascades)
+    last_tick = max(snapshots)
+
+    player = ReplayPlayer(path)
+    assert player.seed == 7
+    assert player.animate_cascades == animate_cascades
+    assert player.total_ticks == last_tick
+    assert HARD_DROP in player.event_actions
+    assert [entry[0] for entry in player.keyframe_index] == list(range(100, last_tick + 1, 100))
+
+    assert describe(player.play()) == snapshots[last_tick]
+    for tick in (0, 150, 700):
+        assert describe(player.play(tick)) == snapshots[tick]
+
+
+def test_seeking_starts_from_the_nearest_keyframe(tmp_path):
+    path = str(tmp_path / 'replay')
+    snapshots = record_game(path, 11, 1000)
+    player = ReplayPlayer(path)
+    for tick, snapshot in snapshots.items():
+        assert describe(player.seek(tick)) == snapshot
+
+
+def test_other_files_are_rejected(tmp_path):
+    path = tmp_path / 'replay'
+    path.write_bytes(b'not a replay' * 10)
+    with pytest.raises(ValueError):
+        ReplayPlayer(str(path))
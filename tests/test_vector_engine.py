@@ -0,0 +1,69 @@
+import random
+import pytest
+from engine import GameEngine, MOVE_LEFT, MOVE_RIGHT, ROTATE, SWAP_PIECE
+
+numpy = pytest.importorskip('numpy')
+from vector_engine import VectorEngine, FIXATED_TILE, FALLING_TILE, CONTROLLED_TILE, FADING_TILE
+
+
+def get_arrays(engine):
+    """The cells and states of a scalar game (see also: VectorEngine), and wether any blocks share a tile."""
+    cells = numpy.zeros((engine.board_width, engine.board_height), numpy.uint8)
+    states = numpy.zeros_like(cells)
+    coordinates = []
+    for state, block_list in ((FIXATED_TILE, engine.fixated_blocks), (FADING_TILE, engine.fading_tiles),
+                              (FALLING_TILE, engine.falling_blocks), (CONTROLLED_TILE, engine.controlled_blocks)):
+        for block in block_list:
+            coordinates.append((block.column, block.row))
+            cells[block.column, block.row] = block.color
+            states[block.column, block.row] = state
+    return cells, states, len(set(coordinates)) != len(coordinates)
+
+
+def is_same_game(engine, vector_engine, board):
+    cells, states, shared_tiles = get_arrays(engine)
+    return (cells == vector_engine.cells[board]).all() and (states == vector_engine.states[board]).all() and \
+        engine.score == vector_engine.score[board] and engine.level == vector_engine.level[board] and \
+        engine.muligans == vector_engine.muligans[board] and engine.game_over == vector_engine.game_over[board] and \
+        engine.next_colorized_template == vector_engine.next_colorized_templates[board]
+
+
+@pytest.mark.parametrize('animate_cascades, boards_compared_to_the_end', ((True, 18), (False, 24)))
+def test_boards_play_out_like_the_scalar_game(animate_cascades, boards_compared_to_the_end):
+    # a tile of the vector engine holds a single block, so a board is only compared with its scalar game until
+    # two blocks share a tile (see the top of vector_engine.py). Without animated cascades that never comes up on
+    # these seeds. With them it does on 6 of the 24 boards (mostly a piece falling onto a tile which is fading out).
+    seeds = list(range(24))
+    engines = [GameEngine(seed=seed) for seed in seeds]
+    vector_engine = VectorEngine(len(seeds), seeds=seeds)
+    vector_engine.animate_cascades = animate_cascades
+    for engine in engines:
+        engine.animate_cascades = animate_cascades
+        engine.start()
+    vector_engine.start()
+
+    actions = random.Random(0)
+    compared = set(range(len(seeds)))  # the boards which didn't have any shared tiles so far
+    for tick in range(5000):
+        for step in range(actions.randrange(3)):
+            board_actions = [actions.choice((MOVE_LEFT, MOVE_RIGHT, ROTATE, SWAP_PIECE))
+                             if actions.random() < 0.5 else None for board in seeds]
+            for engine, action in zip(engines, board_actions):
+                if action is not None and not engine.game_over:
+                    engine.step(action)
+            vector_engine.step(board_actions)
+            compared -= set(board for board in compared if get_arrays(engines[board])[2])
+
+        for engine in engines:
+            if not engine.game_over:
+                engine.tick()
+        vector_engine.tick()
+        compared -= set(board for board in compared if get_arrays(engines[board])[2])
+
+        for board in compared:
+            assert is_same_game(engines[board], vector_engine, board), 'board %s diverged at tick %s' % (board, tick)
+        if vector_engine.game_over.all():
+            break
+
+    assert vector_engine.game_over.all()
+    assert len(compared) == boards_compared_to_the_end
@@ -0,0 +1,467 @@
+import random
+import numpy
+from engine import pick_random_colors, MOVE_LEFT, MOVE_RIGHT, ROTATE, SWAP_PIECE, HARD_DROP
+from palette import EMPTY, WILDCARD, COLORS
+from pieces import DEFAULT_TEMPLATES, get_template_set
+
+# ----------------------------------------------------VECTOR ENGINE-----------------------------------------------------
+# Runs N games in lockstep, for training and evaluating automated players (the rules are those of engine.py).
+#
+# CELLS = Every board as one (N, board width, board height) uint8 array of color indexes (see also: palette.py)
+# STATES = The state of every tile, in an array of the same shape (see the TILE constants below)
+# OBSERVATION = The cells and states arrays themselves (or the views of a single board, e.g. cells[3]),
+#               nothing gets copied
+#
+# Gravity, matching, clearing and scoring are array operations on all of the boards at once. The matcher is the
+# bitboard matcher (see also: bitboard_matcher.py) with the integers swapped for boolean arrays. Pieces are spawned,
+# moved and rotated board by board, every board drawing from its own random stream exactly like a GameEngine with
+# the same seed does. Given the same actions, a board plays out like the scalar game.
+#
+# A tile holds a single color, so two blocks can't share a tile like they sometimes do in the scalar engine
+# (e.g. a piece moved onto a tile which is fading out, or a barricade coming down on top of the settled blocks).
+# Here the blocks of a piece can't be moved, rotated or spawned onto fading tiles, and a block which ends up on an
+# occupied tile replaces what was there. Boards where this comes up play out differently from that point on.
+# ----------------------------------------------------------------------------------------------------------------------
+
+EMPTY_TILE = 0
+FIXATED_TILE = 1
+FALLING_TILE = 2
+CONTROLLED_TILE = 3
+FADING_TILE = 4
+
+BOX_OBSTACLES = (FIXATED_TILE, FALLING_TILE)  # (see also: ObstacleMask)
+BOX_OBSTACLE_TABLE = numpy.isin(numpy.arange(256), BOX_OBSTACLES)  # tile state -> is it in the way of a box?
+PIECE_OBSTACLES = (FIXATED_TILE, FALLING_TILE, FADING_TILE)  # (fading tiles only here, see above)
+
+
+def shift(boards, column_step, row_step):
+    """Move the tiles of a stack of boards by (column_step, row_step), tiles moved off the board are dropped.
+
+    The boards are the last two axes, e.g. (N, width, height) or (colors, N, width, height)."""
+    result = numpy.zeros_like(boards)
+    width, height = boards.shape[-2:]
+    if abs(column_step) >= width or abs(row_step) >= height:
+        return result
+    result[..., max(column_step, 0):width + min(column_step, 0), max(row_step, 0):height + min(row_step, 0)] = \
+        boards[..., max(-column_step, 0):width - max(column_step, 0), max(-row_step, 0):height - max(row_step, 0)]
+    return result
+
+
+class VectorEngine:
+    """N games in lockstep (see the top of this file), driven like a GameEngine: step(actions) and tick().
+
+    Every board gets a seed (random ones by default), a board with the same seed as a GameEngine gets the same
+    pieces and barricades."""
+    def __init__(self, number_of_boards, board_width=16, board_height=20, seeds=None, templates=None):
+        self.number_of_boards = number_of_boards
+        self.board_width = board_width
+        self.board_height = board_height
+        self.seeds = list(seeds) if seeds is not None else \
+            [random.randrange(1 << 32) for board in range(number_of_boards)]
+        self.randoms = [random.Random(seed) for seed in self.seeds]
+        self.templates = list(templates if templates is not None else DEFAULT_TEMPLATES)
+        self.template_set = get_template_set(self.templates)
+
+        self.colors = list(COLORS)
+        self.empty_color = EMPTY
+        self.wildcard_color = WILDCARD
+        self.points_per_block = 5
+        self.animate_cascades = True  # when off, falling blocks and cascades are resolved in a single board update
+        self.match_directions = ((1, 0), (0, 1), (1, -1), (1, 1))
+        self.match_length = 4
+        self.tick_count = 0
+
+        # difficulty (see also: GameEngine), change these before start()
+        self.base_update_speed = 500
+        self.min_update_speed = 200
+        self.update_speed_step = 50
+        self.levels_per_speed_step = 3
+        self.pieces_per_level = 20
+        self.levels_per_barricade = 4
+        self.levels_per_barricade_row = 50
+        self.levels_per_color = 10
+        self.wildcard_chance = 0.05
+
+        shape = (number_of_boards, board_width, board_height)
+        self.cells = numpy.zeros(shape, numpy.uint8)
+        self.states = numpy.zeros(shape, numpy.uint8)
+        self.landed = numpy.zeros(shape, bool)  # the landed cells of every board (see also: GameEngine.landed_cells)
+
+        # the stats of every board
+        self.score = numpy.zeros(number_of_boards, numpy.int64)
+        self.level = numpy.ones(number_of_boards, numpy.int64)
+        self.update_speed = numpy.full(number_of_boards, self.base_update_speed, numpy.int64)
+        self.muligans = numpy.zeros(number_of_boards, numpy.int64)
+        self.last_barricade_level = numpy.zeros(number_of_boards, numpy.int64)
+        self.number_of_spawned_pieces = numpy.zeros(number_of_boards, numpy.int64)
+        self.game_over = numpy.zeros(number_of_boards, bool)
+
+        # the piece of every board (see also: GameEngine.colorized_template)
+        self.has_piece = numpy.zeros(number_of_boards, bool)  # are there blocks under control?
+        self.piece_positions = numpy.tile(numpy.array([6, 0], numpy.int64), (number_of_boards, 1))
+        self.pieces = [None] * number_of_boards
+        self.next_pieces = [None] * number_of_boards
+        self.colorized_templates = [[] for board in range(number_of_boards)]
+        self.next_colorized_templates = [[] for board in range(number_of_boards)]
+
+    def start(self):
+        """Prepare the first piece and drop in the opening barricade on every board."""
+        for board in range(self.number_of_boards):
+            self.generate_next_colorized_template(board)
+            self.spawn_barricade(board, 3)
+
+    def reset(self, board, seed=None):
+        """Start a new game on one of the boards (e.g. when its game is over)."""
+        self.seeds[board] = seed if seed is not None else random.randrange(1 << 32)
+        self.randoms[board] = random.Random(self.seeds[board])
+        self.cells[board] = self.empty_color
+        self.states[board] = EMPTY_TILE
+        self.landed[board] = False
+        self.score[board] = 0
+        self.level[board] = 1
+        self.update_speed[board] = self.base_update_speed
+        self.muligans[board] = 0
+        self.last_barricade_level[board] = 0
+        self.number_of_spawned_pieces[board] = 0
+        self.game_over[board] = False
+        self.has_piece[board] = False
+        self.piece_positions[board] = (6, 0)
+        self.pieces[board] = None
+        self.colorized_templates[board] = []
+        self.generate_next_colorized_template(board)
+        self.spawn_barricade(board, 3)
+
+    def step(self, actions):
+        """Apply one player action (or None) to the piece of every board."""
+        for board, action in enumerate(actions):
+            if action is None or self.game_over[board]:
+                continue
+            if action == MOVE_LEFT:
+                self.move_piece(board, -1)
+            elif action == MOVE_RIGHT:
+                self.move_piece(board, 1)
+            elif action == ROTATE:
+                self.rotate_piece(board)
+            elif action == SWAP_PIECE:
+                self.swap_piece(board)
+            elif action == HARD_DROP:
+                self.hard_drop(board)
+
+    def tick(self):
+        """Advance every game which isn't over by one board update (see also: GameEngine.tick())."""
+        active = ~self.game_over
+        clearing = active & (self.states == FADING_TILE).any(axis=(1, 2))
+        if clearing.any():
+            self.clear_fading_tiles(clearing)
+        updating = active & ~clearing
+        if updating.any():
+            self.update_board(updating)
+        self.spawn_if_idle(active)
+        self.tick_count += 1
+
+    # the board updates, on every board in a (N,) boolean mask of boards at once
+    def clear_fading_tiles(self, boards):
+        """Reset the tiles which have fully faded out, and let the blocks above them fall down."""
+        fading = (self.states == FADING_TILE) & boards[:, None, None]
+        cleared = fading.sum(axis=(1, 2))
+        self.score += (cleared * self.points_per_block) + numpy.where(cleared > 0, self.muligans * 5, 0)
+        self.states[fading] = EMPTY_TILE
+        self.cells[fading] = self.empty_color
+
+        # the fixated blocks at or above the lowest cleared tile of their column start falling
+        rows = numpy.arange(self.board_height)
+        lowest_cleared_rows = numpy.where(fading, rows, -1).max(axis=2)
+        detached = (self.states == FIXATED_TILE) & (rows <= lowest_cleared_rows[:, :, None])
+        self.states[detached] = FALLING_TILE
+
+    def move_blocks_down(self, state, boards):
+        """Move the blocks in a state down one row, fixating the ones which hit something.
+
+        Returns a mask of the boards on which a block was fixated."""
+        moving = (self.states == state) & boards[:, None, None]
+        if not moving.any():
+            return numpy.zeros(self.number_of_boards, bool)
+
+        # a block lands on the floor, on a fixated block, or on a block which landed (bottom up, like the scalar game)
+        fixated = self.states == FIXATED_TILE
+        landing = numpy.zeros_like(moving)
+        landing[:, :, -1] = moving[:, :, -1]
+        for row in range(self.board_height - 2, -1, -1):
+            landing[:, :, row] = moving[:, :, row] & (fixated[:, :, row + 1] | landing[:, :, row + 1])
+        self.states[landing] = FIXATED_TILE
+        self.landed |= landing
+
+        moving &= ~landing
+        colors = self.cells[moving]
+        self.states[moving] = EMPTY_TILE
+        self.cells[moving] = self.empty_color
+        destination = numpy.zeros_like(moving)
+        destination[:, :, 1:] = moving[:, :, :-1]
+        self.states[destination] = state
+        self.cells[destination] = colors
+        return landing.any(axis=(1, 2))
+
+    def update_board(self, boards):
+        self.move_blocks_down(FALLING_TILE, boards)
+
+        # if the controlled piece collided with anything, the rest of its blocks fall down on their own
+        collided = self.move_blocks_down(CONTROLLED_TILE, boards)
+        self.piece_positions[boards, 1] += 1
+        if collided.any():
+            controlled = (self.states == CONTROLLED_TILE) & collided[:, None, None]
+            self.states[controlled] = FALLING_TILE
+            self.has_piece &= ~collided
+
+        if not self.animate_cascades:
+            resolving = boards & ~self.has_piece
+            if resolving.any():
+                self.resolve_cascade(resolving)
+
+        settled = boards & ~(self.states == FALLING_TILE).any(axis=(1, 2))
+        if settled.any():
+            self.collect_color_matches(settled)
+
+    def drop_falling_blocks(self, boards):
+        """Drop every falling block straight onto its column stack (i.e. without animating the fall)."""
+        falling = (self.states == FALLING_TILE) & boards[:, None, None]
+        if not falling.any():
+            return
+
+        # the blocks land on top of the settled blocks of their column, and on top of each other
+        stack_heights = ((self.states == FIXATED_TILE) | (self.states == FADING_TILE)).sum(axis=2)
+        falling_below = numpy.cumsum(falling[:, :, ::-1], axis=2)[:, :, ::-1] - falling
+        board_indexes, columns, rows = numpy.nonzero(falling)
+        landing_rows = self.board_height - 1 - stack_heights[board_indexes, columns] - \
+            falling_below[board_indexes, columns, rows]
+        landing_rows = numpy.maximum(landing_rows, rows)  # (blocks never move up)
+
+        colors = self.cells[board_indexes, columns, rows]
+        self.states[board_indexes, columns, rows] = EMPTY_TILE
+        self.cells[board_indexes, columns, rows] = self.empty_color
+        self.states[board_indexes, columns, landing_rows] = FIXATED_TILE
+        self.cells[board_indexes, columns, landing_rows] = colors
+        self.landed[board_indexes, columns, landing_rows] = True
+
+    def resolve_cascade(self, boards):
+        """Drop, match and clear blocks until nothing is falling or fading anymore, all in a single step."""
+        self.drop_falling_blocks(boards)
+        self.collect_color_matches(boards)
+        boards = boards & (self.states == FADING_TILE).any(axis=(1, 2))
+        while boards.any():
+            self.clear_fading_tiles(boards)
+            self.drop_falling_blocks(boards)
+            self.collect_color_matches(boards)
+            boards = boards & (self.states == FADING_TILE).any(axis=(1, 2))
+
+    # matching, the same shift-and-AND operations as the bitboard matcher (on all of the boards at once)
+    def fill(self, generator, propagator, direction):
+        """Flood the generator tiles along a direction through the propagator tiles (Kogge-Stone style)."""
+        distance = 1
+        while distance < max(self.board_width, self.board_height):
+            step = (direction[0] * distance, direction[1] * distance)
+            generator = generator | (propagator & shift(generator, *step))
+            propagator = propagator & shift(propagator, *step)
+            distance *= 2
+        return generator
+
+    def long_runs(self, boards, direction):
+        """Keep the runs of tiles which are at least match_length long."""
+        starts = boards
+        for step in range(1, self.match_length):
+            starts = starts & shift(boards, -direction[0] * step, -direction[1] * step)
+
+        result = starts
+        for step in range(1, self.match_length):
+            result = result | shift(starts, direction[0] * step, direction[1] * step)
+        return result
+
+    def find_direction_matches(self, occupied, wildcards, color_boards, direction):
+        """Find every matching streak along one direction (see also: BitboardMatcher.find_direction_matches()).
+
+        The color boards are stacked, (colors, N, width, height), so every color is matched at once."""
+        backward = (-direction[0], -direction[1])
+
+        # tiles whose predecessor/successor along the line is empty (or off the board)
+        after_empty = ~shift(occupied, *direction)
+        before_empty = ~shift(occupied, *backward)
+
+        candidates = color_boards | wildcards
+        reached_forward = self.fill(color_boards, candidates, direction)
+        reached_backward = self.fill(color_boards, candidates, backward)
+
+        # wildcards at the edge of a run only belong to the streak if the run is bordered by an empty tile
+        leading_wildcards = self.fill(candidates & after_empty, candidates, direction) & reached_backward
+        trailing_wildcards = self.fill(candidates & before_empty, candidates, backward) & reached_forward
+
+        result = self.long_runs(reached_forward | leading_wildcards, direction) | \
+            self.long_runs(reached_backward | trailing_wildcards, direction)
+        return result.any(axis=0)
+
+    def collect_color_matches(self, boards):
+        """Start fading out the matching tiles on the lines of blocks crossing the landed cells of the boards."""
+        landed = self.landed & boards[:, None, None]
+        self.landed[boards] = False
+        indexes = numpy.nonzero(landed.any(axis=(1, 2)))[0]  # (only the boards where something landed)
+        if not len(indexes):
+            return
+
+        states = self.states[indexes]
+        cells = self.cells[indexes]
+        occupied = states == FIXATED_TILE
+        landed = landed[indexes] & occupied
+        wildcards = occupied & (cells == self.wildcard_color)
+        color_boards = occupied & (cells == numpy.array(self.colors, numpy.uint8)[:, None, None, None])
+
+        matches = numpy.zeros_like(occupied)
+        for direction in self.match_directions:
+            backward = (-direction[0], -direction[1])
+            lines = self.fill(landed, occupied, direction) | self.fill(landed, occupied, backward)
+            matches |= self.find_direction_matches(occupied, wildcards, color_boards, direction) & lines
+        states[matches] = FADING_TILE
+        self.states[indexes] = states
+
+    # spawning, board by board
+    def spawn_if_idle(self, boards):
+        """Spawn a new piece (or a barricade) on the boards where nothing is moving anymore."""
+        moving = ((self.states == FALLING_TILE) | (self.states == CONTROLLED_TILE)).any(axis=(1, 2))
+        for board in numpy.nonzero(boards & ~moving)[0]:
+            if self.level[board] - self.last_barricade_level[board] == self.levels_per_barricade:
+                self.spawn_barricade(board)
+            else:
+                self.spawn_new_piece(board)
+
+    def spawn_barricade(self, board, rows=None):
+        number_of_rows = 2 + (int(self.level[board]) // self.levels_per_barricade_row) if rows is None else rows
+        for row in range(number_of_rows):
+            self.cells[board, :, row] = pick_random_colors(self.colors, self.wildcard_color, self.board_width, False,
+                                                           self.randoms[board])
+            self.states[board, :, row] = FALLING_TILE
+        self.last_barricade_level[board] = self.level[board]
+
+    def spawn_new_piece(self, board):
+        self.colorized_templates[board] = list(self.next_colorized_templates[board])
+        self.pieces[board] = self.next_pieces[board]
+        self.piece_positions[board] = (6, 0)
+        if self.is_box_free(board, self.pieces[board]):
+            self.generate_next_colorized_template(board)
+            self.generate_controlled_blocks(board)
+            self.muligans[board] = 5
+        else:
+            self.game_over[board] = True
+
+    def generate_next_colorized_template(self, board):
+        rng = self.randoms[board]
+        piece = self.next_pieces[board] = self.template_set.first_rotations[rng.randrange(0, len(self.templates))]
+
+        # select a few random colors, allowing duplicates
+        chosen_colors = pick_random_colors(self.colors, self.wildcard_color,
+                                           1 + (int(self.level[board]) // self.levels_per_color), True, rng,
+                                           self.wildcard_chance)
+
+        template = [[self.empty_color] * piece.width for row in range(piece.height)]
+        for column, row in piece.cells:
+            template[row][column] = chosen_colors[rng.randrange(0, len(chosen_colors))]
+        self.next_colorized_templates[board] = template
+
+    def generate_controlled_blocks(self, board):
+        """Put the blocks of the piece of a board on the board (replacing the blocks it had)."""
+        states = self.states[board]
+        cells = self.cells[board]
+        controlled = states == CONTROLLED_TILE
+        states[controlled] = EMPTY_TILE
+        cells[controlled] = self.empty_color
+
+        template = self.colorized_templates[board]
+        left, top = (int(value) for value in self.piece_positions[board])
+        added = False
+        for column, row in self.pieces[board].cells:
+            if 0 <= left + column < self.board_width and 0 <= top + row < self.board_height and \
+                    states[left + column, top + row] != FIXATED_TILE:
+                states[left + column, top + row] = CONTROLLED_TILE
+                cells[left + column, top + row] = template[row][column]
+                added = True
+        self.has_piece[board] = added
+
+        # increase the current level based on the number of spawned pieces
+        self.number_of_spawned_pieces[board] += 1
+        self.level[board] = (self.number_of_spawned_pieces[board] // self.pieces_per_level) + 1
+        self.update_speed[board] = max(self.base_update_speed - ((self.level[board] // self.levels_per_speed_step) *
+                                                                 self.update_speed_step), self.min_update_speed)
+
+    # the player actions
+    def is_box_free(self, board, piece):
+        """Is the bounding box of a piece on the board, without any obstacles in it?"""
+        left, top = (int(value) for value in self.piece_positions[board])
+        if left < 0 or top < 0 or left + piece.width > self.board_width or top + piece.height > self.board_height:
+            return False
+        states = self.states[board]
+        if BOX_OBSTACLE_TABLE.take(states[left:left + piece.width, top:top + piece.height]).any():
+            return False
+        return all(states[left + column, top + row] != FADING_TILE for column, row in piece.cells)
+
+    def move_piece(self, board, direction):
+        left, top = (int(value) for value in self.piece_positions[board])
+        if self.has_piece[board]:
+            states = self.states[board]
+            cells = self.cells[board]
+            piece = self.pieces[board]
+            for column, row in piece.cells:
+                if not 0 <= left + column + direction < self.board_width or \
+                        states[left + column + direction, top + row] in PIECE_OBSTACLES:
+                    return
+
+            template = self.colorized_templates[board]
+            for column, row in piece.cells:
+                states[left + column, top + row] = EMPTY_TILE
+                cells[left + column, top + row] = self.empty_color
+            for column, row in piece.cells:
+                states[left + column + direction, top + row] = CONTROLLED_TILE
+                cells[left + column + direction, top + row] = template[row][column]
+        self.piece_positions[board, 0] += direction
+
+    def rotate_piece(self, board):
+        piece = self.pieces[board]
+        if piece is None:
+            return
+
+        if self.is_box_free(board, piece.next):
+            self.colorized_templates[board] = piece.rotate(self.colorized_templates[board])
+            self.pieces[board] = piece.next
+            self.generate_controlled_blocks(board)
+
+    def swap_piece(self, board):
+        if self.muligans[board] > 0:
+            self.muligans[board] -= 1
+            self.generate_next_colorized_template(board)
+
+    def hard_drop(self, board):
+        """Drop the piece onto the blocks below it (see also: GameEngine.get_landing_cells())."""
+        if not self.has_piece[board]:
+            return
+
+        # blocks which are still falling would end up below the piece, so they land first
+        boards = numpy.zeros(self.number_of_boards, bool)
+        boards[board] = True
+        self.drop_falling_blocks(boards)
+
+        states = self.states[board]
+        cells = self.cells[board]
+        stack_heights = ((states == FIXATED_TILE) | (states == FADING_TILE)).sum(axis=1)
+        columns, rows = numpy.nonzero(states == CONTROLLED_TILE)
+        landed = {}  # column -> number of blocks of the piece which landed in it
+        for index in numpy.argsort(-rows, kind='stable'):
+            column = int(columns[index])
+            row = int(rows[index])
+            landing_row = max(self.board_height - 1 - int(stack_heights[column]) - landed.get(column, 0), row)
+            landed[column] = landed.get(column, 0) + 1
+
+            color = cells[column, row]
+            states[column, row] = EMPTY_TILE
+            cells[column, row] = self.empty_color
+            states[column, landing_row] = FIXATED_TILE
+            cells[column, landing_row] = color
+            self.landed[board, column, landing_row] = True
+
+        self.colorized_templates[board] = []
+        self.pieces[board] = None
+        self.has_piece[board] = False